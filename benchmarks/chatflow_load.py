@@ -0,0 +1,379 @@
+"""
+Load test for the chatflow endpoint.
+
+Replays the multi-turn conversations of a scenario file through
+`POST /api/v1/chatflow` of `src.main:app` in-process, with the LLM, the
+vector store and Google Sheets replaced by the fakes in `benchmarks.fakes`.
+Postgres is real: point `POSTGRES_*` at a local database and run
+`alembic upgrade head` before the first run.
+
+Usage:
+    python -m benchmarks.chatflow_load --sessions 200 --concurrency 20 \\
+        --llm-latency-ms 400 --output results/chatflow.json
+    python -m benchmarks.chatflow_load --compare results/chatflow.json
+
+Runs with the same scenario file, options and seed replay the same
+conversations with the same simulated latencies, so reports taken on
+different commits can be compared with `--compare`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+from sqlalchemy import event
+
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeSheetsService,
+    FakeVectorStore,
+    Latency,
+    count,
+    turn_counters,
+)
+from src.config import settings
+from src.database.db import engine
+from src.main import app
+from src.services import llm, vector_store
+from src.services.llm import get_chat_model
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCENARIOS = Path(__file__).parent / "scenarios" / "default.json"
+COUNTERS = ("llm_calls", "db_statements", "db_round_trips", "vector_searches", "sheets_rows")
+
+
+def load_scenarios(path: Path) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+
+    # The fake model finds the scripted tool calls by the text of the user message
+    script: Dict[str, Dict[str, Any]] = {}
+    for scenario in spec["scenarios"]:
+        for turn in scenario["turns"]:
+            tools = turn.get("tools") or {}
+            if script.get(turn["message"], tools) != tools:
+                raise ValueError(
+                    f"Message '{turn['message']}' is scripted with different tool calls in two scenarios."
+                )
+            script[turn["message"]] = tools
+    spec["script"] = script
+    return spec
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        )
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(latencies, 50) * 1000, 2),
+        "p95": round(percentile(latencies, 95) * 1000, 2),
+        "p99": round(percentile(latencies, 99) * 1000, 2),
+        "max": round(max(latencies, default=0.0) * 1000, 2),
+        "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def per_turn_summary(turns: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    return {
+        f"{name}_per_turn": {
+            "mean": round(sum(t[name] for t in turns) / len(turns), 3) if turns else 0.0,
+            "max": max((t[name] for t in turns), default=0),
+        }
+        for name in COUNTERS
+    }
+
+
+def instrument_database():
+    """
+    Counts the statements and round trips each turn makes to the database.
+    Besides statements, a round trip is spent on every transaction begin,
+    commit and rollback, on the rollback when a connection returns to the
+    pool, and on pre-ping queries. Returns a function that removes the counters.
+    """
+    sync_engine = engine.sync_engine
+    dialect = sync_engine.dialect
+    do_ping = dialect.do_ping
+
+    def statement(*_args):
+        count("db_statements")
+        count("db_round_trips")
+
+    def round_trip(*_args):
+        count("db_round_trips")
+
+    def pool_reset(dbapi_connection, connection_record, reset_state):
+        if not reset_state.transaction_was_reset:
+            count("db_round_trips")
+
+    def ping(dbapi_connection):
+        count("db_round_trips")
+        return do_ping(dbapi_connection)
+
+    listeners = [
+        (sync_engine, "before_cursor_execute", statement),
+        (sync_engine, "begin", round_trip),
+        (sync_engine, "commit", round_trip),
+        (sync_engine, "rollback", round_trip),
+        (sync_engine.pool, "reset", pool_reset),
+    ]
+    for target, name, listener in listeners:
+        event.listen(target, name, listener)
+    dialect.do_ping = ping
+
+    def remove():
+        for target, name, listener in listeners:
+            event.remove(target, name, listener)
+        dialect.do_ping = do_ping
+
+    return remove
+
+
+async def run_session(
+    client: httpx.AsyncClient,
+    session_id: str,
+    scenario: Dict[str, Any],
+    results: List[Dict[str, Any]],
+) -> None:
+    states_seen = 1  # New interactions start with the IDLE state
+    for turn in scenario["turns"]:
+        payload = {
+            "sessionId": session_id,
+            "message": {"role": "user", "message": turn["message"]},
+        }
+        if scenario.get("practiceId"):
+            payload["practiceId"] = scenario["practiceId"]
+        if scenario.get("user_data"):
+            payload["user_data"] = scenario["user_data"]
+
+        counters = dict.fromkeys(COUNTERS, 0)
+        token = turn_counters.set(counters)
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/v1/chatflow", json=payload)
+            status_code = response.status_code
+        except Exception as e:
+            logger.error(f"Session {session_id}: request failed: {e}")
+            response, status_code = None, None
+        finally:
+            elapsed = time.perf_counter() - started
+            turn_counters.reset(token)
+
+        path = "ERROR"
+        if status_code == 200:
+            states = response.json()["states"]
+            path = " > ".join(states[states_seen - 1:])
+            states_seen = len(states)
+
+        results.append({
+            "scenario": scenario["name"],
+            "path": path,
+            "status": status_code,
+            "latency": elapsed,
+            **counters,
+        })
+        if status_code != 200:
+            return
+
+
+async def run(args: argparse.Namespace, spec: Dict[str, Any]) -> Dict[str, Any]:
+    model = FakeChatModel(
+        script=spec["script"],
+        latency=Latency(args.llm_latency_ms, args.llm_jitter_ms, seed=args.seed),
+    )
+    app.dependency_overrides[get_chat_model] = lambda: model
+    if args.fallback_latency_ms is not None:
+        # Hedged and fallback calls go to a second fake model
+        llm._fallback_chat_model = FakeChatModel(
+            script=spec["script"],
+            latency=Latency(args.fallback_latency_ms, args.llm_jitter_ms, seed=args.seed + 3),
+            model_name="fake-benchmark-fallback",
+        )
+    else:
+        settings.GEMINI_API_KEY = None
+    vector_store._vector_store = FakeVectorStore(
+        latency=Latency(args.vector_latency_ms, seed=args.seed + 1),
+        hits=spec.get("vector_store_hits"),
+    )
+    if not settings.GOOGLE_SHEET_ID_EXPORT:
+        settings.GOOGLE_SHEET_ID_EXPORT = "benchmark"
+
+    remove_database_counters = instrument_database()
+
+    # Sessions are assigned to scenarios round-robin, repeated by weight
+    rotation = [s for s in spec["scenarios"] for _ in range(s.get("weight", 1))]
+    run_id = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def replay(client, index, results):
+        async with semaphore:
+            await run_session(
+                client, f"bench-{run_id}-{index}", rotation[index % len(rotation)], results
+            )
+
+    async with app.router.lifespan_context(app):
+        # Measured once warm
+        await app.state.warmup.wait()
+        app.state.sheets_service = FakeSheetsService(
+            latency=Latency(args.sheets_latency_ms, seed=args.seed + 2)
+        )
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            warmup: List[Dict[str, Any]] = []
+            await asyncio.gather(*(
+                replay(client, -(i + 1), warmup) for i in range(args.warmup)
+            ))
+
+            results: List[Dict[str, Any]] = []
+            started = time.perf_counter()
+            await asyncio.gather(*(replay(client, i, results) for i in range(args.sessions)))
+            duration = time.perf_counter() - started
+
+    remove_database_counters()
+    await engine.dispose()
+    return build_report(args, results, duration)
+
+
+def build_report(args: argparse.Namespace, results: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    ok = [r for r in results if r["status"] == 200]
+    by_path = defaultdict(list)
+    for r in ok:
+        by_path[r["path"]].append(r)
+
+    return {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "config": {
+                key: str(value) if isinstance(value, Path) else value
+                for key, value in vars(args).items()
+                if key not in ("output", "compare")
+            },
+        },
+        "summary": {
+            "turns": len(results),
+            "errors": len(results) - len(ok),
+            "duration_s": round(duration, 3),
+            "throughput_turns_per_s": round(len(results) / duration, 2) if duration else 0.0,
+            "latency_ms": latency_summary([r["latency"] for r in ok]),
+            **per_turn_summary(ok),
+        },
+        "paths": {
+            path: {
+                "turns": len(turns),
+                "latency_ms": latency_summary([t["latency"] for t in turns]),
+                **per_turn_summary(turns),
+            }
+            for path, turns in sorted(by_path.items(), key=lambda item: -len(item[1]))
+        },
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    def delta(new: float, old: Optional[float]) -> str:
+        if old is None or not old:
+            return ""
+        return f" ({(new - old) / old:+.1%})"
+
+    summary = report["summary"]
+    base_summary = (baseline or {}).get("summary", {})
+    base_paths = (baseline or {}).get("paths", {})
+    meta = report["meta"]
+    print(f"commit {meta['commit']}{' (dirty)' if meta['dirty'] else ''}")
+    if baseline:
+        print(f"baseline {baseline['meta']['commit']}")
+    print(
+        f"{summary['turns']} turns, {summary['errors']} errors in {summary['duration_s']}s: "
+        f"{summary['throughput_turns_per_s']} turns/s"
+        f"{delta(summary['throughput_turns_per_s'], base_summary.get('throughput_turns_per_s'))}"
+    )
+    rows = [("ALL", summary, base_summary)] + [
+        (path, stats, base_paths.get(path, {})) for path, stats in report["paths"].items()
+    ]
+    print(
+        f"{'turns':>6} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16} {'llm':>5} {'sql':>5} {'db rt':>5}  path"
+    )
+    for path, stats, base in rows:
+        latency, base_latency = stats["latency_ms"], base.get("latency_ms", {})
+        cells = [
+            f"{latency[p]}{delta(latency[p], base_latency.get(p))}" for p in ("p50", "p95", "p99")
+        ]
+        print(
+            f"{stats.get('turns', summary['turns']):>6} {cells[0]:>16} {cells[1]:>16} {cells[2]:>16} "
+            f"{stats['llm_calls_per_turn']['mean']:>5} {stats['db_statements_per_turn']['mean']:>5} "
+            f"{stats['db_round_trips_per_turn']['mean']:>5}  {path}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the chatflow endpoint with fake backends.")
+    parser.add_argument("--scenarios", type=Path, default=DEFAULT_SCENARIOS)
+    parser.add_argument("--sessions", type=int, default=100, help="Conversations to replay.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Conversations in flight.")
+    parser.add_argument("--warmup", type=int, default=5, help="Conversations replayed before measuring.")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument(
+        "--fallback-latency-ms", type=float, help="Enable a fake secondary model with this latency."
+    )
+    parser.add_argument("--vector-latency-ms", type=float, default=50)
+    parser.add_argument("--sheets-latency-ms", type=float, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the JSON report to this file.")
+    parser.add_argument("--compare", type=Path, help="A previous JSON report to compare against.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    spec = load_scenarios(args.scenarios)
+    report = asyncio.run(run(args, spec))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Chunks produced by the markdown chunker against the previous splitter.
+
+The previous splitter cut every source in chunks of 512 tokens overlapping
+by 128 tokens, regardless of the structure of the text, and kept the
+navigation and footer repeated on every page of a site. Three sources are
+split with both:
+
+- the pages of the fixture site of `benchmarks.site_crawl`, converted to
+  markdown by the crawler; with the chunker, the boilerplate is removed from
+  the pages and kept once, as in `store_data_from_site`
+- a generated markdown document with nested headings, as converted from DOCX
+- a plain text document without headings
+
+For each source the number of chunks, the tokens embedded, the mean tokens
+per chunk and the chunks starting with a heading are shown.
+
+Usage:
+    python -m benchmarks.chunking --pages 40
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.site_crawl import WORDS, build_site
+from src.services.chunking import count_tokens, get_chunker
+from src.services.crawler import CrawledPage, _extract
+from src.services.embeddings import _deduplicate_pages
+from src.shared.enums import SourceType
+
+
+def site_pages(pages: int) -> Dict[str, str]:
+    site = build_site(pages)
+    return {
+        path: _extract(body, f"http://clinic.test{path}")[1]
+        for path, (content_type, body) in site.items()
+        if content_type == "text/html" and not path.startswith("/private/")
+    }
+
+
+def markdown_document(sections: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = ["# Patient handbook"]
+    for i in range(sections):
+        lines.append(f"## Chapter {i + 1}")
+        for j in range(rng.randint(1, 4)):
+            lines.append(f"### Topic {i + 1}.{j + 1}")
+            for _ in range(rng.randint(1, 6)):
+                lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 140))) + ".")
+    return "\n\n".join(lines)
+
+
+def text_document(paragraphs: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 200))) + "."
+        for _ in range(paragraphs)
+    )
+
+
+def report(name: str, chunks: List[str], seconds: float) -> None:
+    tokens = [count_tokens(chunk) for chunk in chunks]
+    with_heading = sum(chunk.lstrip().startswith("#") for chunk in chunks)
+    print(
+        f"{name:<28} {len(chunks):>6} chunks {sum(tokens):>8} tokens "
+        f"{sum(tokens) / max(len(chunks), 1):>7.1f} per chunk, max {max(tokens, default=0):>4} "
+        f"{with_heading:>5} start with a heading  {seconds * 1000:>7.1f}ms"
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the chunks of the markdown chunker and the previous splitter.")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--sections", type=int, default=60, help="Chapters of the markdown document")
+    parser.add_argument("--paragraphs", type=int, default=300, help="Paragraphs of the text document")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    previous = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=512, chunk_overlap=128)
+
+    pages = site_pages(args.pages)
+    crawled = [CrawledPage(f"http://clinic.test{path}", path, markdown) for path, markdown in pages.items()]
+    kept, _ = _deduplicate_pages(crawled)
+    # The near-duplicates are skipped for both, only the chunking differs
+    kept_urls = {page.url for page in kept}
+    sources = {
+        "site": (
+            [markdown for page, markdown in zip(crawled, pages.values()) if page.url in kept_urls],
+            [page.markdown for page in kept],
+            SourceType.WEB_PAGE,
+        ),
+        "markdown document": ([markdown_document(args.sections)], None, SourceType.DOCUMENT),
+        "text document": ([text_document(args.paragraphs)], None, SourceType.DOCUMENT),
+    }
+
+    for name, (texts, chunker_texts, source_type) in sources.items():
+        started = time.perf_counter()
+        chunks = [chunk for text in texts for chunk in previous.split_text(text)]
+        report(f"{name}, previous", chunks, time.perf_counter() - started)
+
+        chunker = get_chunker(source_type)
+        started = time.perf_counter()
+        chunks = [chunk for text in chunker_texts or texts for chunk in chunker.split_text(text)]
+        report(f"{name}, chunker", chunks, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
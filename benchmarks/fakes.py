@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.services.google_sheets import GoogleSheetsService
+
+# Counters of the turn being replayed. The runner sets a fresh dict before each request.
+turn_counters: ContextVar[Optional[Dict[str, int]]] = ContextVar("turn_counters", default=None)
+
+
+def count(name: str, value: float = 1) -> None:
+    counters = turn_counters.get()
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + value
+
+
+# Tool arguments used when a scenario does not script a tool
+DEFAULT_TOOL_ARGS: Dict[str, Dict[str, Any]] = {
+    "classify_intent": {"intent": "is_general_faq_question"},
+    "is_valid_state": {"is_valid": True},
+    "is_condition_treated": {"is_treated": True},
+    "user_accepts_book_call": {"user_accepts": True},
+    "save_to_mailing_list": {},
+    "send_book_call_link": {},
+    "get_user_data": {},
+    "send_doctor_information": {"best_doctor_for_client": "Dr. Benchmark"},
+}
+
+
+class Latency:
+    """
+    Simulated latency in milliseconds with uniform jitter, drawn from a seeded generator.
+    """
+
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+
+    def seconds(self) -> float:
+        if not self.mean_ms and not self.jitter_ms:
+            return 0.0
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        seconds = max(0.0, self.mean_ms + jitter) / 1000
+        count("simulated_seconds", seconds)
+        return seconds
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with scripted tool calls after a simulated latency.
+
+    Tool arguments are looked up by the text of the latest user message in
+    `script` (message -> tool name -> arguments), falling back to
+    `DEFAULT_TOOL_ARGS`. Subclasses can override `tool_args` to answer
+    differently. Calls without a bound tool return a canned text reply.
+    """
+
+    script: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    latency: Any = None
+    bound_tool: Optional[str] = None
+    model_name: str = "fake-benchmark"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.model_copy(update={"bound_tool": tools[0].name})
+
+    def tool_args(self, tool_name: str, user_message: str) -> Dict[str, Any]:
+        return self.script.get(user_message, {}).get(
+            tool_name, DEFAULT_TOOL_ARGS.get(tool_name, {})
+        )
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        count("llm_calls")
+        user_message = next(
+            (str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), ""
+        )
+        if self.bound_tool:
+            args = self.tool_args(self.bound_tool, user_message)
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": self.bound_tool, "args": args, "id": "call_benchmark"}],
+            )
+        else:
+            message = AIMessage(content="This is a benchmark reply from the fake model.")
+
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": 16,
+            "total_tokens": input_tokens + 16,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency.seconds())
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency.seconds())
+        return self._respond(messages)
+
+
+class FakeEmbeddings:
+    """
+    Deterministic embeddings derived from a hash of the text.
+
+    `latency` is simulated for each call, and `chunk_latency` for each text
+    embedded by the call.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None, chunk_latency: Optional[Latency] = None):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+
+    def _seconds(self, texts: int) -> float:
+        seconds = self.latency.seconds() if self.latency else 0.0
+        if self.chunk_latency:
+            seconds += sum(self.chunk_latency.seconds() for _ in range(texts))
+        return seconds
+
+    def embed_query(self, text: str) -> List[float]:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return [byte / 255 for byte in digest]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._seconds(len(texts)))
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._seconds(len(texts)))
+        return [self.embed_query(text) for text in texts]
+
+
+def _matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates the Chroma `where` filters used by the services: `$and`, `$or`, `$eq`, `$ne` and `$in`."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if (
+                    (operator == "$eq" and value != operand)
+                    or (operator == "$ne" and value == operand)
+                    or (operator == "$in" and value not in operand)
+                ):
+                    return False
+    return True
+
+
+class FakeCollection:
+    """Stand-in for the Chroma collection written by `src.services.ingest`."""
+
+    def __init__(self, vector_store: "FakeVectorStore"):
+        self.vector_store = vector_store
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None) -> None:
+        self.vector_store._wait()
+        for doc_id, content, metadata in zip(ids, documents, metadatas):
+            self.vector_store.documents[doc_id] = Document(id=doc_id, page_content=content, metadata=metadata)
+
+
+class FakeVectorStore:
+    """
+    In-memory stand-in for the Chroma vector store.
+
+    `hits` maps a query to the content returned for it. Any other query
+    returns no results, so the chatflow falls back to generic answers.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Latency] = None,
+        hits: Optional[Dict[str, str]] = None,
+        embeddings: Optional[FakeEmbeddings] = None,
+    ):
+        self.latency = latency
+        self.hits = hits or {}
+        self.embeddings = embeddings or FakeEmbeddings()
+        self._collection = FakeCollection(self)
+        self._queries = {tuple(self.embeddings.embed_query(query)): query for query in self.hits}
+        self.documents: Dict[str, Document] = {}
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency.seconds())
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        self._wait()
+        count("vector_searches")
+        query = self._queries.get(tuple(embedding))
+        if query is None:
+            return []
+        return [(Document(page_content=self.hits[query], metadata=filter or {}), 0.9)]
+
+    def get(self, where=None, include=None, **kwargs) -> Dict[str, Any]:
+        self._wait()
+        found = [(doc_id, doc) for doc_id, doc in self.documents.items() if _matches(doc.metadata, where)]
+        return {
+            "ids": [doc_id for doc_id, _ in found],
+            "documents": [doc.page_content for _, doc in found],
+            "metadatas": [doc.metadata for _, doc in found],
+        }
+
+    def delete(self, ids=None, **kwargs) -> None:
+        self._wait()
+        for doc_id in ids or []:
+            self.documents.pop(doc_id, None)
+
+    def add_documents(self, documents, ids=None, **kwargs) -> List[str]:
+        self._wait()
+        ids = ids or [str(i) for i in range(len(self.documents), len(self.documents) + len(documents))]
+        self.documents.update(zip(ids, documents))
+        return ids
+
+
+class FakeWorksheet:
+    def __init__(self, title: str):
+        self.title = title
+        self.rows: List[List[str]] = []
+
+
+class FakeSheetsService(GoogleSheetsService):
+    """
+    Google Sheets service that keeps appended rows in memory instead of calling the API.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency
+        self.client = None
+        self.worksheets: Dict[str, FakeWorksheet] = {}
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency.seconds())
+
+    def get_worksheet(self, spreadsheet_id: str, worksheet_name: str) -> FakeWorksheet:
+        self._wait()
+        return self.worksheets.setdefault(worksheet_name, FakeWorksheet(worksheet_name))
+
+    def read_data(self, worksheet: FakeWorksheet) -> List[dict]:
+        return [{"row": row} for row in worksheet.rows]
+
+    def write_data(self, worksheet: FakeWorksheet, data: List[List[str]]):
+        self._wait()
+        worksheet.rows = list(data)
+
+    def append_row(self, worksheet: FakeWorksheet, row: List[str]):
+        self._wait()
+        count("sheets_rows")
+        worksheet.rows.append(row)
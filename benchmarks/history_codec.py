@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the per-turn cost of the message history.
+
+Times what one chatflow turn does with the history of a session, once
+with `InteractionMessage` models and once with the compact `ChatMessage`
+codec: decode the stored messages (or take them from the session cache),
+convert them to LangChain messages for each model call of the turn, then
+encode and JSON-serialize them for the database.
+
+Usage:
+    python -m benchmarks.history_codec --messages 200 --llm-calls 4
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+import orjson
+
+from src.shared.enums import InteractionType
+from src.shared.schemas import InteractionMessage
+from src.shared.utils.history import ChatMessage, decode_messages, encode_messages, get_langchain_history
+
+
+def build_stored_history(size: int) -> List[Dict[str, Any]]:
+    """A stored conversation alternating user and model messages, as read from the `messages` column."""
+    started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for i in range(size):
+        role = InteractionType.USER if i % 2 == 0 else InteractionType.MODEL
+        msg = InteractionMessage(
+            role=role,
+            message=f"Message {i} of the conversation about scheduling a consultation. " * 3,
+            tool_calls=["classify_intent"] if role == InteractionType.MODEL and i % 6 == 1 else None,
+            timestamp=started + timedelta(seconds=30 * i),
+        )
+        messages.append(msg.model_dump(mode="json", exclude_none=True))
+    # The column goes through the database's JSON encoding before it is read back
+    return json.loads(json.dumps(messages))
+
+
+def model_turn(stored: List[Dict[str, Any]], llm_calls: int) -> str:
+    history = [InteractionMessage.model_validate(msg) for msg in stored]
+    history.append(InteractionMessage(role=InteractionType.USER, message="And on Saturdays?"))
+    for _ in range(llm_calls):
+        get_langchain_history(history)
+    history.append(InteractionMessage(role=InteractionType.MODEL, message="We are closed on Saturdays."))
+    return json.dumps([msg.model_dump(mode="json", exclude_none=True) for msg in history])
+
+
+def compact_turn(stored: List[Dict[str, Any]], llm_calls: int) -> bytes:
+    return cached_turn(decode_messages(stored), llm_calls)
+
+
+def cached_turn(cached: List[ChatMessage], llm_calls: int) -> bytes:
+    history = list(cached)
+    history.append(ChatMessage.from_interaction_message(
+        InteractionMessage(role=InteractionType.USER, message="And on Saturdays?")
+    ))
+    for _ in range(llm_calls):
+        get_langchain_history(history)
+    history.append(ChatMessage.from_interaction_message(
+        InteractionMessage(role=InteractionType.MODEL, message="We are closed on Saturdays.")
+    ))
+    return orjson.dumps(encode_messages(history))
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    """Best time of one call in milliseconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time the per-turn cost of the message history.")
+    parser.add_argument("--messages", type=int, default=200, help="Messages in the stored session.")
+    parser.add_argument("--llm-calls", type=int, default=4, help="Model calls in the turn.")
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    stored = build_stored_history(args.messages)
+
+    before = measure(lambda: model_turn(stored, args.llm_calls), args.repeat)
+    after = measure(lambda: compact_turn(stored, args.llm_calls), args.repeat)
+    # A session served by the in-memory session cache keeps its converted messages
+    cached = decode_messages(stored)
+    get_langchain_history(cached)
+    after_cached = measure(lambda: cached_turn(cached, args.llm_calls), args.repeat)
+
+    print(f"{args.messages} messages, {args.llm_calls} model calls per turn")
+    print(f"  InteractionMessage: {before:8.3f} ms/turn")
+    print(f"  ChatMessage:        {after:8.3f} ms/turn  ({before / after:.1f}x)")
+    print(f"  ChatMessage cached: {after_cached:8.3f} ms/turn  ({before / after_cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
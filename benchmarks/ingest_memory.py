@@ -0,0 +1,128 @@
+"""
+Peak memory of document ingestion as a function of document size.
+
+Ingests generated TXT documents of increasing size, once by processing the
+whole document in memory as the JSON endpoint did (decode, clean, split,
+add all chunks at once) and once with `store_document_file`, which reads
+and splits the document in bounded sections and embeds and stores it in
+batches, with at most a few batches in flight. The vector
+store discards the chunks, so only the ingestion itself is measured.
+
+Peak memory is the peak of Python allocations reported by `tracemalloc`.
+
+Usage:
+    python -m benchmarks.ingest_memory --sizes-mb 1 5 20 50
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, List
+
+import regex
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.fakes import FakeEmbeddings
+from src.config import settings
+from src.services import vector_store
+from src.services.embeddings import store_document_file
+from src.shared.constants import INVALID_UNICODE_CLEANUP_REGEX
+from src.shared.enums import DocType
+
+WORDS = (
+    "naturopathic medicine supports hormone balance digestion sleep energy mood immune resilience "
+    "patients doctors telehealth appointment thyroid inflammation nutrition lifestyle root cause"
+).split()
+
+
+class DiscardingVectorStore:
+    """Vector store that only counts the chunks added to it."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.embeddings = FakeEmbeddings()
+        self._collection = self
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None) -> None:
+        self.chunks += len(ids)
+
+    def get(self, where=None, include=None, **kwargs):
+        return {"ids": []}
+
+    def delete(self, ids=None, **kwargs):
+        pass
+
+    def add_documents(self, documents, ids=None, **kwargs) -> List[str]:
+        self.chunks += len(documents)
+        return ids or []
+
+
+def write_document(path: str, size_mb: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as document:
+        while written < target:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + ".\n\n"
+            document.write(paragraph)
+            written += len(paragraph)
+
+
+def in_memory_ingest(path: str) -> int:
+    """The document processing of the JSON endpoint before documents were streamed."""
+    with open(path, "rb") as document:
+        data = base64.b64encode(document.read()).decode()
+    content = base64.b64decode(data).decode("utf-8")
+    cleaned_content = regex.sub(INVALID_UNICODE_CLEANUP_REGEX, '', content)
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=512, chunk_overlap=128)
+    docs = text_splitter.create_documents([cleaned_content])
+    vector_store.get_vector_store().add_documents(documents=docs, ids=[f"doc_{i}" for i in range(len(docs))])
+    return len(docs)
+
+
+def streaming_ingest(path: str) -> int:
+    return asyncio.run(store_document_file(path, "benchmark.txt", DocType.TXT, "benchmark"))
+
+
+def measure(func: Callable[[str], Any], path: str) -> tuple[float, float, Any]:
+    """Peak memory in MB, seconds and result of one call."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(path)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024, seconds, result
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure peak memory of document ingestion.")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 5, 20])
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    vector_store._vector_store = DiscardingVectorStore()
+    # The fake embeddings have no rate limit
+    settings.INGEST_EMBED_TOKENS_PER_MINUTE = 0
+
+    print(f"{'size MB':>8} {'in-memory peak MB':>18} {'streaming peak MB':>18} {'chunks':>14} {'seconds':>14}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size_mb in args.sizes_mb:
+            path = os.path.join(workdir, f"document_{size_mb}.txt")
+            write_document(path, size_mb)
+            before_peak, before_seconds, before_chunks = measure(in_memory_ingest, path)
+            after_peak, after_seconds, after_chunks = measure(streaming_ingest, path)
+            print(
+                f"{size_mb:>8} {before_peak:>18.1f} {after_peak:>18.1f} "
+                f"{before_chunks:>6} / {after_chunks:<6} {before_seconds:>6.1f} / {after_seconds:<6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
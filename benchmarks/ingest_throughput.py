@@ -0,0 +1,111 @@
+"""
+End-to-end ingest time of a large document.
+
+Ingests a generated TXT document once as before the ingestion pipeline,
+embedding every chunk and then adding them in one `add_documents` call, and
+once with `store_document_file`, which embeds batches concurrently and
+stores them as the next batches are embedded. Embedding calls and vector
+store writes are replaced by the fakes in `benchmarks.fakes` with simulated
+latencies, so the runs only measure how the calls are scheduled.
+
+Usage:
+    python -m benchmarks.ingest_throughput --size-mb 5 --embed-latency-ms 200 \\
+        --embed-chunk-latency-ms 2 --store-latency-ms 100 --tokens-per-minute 0
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.fakes import FakeEmbeddings, FakeVectorStore, Latency
+from benchmarks.ingest_memory import write_document
+from src.config import settings
+from src.services import vector_store
+from src.services.embeddings import store_document_file
+from src.shared.enums import DocType
+
+# Texts per embedding request of `OpenAIEmbeddings.embed_documents`
+SERIAL_EMBED_BATCH = 1000
+
+
+class SerialVectorStore(FakeVectorStore):
+    """Adds documents the way `Chroma.add_documents` does: embed all texts in sequence, then write."""
+
+    def add_documents(self, documents: List[Document], ids=None, **kwargs) -> List[str]:
+        texts = [doc.page_content for doc in documents]
+        for start in range(0, len(texts), SERIAL_EMBED_BATCH):
+            self.embeddings.embed_documents(texts[start:start + SERIAL_EMBED_BATCH])
+        self._wait()
+        return ids or []
+
+
+def serial_ingest(path: str) -> int:
+    with open(path, encoding="utf-8") as document:
+        content = document.read()
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=512, chunk_overlap=128)
+    docs = text_splitter.create_documents([content])
+    vector_store.get_vector_store().add_documents(documents=docs, ids=[f"doc_{i}" for i in range(len(docs))])
+    return len(docs)
+
+
+def pipelined_ingest(path: str) -> int:
+    return asyncio.run(store_document_file(path, "benchmark.txt", DocType.TXT, "benchmark"))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the end-to-end time of document ingestion.")
+    parser.add_argument("--size-mb", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=200, help="Latency of an embedding request")
+    parser.add_argument("--embed-chunk-latency-ms", type=float, default=2, help="Added latency per embedded chunk")
+    parser.add_argument("--store-latency-ms", type=float, default=100, help="Latency of a vector store write")
+    parser.add_argument(
+        "--tokens-per-minute", type=int, default=0,
+        help="Token budget of the embedding model, 0 for none as the fake embeddings have no rate limit",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    settings.INGEST_EMBED_TOKENS_PER_MINUTE = args.tokens_per_minute
+
+    def fake_store(store_class) -> FakeVectorStore:
+        return store_class(
+            latency=Latency(args.store_latency_ms),
+            embeddings=FakeEmbeddings(Latency(args.embed_latency_ms), Latency(args.embed_chunk_latency_ms)),
+        )
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "document.txt")
+        write_document(path, args.size_mb)
+
+        vector_store._vector_store = fake_store(SerialVectorStore)
+        started = time.perf_counter()
+        serial_chunks = serial_ingest(path)
+        serial_seconds = time.perf_counter() - started
+
+        vector_store._vector_store = fake_store(FakeVectorStore)
+        started = time.perf_counter()
+        pipelined_chunks = pipelined_ingest(path)
+        pipelined_seconds = time.perf_counter() - started
+
+    print(
+        f"batch size {settings.INGEST_BATCH_SIZE}, embedding concurrency {settings.INGEST_EMBED_CONCURRENCY}, "
+        f"{settings.INGEST_EMBED_TOKENS_PER_MINUTE} tokens per minute"
+    )
+    print(f"{'':>10} {'chunks':>8} {'seconds':>9} {'chunks/s':>9}")
+    for name, chunks, seconds in (
+        ("serial", serial_chunks, serial_seconds),
+        ("pipelined", pipelined_chunks, pipelined_seconds),
+    ):
+        print(f"{name:>10} {chunks:>8} {seconds:>9.1f} {chunks / seconds:>9.1f}")
+    print(f"speedup {serial_seconds / pipelined_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Query latency of a shared collection filtered by practice against one
+collection per practice, as the total corpus grows.
+
+For each corpus size, a local in-memory Chroma is filled with random
+embeddings spread over `--practices` practices, one of them holding
+`--large-share` of the chunks. The chunks are then copied to one
+collection per practice by `src.jobs.reshard_vector_store`. For a small
+and the large practice, the benchmark shows the median and p95
+milliseconds of a search:
+
+- shared: the shared collection, filtered on `practice_id`, as before
+- per practice: the collection of the practice, without filter
+
+Usage:
+    python -m benchmarks.practice_collections --sizes 5000,20000,80000
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import List
+
+import chromadb
+
+from benchmarks.fakes import FakeEmbeddings
+from src.config import settings
+from src.jobs.reshard_vector_store import reshard_vector_store
+from src.services import vector_store
+from src.services.vector_store import get_vector_store
+
+# Chunks written to the local Chroma at a time
+WRITE_BATCH = 5000
+
+
+def vector(rng: random.Random, dimensions: int) -> List[float]:
+    return [rng.gauss(0, 1) for _ in range(dimensions)]
+
+
+def fill(size: int, practices: int, large_share: float, dimensions: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    shared = get_vector_store()._collection
+    large = int(size * large_share)
+    for start in range(0, size, WRITE_BATCH):
+        indexes = range(start, min(start + WRITE_BATCH, size))
+        shared.add(
+            ids=[f"chunk_{i}" for i in indexes],
+            embeddings=[vector(rng, dimensions) for _ in indexes],
+            documents=[f"chunk {i}" for i in indexes],
+            metadatas=[
+                {"practice_id": "large" if i < large else f"practice_{i % (practices - 1)}", "source_type": "DOCUMENT"}
+                for i in indexes
+            ],
+        )
+
+
+def search_ms(practice_id: str, queries: int, dimensions: int, seed: int = 1) -> List[float]:
+    rng = random.Random(seed)
+    store = get_vector_store(practice_id)
+    search_filter = None if vector_store.uses_practice_collections() else {"practice_id": practice_id}
+    latencies = []
+    for _ in range(queries):
+        embedding = vector(rng, dimensions)
+        started = time.perf_counter()
+        store.similarity_search_by_vector_with_relevance_scores(embedding=embedding, k=12, filter=search_filter)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(label: str, latencies: List[float]) -> str:
+    p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+    return f"{label} {statistics.median(latencies):>6.2f}ms p95 {p95:>6.2f}ms"
+
+
+def reset(client) -> None:
+    for collection in client.list_collections():
+        client.delete_collection(collection.name)
+    vector_store._vector_store = None
+    vector_store._practice_stores = None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare searches of a shared collection and of per-practice collections.")
+    parser.add_argument("--sizes", default="5000,20000,80000", help="Total chunks, comma separated")
+    parser.add_argument("--practices", type=int, default=50)
+    parser.add_argument("--large-share", type=float, default=0.5, help="Share of the chunks of the large practice")
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    client = chromadb.EphemeralClient(chromadb.Settings(anonymized_telemetry=False))
+    vector_store._client = client
+    vector_store._embeddings = FakeEmbeddings()
+    settings.CHROMA_CLOUD_COLLECTION = "benchmark"
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        reset(client)
+        settings.CHROMA_COLLECTION_PER_PRACTICE = False
+        fill(size, args.practices, args.large_share, args.dimensions)
+        small = "practice_0"
+        shared = {practice: search_ms(practice, args.queries, args.dimensions) for practice in (small, "large")}
+
+        started = time.perf_counter()
+        copied = reshard_vector_store(WRITE_BATCH)
+        reshard_seconds = time.perf_counter() - started
+        settings.CHROMA_COLLECTION_PER_PRACTICE = True
+        per_practice = {practice: search_ms(practice, args.queries, args.dimensions) for practice in (small, "large")}
+
+        print(f"{size} chunks, resharded to {len(copied)} collections in {reshard_seconds:.1f}s")
+        for practice in (small, "large"):
+            print(
+                f"  {practice:<11} {copied[practice]:>6} chunks  "
+                f"{report('shared', shared[practice])}  {report('per practice', per_practice[practice])}"
+            )
+
+
+if __name__ == "__main__":
+    main()
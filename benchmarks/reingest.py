@@ -0,0 +1,143 @@
+"""
+Deletes and re-ingestion of sources against the fake vector store.
+
+The fake vector store of `benchmarks.fakes` takes `--store-latency-ms` for
+each call. The benchmark shows:
+
+- deleting `--sources` documents one request at a time, then all of them
+  with a single `delete_sources` call: the vector store calls and seconds
+- re-ingesting a document of `--chunks` sections while a reader counts its
+  chunks every few milliseconds, with and without `INGEST_VERSIONED_WRITES`:
+  the seconds of the request, the seconds the document had no chunk, and
+  the chunks left once the previous version is deleted
+
+Usage:
+    python -m benchmarks.reingest --sources 50 --chunks 400
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import Dict
+
+from benchmarks.fakes import FakeEmbeddings, FakeVectorStore, Latency
+from src.config import settings
+from src.services import vector_store
+from src.services.embeddings import delete_data_from_document, delete_sources, store_document_file
+from src.services.source_versions import get_version_collector
+from src.shared.enums import DocType, SourceType
+
+
+class CountingVectorStore(FakeVectorStore):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls: Dict[str, int] = {"get": 0, "delete": 0}
+
+    def get(self, *args, **kwargs):
+        self.calls["get"] += 1
+        return super().get(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.calls["delete"] += 1
+        return super().delete(*args, **kwargs)
+
+
+def document_text(sections: int) -> str:
+    # Sections of about one chunk each
+    return "\n\n".join(f"## Section {i}\n\n" + "naturopathic care " * 150 for i in range(sections))
+
+
+def add_documents(store: FakeVectorStore, sources: int, chunks: int) -> None:
+    store.documents.clear()
+    for source in range(sources):
+        store._collection.upsert(
+            ids=[f"doc_{source}_txt_{i}" for i in range(chunks)],
+            documents=["text"] * chunks,
+            metadatas=[
+                {"practice_id": "benchmark", "source_type": SourceType.DOCUMENT.value, "doc_id": f"doc_{source}_txt"}
+            ] * chunks,
+        )
+
+
+def benchmark_deletes(store: CountingVectorStore, sources: int) -> None:
+    names = [f"doc {source}.txt" for source in range(sources)]
+    for label, delete in (
+        ("one request per document", lambda: sum(delete_data_from_document(name, "benchmark") for name in names)),
+        ("delete_sources", lambda: delete_sources("benchmark", document_names=names)),
+    ):
+        add_documents(store, sources, 10)
+        store.calls = {"get": 0, "delete": 0}
+        started = time.perf_counter()
+        deleted = delete()
+        seconds = time.perf_counter() - started
+        print(
+            f"{label:<26} {deleted:>6} chunks deleted, {store.calls['get']:>4} gets, "
+            f"{store.calls['delete']:>4} deletes in {seconds:.2f}s"
+        )
+
+
+async def reingest(store: FakeVectorStore, path: str, chunks: int) -> None:
+    def visible() -> int:
+        return sum(1 for doc in list(store.documents.values()) if doc.metadata.get("doc_id") == "handbook_md")
+
+    empty_seconds = 0.0
+    done = asyncio.Event()
+
+    async def read() -> None:
+        nonlocal empty_seconds
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            if not visible():
+                empty_seconds += now - last
+            last = now
+
+    reader = asyncio.create_task(read())
+    started = time.perf_counter()
+    stored = await store_document_file(path, "handbook.md", DocType.TXT, "benchmark")
+    seconds = time.perf_counter() - started
+    done.set()
+    await reader
+    during = visible()
+    await get_version_collector().drain()
+    mode = "versioned" if settings.INGEST_VERSIONED_WRITES else "delete first"
+    print(
+        f"{mode:<13} {stored:>5} chunks stored in {seconds:.2f}s, {empty_seconds:.2f}s without chunks, "
+        f"{during:>5} chunks after the request, {visible():>5} once the previous version is deleted"
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Delete and re-ingest sources in the fake vector store.")
+    parser.add_argument("--sources", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--store-latency-ms", type=float, default=20)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    # The fake embeddings have no rate limit
+    settings.INGEST_EMBED_TOKENS_PER_MINUTE = 0
+    store = CountingVectorStore(
+        latency=Latency(args.store_latency_ms),
+        embeddings=FakeEmbeddings(latency=Latency(args.embed_latency_ms)),
+    )
+    vector_store._vector_store = store
+
+    benchmark_deletes(store, args.sources)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".md") as document:
+        document.write(document_text(args.chunks))
+        document.flush()
+        for versioned in (False, True):
+            settings.INGEST_VERSIONED_WRITES = versioned
+            store.documents.clear()
+            asyncio.run(store_document_file(document.name, "handbook.md", DocType.TXT, "benchmark"))
+            asyncio.run(reingest(store, document.name, args.chunks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+Replays recorded chatflow sessions against the current `handle_chatflow`.
+
+Sessions are streamed out of the `interactions` table with a server-side
+cursor. Each recorded user message is fed to `handle_chatflow` as a turn.
+The model is an oracle stub: it answers every tool call with the value that
+moved the recorded session out of the state being executed, derived from the
+decisions of the chatflow graph. Vector store and Google Sheets are the fakes
+from `benchmarks.fakes`.
+
+For every session the replay reports whether the state sequence still
+matches the recording, where it first diverges, and the change in LLM calls
+and simulated latency. Recorded figures are estimated from the recorded
+states with the per-state model calls of the current graph, so they miss
+states that re-ran without changing. For exact before/after numbers, replay
+the same sessions on both commits and pass the older report to `--compare`.
+
+Usage:
+    python -m benchmarks.replay --limit 500 --output results/replay.json
+    python -m benchmarks.replay --practice-id <id> --compare results/replay.json
+"""
+import argparse
+import asyncio
+import difflib
+import functools
+import json
+import logging
+from contextvars import ContextVar
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.documents import Document
+from sqlalchemy import select
+
+from benchmarks.chatflow_load import git_revision, percentile
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeSheetsService,
+    FakeVectorStore,
+    Latency,
+    turn_counters,
+)
+from src.api.chatflow import graph as graph_module
+from src.api.chatflow import tools as chatflow_tools
+from src.api.chatflow.graph import ChatflowGraph, get_chatflow_graph
+from src.api.chatflow.handler import handle_chatflow
+from src.api.chatflow.state import ChatflowState
+from src.config import settings
+from src.database.db import engine
+from src.database.models import Interaction
+from src.services import vector_store
+from src.shared.enums import InteractionType
+from src.shared.schemas import InteractionMessage
+
+logger = logging.getLogger(__name__)
+
+# States renamed since sessions were recorded
+LEGACY_STATES = {"START": ChatflowState.IDLE.value}
+
+current_replay: ContextVar[Optional["RecordedSession"]] = ContextVar("current_replay", default=None)
+
+
+class RecordedSession:
+    """
+    A session read from the `interactions` table, with a cursor on its
+    recorded states that follows the workflows of the replay.
+    """
+
+    def __init__(self, row: Any):
+        self.session_id = row.session_id
+        self.practice_id = row.practice_id
+        self.messages = [InteractionMessage.model_validate(msg) for msg in row.messages or []]
+        self.states = [LEGACY_STATES.get(state, state) for state in row.states or []]
+        self.interaction_data = row.interaction_data or {}
+        self.turn_entry_state = ChatflowState.IDLE.value
+        self.position = 0
+        self.diverged = False
+
+    @property
+    def user_messages(self) -> List[InteractionMessage]:
+        return [msg for msg in self.messages if msg.role == InteractionType.USER]
+
+    def enter(self, state: str) -> None:
+        """Moves the cursor to the recorded occurrence of the state whose workflow is about to run."""
+        if self.diverged:
+            return
+        try:
+            self.position = self.states.index(state, self.position)
+        except ValueError:
+            self.diverged = True
+
+    def decide(self, name: str, lookahead: bool = True) -> Optional[str]:
+        """
+        Returns the decision value of `name` (e.g. "_true" or "_is_goodbye") that
+        led the recorded session out of the current state.
+
+        With `lookahead`, later states are searched as well. This covers
+        decisions recorded after a detour, like an intent classified while
+        asking for user data.
+        """
+        if self.diverged:
+            return None
+        graph = get_chatflow_graph()
+        end = len(self.states) - 1 if lookahead else min(self.position + 1, len(self.states) - 1)
+        for index in range(self.position, end):
+            try:
+                node = graph.node(ChatflowState(self.states[index]))
+            except ValueError:
+                continue
+            for label, target in (node.decisions if node else {}).items():
+                decision, _, value = label.partition(":")
+                if decision == name and target.value == self.states[index + 1]:
+                    return value
+        return None
+
+
+def _decision_value(value: str) -> Any:
+    value = value.removeprefix("_")
+    return {"true": True, "false": False}.get(value, value)
+
+
+class OracleChatModel(FakeChatModel):
+    """
+    Fake model that answers tool calls so the replay follows the recorded states.
+    """
+
+    def tool_args(self, tool_name: str, user_message: str) -> Dict[str, Any]:
+        recorded = current_replay.get()
+        if recorded is None:
+            return super().tool_args(tool_name, user_message)
+
+        if tool_name == "get_user_data":
+            # Only hand back the recorded data in the message that contains it
+            user_data = recorded.interaction_data.get("user_data") or {}
+            provided = {
+                key: value for key, value in user_data.items()
+                if key in ("name", "email") and value and str(value).lower() in user_message.lower()
+            }
+            if provided:
+                return provided
+            # A refusal answers the question asked at the end of the previous turn
+            refused = recorded.interaction_data.get("data_refused")
+            if refused and recorded.turn_entry_state == ChatflowState.ASK_USER_DATA.value:
+                return {"name": "", "email": ""}
+            return {}
+
+        value = recorded.decide(tool_name)
+        tool_instance = getattr(chatflow_tools, tool_name, None)
+        if value is None or tool_instance is None or not tool_instance.args:
+            return super().tool_args(tool_name, user_message)
+        return {next(iter(tool_instance.args)): _decision_value(value)}
+
+
+class OracleVectorStore(FakeVectorStore):
+    """
+    Fake vector store that finds a match whenever the recorded session replied from embeddings.
+    """
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        results = super().similarity_search_by_vector_with_relevance_scores(embedding, k, filter, **kwargs)
+        recorded = current_replay.get()
+        if recorded is not None and recorded.decide("is_found_on_embeddings", lookahead=False) == "_true":
+            return [(Document(page_content="Recorded answer from the knowledge base."), 0.9)]
+        return results
+
+
+def install_replay_graph() -> None:
+    """
+    Replaces the chatflow graph with one whose workflows move the cursor of the session being replayed.
+    """
+    graph = get_chatflow_graph()
+
+    def aligned(state: ChatflowState, workflow):
+        @functools.wraps(workflow)
+        async def run(*args):
+            recorded = current_replay.get()
+            if recorded is not None:
+                recorded.enter(state.value)
+            return await workflow(*args)
+        return run
+
+    nodes = {
+        state: replace(node, workflow=aligned(state, node.workflow))
+        for state, node in graph.nodes.items()
+    }
+    graph_module._chatflow_graph = ChatflowGraph(graph_id=graph.graph_id, nodes=nodes)
+
+
+def estimate_llm_calls(states: List[str]) -> int:
+    graph = get_chatflow_graph()
+    total = 0
+    for state in states:
+        try:
+            node = graph.node(ChatflowState(state))
+        except ValueError:
+            continue
+        total += node.llm_calls if node else 0
+    return total
+
+
+async def stream_sessions(args: argparse.Namespace) -> AsyncIterator[RecordedSession]:
+    query = select(
+        Interaction.session_id,
+        Interaction.practice_id,
+        Interaction.messages,
+        Interaction.states,
+        Interaction.interaction_data,
+    ).order_by(Interaction.session_id)
+    if args.practice_id:
+        query = query.where(Interaction.practice_id == args.practice_id)
+    if args.session_id:
+        query = query.where(Interaction.session_id.in_(args.session_id))
+    if args.limit:
+        query = query.limit(args.limit)
+
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=args.batch_size))
+        async for row in result:
+            yield RecordedSession(row)
+
+
+async def replay_session(
+    recorded: RecordedSession,
+    model: OracleChatModel,
+    sheets_service: FakeSheetsService,
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    current_replay.set(recorded)
+    counters: Dict[str, float] = {}
+    turn_counters.set(counters)
+
+    interaction_data: Dict[str, Any] = {}
+    user_data = recorded.interaction_data.get("user_data") or {}
+    if user_data.get("email") and ChatflowState.ASK_USER_DATA.value not in recorded.states:
+        # The user data came with the request rather than from the conversation
+        interaction_data["user_data"] = dict(user_data)
+
+    history: List[InteractionMessage] = []
+    current_state = ChatflowState.IDLE
+    replayed = [ChatflowState.IDLE.value]
+    error = None
+    for user_message in recorded.user_messages:
+        history.append(user_message)
+        recorded.turn_entry_state = current_state.value
+        if recorded.practice_id:
+            interaction_data["practice_id"] = recorded.practice_id
+        try:
+            new_messages, new_states, _, interaction_data = await handle_chatflow(
+                session_id=recorded.session_id,
+                history_messages=history,
+                current_state=current_state,
+                interaction_data=interaction_data,
+                model=model,
+                sheets_service=sheets_service,
+            )
+        except Exception as e:
+            logger.error(f"Session {recorded.session_id}: replay failed: {e}", exc_info=True)
+            error = str(e)
+            break
+        history.extend(new_messages)
+        replayed.extend(state.value for state in new_states)
+        if new_states:
+            current_state = new_states[-1]
+
+    matcher = difflib.SequenceMatcher(a=recorded.states, b=replayed, autojunk=False)
+    divergence = next(
+        (opcode for opcode in matcher.get_opcodes() if opcode[0] != "equal"), None
+    )
+    recorded_llm_calls = estimate_llm_calls(recorded.states)
+    recorded_latency = recorded_llm_calls * args.llm_latency_ms
+    if recorded.practice_id:
+        recorded_latency += recorded.states.count(ChatflowState.CLASSIFYING_INTENT.value) * args.vector_latency_ms
+    replayed_llm_calls = int(counters.get("llm_calls", 0))
+    replayed_latency = counters.get("simulated_seconds", 0.0) * 1000
+
+    return {
+        "session_id": recorded.session_id,
+        "turns": len(recorded.user_messages),
+        "matches": recorded.states == replayed,
+        "first_divergence": None if divergence is None else {
+            "index": divergence[1],
+            "recorded": recorded.states[divergence[1]:divergence[2]],
+            "replayed": replayed[divergence[3]:divergence[4]],
+        },
+        "error": error,
+        "recorded_states": recorded.states,
+        "replayed_states": replayed,
+        "diff": list(difflib.unified_diff(recorded.states, replayed, "recorded", "replayed", n=1, lineterm="")),
+        "llm_calls": {
+            "recorded": recorded_llm_calls,
+            "replayed": replayed_llm_calls,
+            "delta": replayed_llm_calls - recorded_llm_calls,
+        },
+        "simulated_latency_ms": {
+            "recorded": round(recorded_latency, 1),
+            "replayed": round(replayed_latency, 1),
+            "delta": round(replayed_latency - recorded_latency, 1),
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    install_replay_graph()
+    # Replays only follow the recorded decisions of the primary model, which differ
+    # between sessions for the same prompt, so calls are not shared either
+    settings.GEMINI_API_KEY = None
+    settings.LLM_COALESCE_ENABLED = False
+    model = OracleChatModel(latency=Latency(args.llm_latency_ms, seed=args.seed))
+    vector_store._vector_store = OracleVectorStore(latency=Latency(args.vector_latency_ms, seed=args.seed + 1))
+    sheets_service = FakeSheetsService()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tasks = []
+    async for recorded in stream_sessions(args):
+        await semaphore.acquire()
+        task = asyncio.create_task(replay_session(recorded, model, sheets_service, args))
+        task.add_done_callback(lambda _: semaphore.release())
+        tasks.append(task)
+
+    results = await asyncio.gather(*tasks)
+    await engine.dispose()
+    return list(results)
+
+
+def build_report(args: argparse.Namespace, sessions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def totals(key: str) -> Dict[str, float]:
+        recorded = sum(s[key]["recorded"] for s in sessions)
+        replayed = sum(s[key]["replayed"] for s in sessions)
+        deltas = [s[key]["delta"] for s in sessions]
+        return {
+            "recorded": round(recorded, 1),
+            "replayed": round(replayed, 1),
+            "delta": round(replayed - recorded, 1),
+            "delta_p95": round(percentile(deltas, 95), 1),
+        }
+
+    return {
+        "meta": {
+            **git_revision(),
+            "graph_id": get_chatflow_graph().graph_id,
+            "config": {
+                key: value for key, value in vars(args).items() if key not in ("output", "compare")
+            },
+        },
+        "summary": {
+            "sessions": len(sessions),
+            "matching": sum(1 for s in sessions if s["matches"]),
+            "diverged": sum(1 for s in sessions if not s["matches"]),
+            "errors": sum(1 for s in sessions if s["error"]),
+            "llm_calls": totals("llm_calls"),
+            "simulated_latency_ms": totals("simulated_latency_ms"),
+        },
+        "sessions": sessions,
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    summary = report["summary"]
+    print(f"commit {report['meta']['commit']}{' (dirty)' if report['meta']['dirty'] else ''}")
+    print(
+        f"{summary['sessions']} sessions: {summary['matching']} match the recording, "
+        f"{summary['diverged']} diverge, {summary['errors']} failed"
+    )
+    for key in ("llm_calls", "simulated_latency_ms"):
+        totals = summary[key]
+        print(
+            f"{key}: recorded {totals['recorded']}, replayed {totals['replayed']} "
+            f"({totals['delta']:+}, p95 per session {totals['delta_p95']:+})"
+        )
+
+    for session in report["sessions"]:
+        if session["matches"]:
+            continue
+        print(f"\n{session['session_id']} diverges at state #{session['first_divergence']['index']}")
+        for line in session["diff"][2:]:
+            print(f"  {line}")
+
+    if baseline:
+        before = {s["session_id"]: s for s in baseline["sessions"]}
+        print(f"\nCompared with {baseline['meta']['commit']}:")
+        changed = 0
+        for session in report["sessions"]:
+            old = before.get(session["session_id"])
+            if old is None:
+                continue
+            llm_delta = session["llm_calls"]["replayed"] - old["llm_calls"]["replayed"]
+            latency_delta = (
+                session["simulated_latency_ms"]["replayed"] - old["simulated_latency_ms"]["replayed"]
+            )
+            if old["replayed_states"] != session["replayed_states"] or llm_delta:
+                changed += 1
+                print(
+                    f"  {session['session_id']}: llm calls {llm_delta:+}, "
+                    f"simulated latency {latency_delta:+.1f} ms"
+                    f"{', states changed' if old['replayed_states'] != session['replayed_states'] else ''}"
+                )
+        print(f"  {changed} sessions changed")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay recorded chatflow sessions against the current code.")
+    parser.add_argument("--limit", type=int, help="Maximum number of sessions to replay.")
+    parser.add_argument("--practice-id", help="Only replay sessions of this practice.")
+    parser.add_argument("--session-id", action="append", help="Replay this session. Can be repeated.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows fetched per cursor round trip.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Sessions replayed at the same time.")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--vector-latency-ms", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the JSON report to this file.")
+    parser.add_argument("--compare", type=Path, help="A previous replay report to compare against.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    sessions = asyncio.run(run(args))
+    report = build_report(args, sessions)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Offline evaluation of the ranking of retrieved chunks.
+
+A practice with Q&A pairs, web page chunks and document chunks is searched
+with questions labelled with the chunks that answer them. The embeddings
+are hashed character trigrams, so the search runs without the embedding
+model; its distances are squared L2 like Chroma's. Trigrams of related
+texts are further apart than their embeddings, so the chunks found are
+those closer than `--threshold` rather than
+`VECTOR_EMBEDDINGS_SIMILARITY_THRESHOLD`. For each ranking of the chunks
+found, the benchmark shows:
+
+- precision: the share of the chunks given to the model that answer the question
+- recall: the share of the chunks answering the question given to the model
+- answered: the share of questions with at least one chunk answering them
+- the mean tokens of context given to the model
+- the mean milliseconds spent ranking, without and with the scores cached
+
+The rankings are the previous one, the 3 closest chunks keeping only the
+source type of highest priority (Q&A pair, web page, document), and
+`rank_results` with each re-ranker. The cross-encoder is only evaluated
+when it can be downloaded or is in the Hugging Face cache.
+
+Usage:
+    python -m benchmarks.retrieval_eval
+"""
+import argparse
+import hashlib
+import math
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import settings
+from src.services import retrieval
+from src.services.chunking import count_tokens
+from src.shared.enums import SourceType
+from src.shared.utils.text import normalize_query
+
+QA = SourceType.QA_PAIR.value
+WEB = SourceType.WEB_PAGE.value
+DOC = SourceType.DOCUMENT.value
+
+SOURCES: Dict[str, Tuple[str, str]] = {
+    "qa_insurance": (QA, "Q: Do you accept insurance?\nA: We are out of network with all insurance plans. We provide a superbill after each visit that you can submit to your insurer for possible reimbursement."),
+    "qa_first_visit": (QA, "Q: How long is the first visit?\nA: The initial visit is 90 minutes with a naturopathic doctor and includes a full health history and a review of previous lab work."),
+    "qa_telehealth": (QA, "Q: Do you offer telehealth visits?\nA: Yes, follow up visits can be held by video for patients located in Washington state."),
+    "qa_children": (QA, "Q: Do you see children?\nA: We see patients from age 6. We do not treat young children below age 6."),
+    "qa_cancel": (QA, "Q: What is the cancellation policy?\nA: Please cancel at least 48 hours before your appointment. Late cancellations and missed visits are charged the full fee."),
+    "web_pricing_1": (WEB, "## Pricing\n\nInitial visit (90 minutes): $395. Follow up visit (45 minutes): $195. Short follow up visit (30 minutes): $140. Payment is due at the time of the visit by card or HSA/FSA card."),
+    "web_pricing_2": (WEB, "## Lab testing fees\n\nLab tests are billed by the laboratory. Blood panels drawn in the clinic have a $25 draw fee. Specialty tests such as the GI-MAP stool test or the DUTCH hormone test are paid to the laboratory directly, and some laboratories bill your insurance."),
+    "web_team_jeffrey": (WEB, "### Dr. Sarah Jeffrey\n\nDr. Jeffrey takes a holistic, root-cause approach to ADHD, anxiety, depression, insomnia and Alzheimer's prevention, with specialized training in the Walsh Protocol and the Bredesen Protocol."),
+    "web_team_silva": (WEB, "### Dr. Luciana Silva\n\nDr. Silva focuses on women's health: hormone imbalances, PCOS, perimenopause and menopause, thyroid conditions and fertility support."),
+    "web_location": (WEB, "## Location and hours\n\nThe clinic is at 1200 Pine Street, Suite 300, Seattle. Street parking and a paid garage are nearby. Hours are Monday to Thursday 9am to 6pm and Friday 9am to 2pm."),
+    "web_conditions_gut": (WEB, "## Digestive health\n\nWe treat IBS, SIBO, GERD, constipation, diarrhea, Celiac disease, Crohn's disease, ulcerative colitis and functional concerns like bloating and abdominal pain, with stool testing and breath testing when needed."),
+    "doc_intake_1": (DOC, "# New patient packet\n\n## Before your first visit\n\nComplete the intake forms in the patient portal at least 3 days before your visit. Bring a list of your medications and supplements, and copies of lab results from the last two years."),
+    "doc_intake_2": (DOC, "## Superbills and reimbursement\n\nWe do not bill insurance. After each visit, a superbill with diagnosis and procedure codes is available in the portal. Submit it to your insurer as an out of network claim; many PPO plans reimburse part of the visit fee."),
+    "doc_intake_3": (DOC, "## Supplements\n\nThe clinic dispensary carries professional grade supplements. Patients receive a discount on supplements ordered through our online dispensary, shipped to your home."),
+    "doc_policy_1": (DOC, "## Telehealth policy\n\nVideo visits are available for follow up care when you are physically located in Washington state at the time of the visit. Initial visits for new patients are held in person at the clinic."),
+    "doc_policy_2": (DOC, "## Prescriptions\n\nNaturopathic doctors in Washington may prescribe many medications, including bioidentical hormones and thyroid medication. Controlled substances are not prescribed."),
+    "doc_labs": (DOC, "## Lab work\n\nYour doctor may order blood work, stool tests such as the GI-MAP, hormone tests such as the DUTCH test, or food sensitivity testing. Results are reviewed with you at a follow up visit."),
+}
+
+QUESTIONS: List[Tuple[str, set]] = [
+    ("do you take insurance", {"qa_insurance", "doc_intake_2"}),
+    ("how do I get reimbursed by my insurance with a superbill", {"doc_intake_2", "qa_insurance"}),
+    ("does insurance cover lab tests like the GI-MAP", {"web_pricing_2"}),
+    ("how much does the first visit cost", {"web_pricing_1"}),
+    ("how long is the initial visit", {"qa_first_visit", "web_pricing_1"}),
+    ("can I do my first visit by video", {"doc_policy_1"}),
+    ("are telehealth visits available", {"qa_telehealth", "doc_policy_1"}),
+    ("do you treat my 4 year old", {"qa_children"}),
+    ("what happens if I miss my appointment", {"qa_cancel"}),
+    ("which doctor treats ADHD and anxiety", {"web_team_jeffrey"}),
+    ("who can help with perimenopause and PCOS", {"web_team_silva"}),
+    ("where is the clinic and is there parking", {"web_location"}),
+    ("are you open on fridays", {"web_location"}),
+    ("do you treat SIBO and bloating", {"web_conditions_gut"}),
+    ("what should I bring to my first appointment", {"doc_intake_1"}),
+    ("can I buy supplements from you", {"doc_intake_3"}),
+    ("can a naturopath prescribe thyroid medication", {"doc_policy_2"}),
+    ("what lab tests might my doctor order", {"doc_labs", "web_pricing_2"}),
+    ("how much is the lab draw fee", {"web_pricing_2"}),
+    ("can I pay with my HSA card", {"web_pricing_1"}),
+]
+
+DIMENSIONS = 1024
+
+
+def embed(text: str) -> List[float]:
+    """Hashed character trigrams of the words, normalized to unit length."""
+    vector = [0.0] * DIMENSIONS
+    for word in text.lower().split():
+        word = f" {''.join(char for char in word if char.isalnum())} "
+        for i in range(len(word) - 2):
+            digest = hashlib.blake2b(word[i:i + 3].encode("utf-8"), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class EvalStore:
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.documents = [
+            Document(id=doc_id, page_content=text, metadata={"source_type": source_type, "doc_id": doc_id})
+            for doc_id, (source_type, text) in SOURCES.items()
+        ]
+        self.vectors = [embed(doc.page_content) for doc in self.documents]
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        query_vector = embed(query)
+        results = [
+            (doc, sum((a - b) ** 2 for a, b in zip(query_vector, vector)))
+            for doc, vector in zip(self.documents, self.vectors)
+        ]
+        results.sort(key=lambda result: result[1])
+        return [result for result in results[:k] if result[1] < self.threshold]
+
+
+def previous_ranking(results: Sequence[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """The ranking replaced by `rank_results`, over the 3 closest chunks."""
+    results = list(results[:3])
+    for source_type in (QA, WEB, DOC):
+        prioritized = [result for result in results if result[0].metadata["source_type"] == source_type]
+        if prioritized:
+            return prioritized
+    return results
+
+
+def evaluate(
+    name: str,
+    store: EvalStore,
+    rank: Callable[[str, List[Tuple[Document, float]]], List[Tuple[Document, float]]],
+) -> None:
+    precision = recall = answered = tokens = 0.0
+    uncached = cached = 0.0
+    misses = []
+    for question, relevant in QUESTIONS:
+        query = normalize_query(question)
+        results = store.search(query, settings.RETRIEVAL_FETCH_K)
+        started = time.perf_counter()
+        ranked = rank(query, results)
+        uncached += time.perf_counter() - started
+        started = time.perf_counter()
+        rank(query, results)
+        cached += time.perf_counter() - started
+
+        found = {doc.id for doc, _ in ranked}
+        precision += len(found & relevant) / len(found) if found else 0.0
+        recall += len(found & relevant) / len(relevant)
+        answered += bool(found & relevant)
+        tokens += sum(count_tokens(doc.page_content) for doc, _ in ranked)
+        if not found & relevant:
+            misses.append(question)
+
+    questions = len(QUESTIONS)
+    print(
+        f"{name:<28} precision {precision / questions:>5.2f}  recall {recall / questions:>5.2f}  "
+        f"answered {answered / questions:>5.2f}  {tokens / questions:>6.1f} tokens  "
+        f"{uncached / questions * 1000:>7.2f}ms, cached {cached / questions * 1000:>6.2f}ms"
+    )
+    for question in misses:
+        print(f"    not answered: {question}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Evaluate the ranking of retrieved chunks on a labelled question set.")
+    parser.add_argument("--fetch-k", type=int, default=settings.RETRIEVAL_FETCH_K)
+    parser.add_argument("--top-k", type=int, default=settings.RETRIEVAL_TOP_K)
+    parser.add_argument("--threshold", type=float, default=1.6, help="Distance below which chunks are found")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    settings.RETRIEVAL_FETCH_K = args.fetch_k
+    settings.RETRIEVAL_TOP_K = args.top_k
+    store = EvalStore(args.threshold)
+    print(f"{len(SOURCES)} chunks, {len(QUESTIONS)} questions, fetch k {args.fetch_k}, top k {args.top_k}")
+
+    evaluate("previous, priority", store, lambda query, results: previous_ranking(results))
+    for reranker in ("none", "lexical", "cross_encoder"):
+        settings.RETRIEVAL_RERANKER = reranker
+        retrieval._reranker = None
+        if reranker == "cross_encoder":
+            try:
+                retrieval._reranker = retrieval.CrossEncoderReranker(settings.RETRIEVAL_CROSS_ENCODER_MODEL)
+            except Exception as e:
+                print(f"{'fusion, cross_encoder':<28} skipped, the model could not be loaded: {type(e).__name__}")
+                continue
+        evaluate(f"fusion, {reranker}", store, retrieval.rank_results)
+
+
+if __name__ == "__main__":
+    main()
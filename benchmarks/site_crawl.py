@@ -0,0 +1,165 @@
+"""
+Site crawl ingestion against a local fixture website.
+
+Serves a generated practice website from a local HTTP server: pages sharing
+a navigation bar and footer in plain `div`s, near-duplicate copies of some
+pages (print versions), a robots.txt disallowing /private/ and a sitemap.
+The site is ingested twice with `store_data_from_site` into the fake vector
+store of `benchmarks.fakes`, which shows:
+
+- the pages fetched, and the highest number of requests the server received in a second
+- the near-duplicates skipped, and that boilerplate is stored in a single chunk
+- that the second crawl replaces the chunks of the first one
+
+Usage:
+    python -m benchmarks.site_crawl --pages 40
+    python -m benchmarks.site_crawl --pages 40 --no-sitemap
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from benchmarks.fakes import FakeVectorStore
+from src.config import settings
+from src.services import vector_store
+from src.services.embeddings import store_data_from_site
+from src.services.source_versions import get_version_collector
+
+TOPICS = (
+    "thyroid health", "hormone balance", "digestive health", "sleep support", "chronic fatigue",
+    "autoimmune conditions", "skin health", "stress and anxiety", "blood sugar balance", "heart health",
+)
+WORDS = (
+    "naturopathic doctors support patients with personalized plans root cause lifestyle nutrition "
+    "botanical medicine lab testing telehealth visits follow up care evidence based treatment"
+).split()
+NAVIGATION = "Home | About us | Services | Our doctors | Book a call | Contact"
+FOOTER = "© 2025 Linden Naturopathic Clinic. 123 Main Street. Call us at (555) 010-0100. Privacy policy."
+
+
+def build_site(pages: int, seed: int = 0) -> Dict[str, Tuple[str, str]]:
+    """Returns the content type and body served for each path of the site."""
+    rng = random.Random(seed)
+    site: Dict[str, Tuple[str, str]] = {}
+
+    def page(title: str, body: str) -> str:
+        return (
+            f"<html><head><title>{title}</title></head><body>"
+            f"<div class='menu'><p>{NAVIGATION}</p></div>"
+            f"<div class='content'><h1>{title}</h1>{body}</div>"
+            f"<div class='site-footer'><p>{FOOTER}</p></div>"
+            "</body></html>"
+        )
+
+    paths = [f"/services/{i}" for i in range(pages - 1)]
+    links = "".join(f"<p><a href='{path}'>Service {i}</a></p>" for i, path in enumerate(paths))
+    site["/"] = ("text/html", page("Linden Naturopathic Clinic", f"<p>Welcome to the clinic.</p>{links}"))
+    for i, path in enumerate(paths):
+        topic = TOPICS[i % len(TOPICS)]
+        paragraphs = "".join(
+            f"<p>{topic.capitalize()} {' '.join(rng.choice(WORDS) for _ in range(rng.randint(60, 120)))}.</p>"
+            for _ in range(rng.randint(3, 8))
+        )
+        # Every fifth page has a print version with the same content and a different title
+        if i % 5 == 0:
+            site[f"/print{path}"] = ("text/html", page(f"Print: Service {i}", paragraphs))
+            paragraphs += f"<p><a href='/print{path}'>Print this page</a></p>"
+        site[path] = ("text/html", page(f"Service {i}: {topic}", paragraphs))
+
+    site["/private/notes"] = ("text/html", page("Private", "<p>Not for crawlers.</p>"))
+    site["/robots.txt"] = ("text/plain", "User-agent: *\nDisallow: /private/\n")
+    return site
+
+
+def serve(site: Dict[str, Tuple[str, str]], requests: Counter) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests[int(time.monotonic())] += 1
+            requests[self.path] += 1
+            if self.path not in site:
+                self.send_error(404)
+                return
+            content_type, body = site[self.path]
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_sitemap(site: Dict[str, Tuple[str, str]], base_url: str) -> None:
+    urls = "".join(
+        f"<url><loc>{base_url}{path}</loc></url>"
+        for path, (content_type, _) in site.items()
+        if content_type == "text/html" and not path.startswith("/private/")
+    )
+    site["/sitemap.xml"] = (
+        "application/xml",
+        f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>',
+    )
+
+
+async def crawl(base_url: str) -> Tuple[int, int]:
+    pages, chunks = await store_data_from_site(base_url, "benchmark")
+    # Chunks of the previous crawl are deleted in the background
+    await get_version_collector().drain()
+    return pages, chunks
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Crawl and ingest a local fixture website.")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--no-sitemap", action="store_true", help="Discover the pages from their links")
+    parser.add_argument("--host-rps", type=float, default=settings.CRAWL_HOST_REQUESTS_PER_SECOND)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    settings.CRAWL_HOST_REQUESTS_PER_SECOND = args.host_rps
+    # The fake embeddings have no rate limit
+    settings.INGEST_EMBED_TOKENS_PER_MINUTE = 0
+
+    site = build_site(args.pages)
+    requests: Counter = Counter()
+    server = serve(site, requests)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    if not args.no_sitemap:
+        add_sitemap(site, base_url)
+
+    store = FakeVectorStore()
+    vector_store._vector_store = store
+    try:
+        for run in (1, 2):
+            started = time.perf_counter()
+            pages, chunks = asyncio.run(crawl(base_url))
+            seconds = time.perf_counter() - started
+            print(f"crawl {run}: {pages} pages and {chunks} chunks stored in {seconds:.1f}s, {len(store.documents)} chunks in the store")
+    finally:
+        server.shutdown()
+
+    html_pages = sum(1 for content_type, _ in site.values() if content_type == "text/html")
+    per_second = [count for key, count in requests.items() if isinstance(key, int)]
+    contents: List[str] = [doc.page_content for doc in store.documents.values()]
+    print(f"site: {html_pages} HTML pages, {html_pages - pages} near-duplicates or disallowed pages not stored")
+    print(f"requests to /private/: {requests['/private/notes']}, most requests in a second: {max(per_second)} "
+          f"(limit {args.host_rps:g})")
+    print(f"chunks with navigation: {sum(NAVIGATION in content for content in contents)}, "
+          f"with footer: {sum('Linden Naturopathic Clinic. 123' in content for content in contents)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Normalization of large scraped pages before they are chunked.
+
+Generates markdown pages of a few megabytes with different shares of
+non-ASCII text and times, for each one:
+
+- the previous cleanup, `regex.sub(INVALID_UNICODE_CLEANUP_REGEX, '', text)`
+- the same passes as `normalize_text` applied to the whole text: NFKC, the
+  cleanup pattern, then the whitespace passes
+- `normalize_text`
+
+The outputs of the last two are compared, they must be equal.
+
+Usage:
+    python -m benchmarks.text_normalization --megabytes 8
+"""
+import argparse
+import random
+import re
+import time
+import unicodedata
+from typing import Callable, Dict
+
+import regex
+
+from src.shared.constants import INVALID_UNICODE_CLEANUP_REGEX
+from src.shared.utils.text import normalize_text
+
+WORDS = (
+    "naturopathic doctors support patients with personalized plans root cause lifestyle nutrition "
+    "botanical medicine lab testing telehealth visits follow up care evidence based treatment"
+).split()
+# Words mixed into the pages of each profile, and their share of the words
+PROFILES = {
+    "ascii": ([], 0.0),
+    "english": (["patient’s", "“care”", "—", "…", "café", "Dr. Smith"], 0.03),
+    "spanish": (["está", "niño", "atención", "médico", "¿cómo?", "después"], 0.25),
+    "emoji": (["😀", "✅", "™", "★", "中文", "​", "﻿"], 0.2),
+}
+
+
+def page(megabytes: float, extra: list, share: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    section = 0
+    while size < megabytes * 1_000_000:
+        section += 1
+        lines = [f"## Section {section}", ""]
+        for _ in range(rng.randint(2, 6)):
+            words = [
+                rng.choice(extra) if extra and rng.random() < share else rng.choice(WORDS)
+                for _ in range(rng.randint(20, 120))
+            ]
+            lines.extend([" ".join(words) + ".  ", ""])
+        lines.append("")
+        text = "\n".join(lines)
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+
+_PREVIOUS = regex.compile(INVALID_UNICODE_CLEANUP_REGEX)
+_INVALID = regex.compile(f"{INVALID_UNICODE_CLEANUP_REGEX}+")
+
+
+def previous(text: str) -> str:
+    return regex.sub(INVALID_UNICODE_CLEANUP_REGEX, '', text)
+
+
+def whole(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    text = _INVALID.sub("", text)
+    text = re.sub(r"\r\n?|[\x0b\x0c\x85\u2028\u2029]", "\n", text)
+    text = re.sub(r"[ \t]+$", "", text, flags=re.MULTILINE)
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
+def timed(function: Callable[[str], str], text: str, repeat: int) -> tuple[float, str]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time the normalization of large scraped pages.")
+    parser.add_argument("--megabytes", type=float, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    functions: Dict[str, Callable[[str], str]] = {
+        "previous cleanup": previous,
+        "whole text": whole,
+        "normalize_text": normalize_text,
+    }
+    for name, (extra, share) in PROFILES.items():
+        text = page(args.megabytes, extra, share)
+        non_ascii = sum(not char.isascii() for char in text) / len(text)
+        print(f"{name}: {len(text) / 1e6:.1f}M characters, {non_ascii:.2%} non-ASCII")
+        results = {}
+        for label, function in functions.items():
+            seconds, results[label] = timed(function, text, args.repeat)
+            print(f"  {label:<18} {seconds * 1000:>8.1f}ms {len(text) / 1e6 / seconds:>8.1f}M chars/s")
+        assert results["whole text"] == results["normalize_text"], f"{name}: outputs differ"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Add version column to interactions
+
+Revision ID: 3f6c2a9d1b7e
+Revises: 8070db793370
+Create Date: 2026-10-19 10:12:41.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6c2a9d1b7e'
+down_revision: Union[str, None] = '8070db793370'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('interactions', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('interactions', 'version')
@@ -0,0 +1,57 @@
+"""Add activity timestamps to interactions and the interactions_archive table
+
+Revision ID: 5b8e1f4c7a20
+Revises: 3f6c2a9d1b7e
+Create Date: 2026-10-19 14:02:17.204815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e1f4c7a20'
+down_revision: Union[str, None] = '3f6c2a9d1b7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing sessions start their idle period at the time of the migration
+    op.add_column('interactions', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('interactions', sa.Column('last_active_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.create_index(op.f('ix_interactions_last_active_at'), 'interactions', ['last_active_at'], unique=False)
+
+    op.create_table(
+        'interactions_archive',
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('practice_id', sa.String(), nullable=True),
+        sa.Column('messages', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('states', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('interaction_data', sa.JSON(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_active_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('session_id', 'archived_at'),
+        postgresql_partition_by='RANGE (archived_at)',
+    )
+    op.create_index(op.f('ix_interactions_archive_practice_id'), 'interactions_archive', ['practice_id'], unique=False)
+    # Monthly partitions are created by the archival job, this one catches anything outside them
+    op.execute(
+        "CREATE TABLE interactions_archive_default PARTITION OF interactions_archive DEFAULT "
+        "WITH (toast_tuple_target = 128)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_interactions_archive_practice_id'), table_name='interactions_archive')
+    op.drop_table('interactions_archive')
+    op.drop_index(op.f('ix_interactions_last_active_at'), table_name='interactions')
+    op.drop_column('interactions', 'last_active_at')
+    op.drop_column('interactions', 'created_at')
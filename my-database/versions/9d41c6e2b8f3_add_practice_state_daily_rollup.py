@@ -0,0 +1,61 @@
+"""Add practice_state_daily rollup and GIN index on interactions.states
+
+Revision ID: 9d41c6e2b8f3
+Revises: 5b8e1f4c7a20
+Create Date: 2026-10-19 15:21:48.730912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d41c6e2b8f3'
+down_revision: Union[str, None] = '5b8e1f4c7a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'practice_state_daily',
+        sa.Column('practice_id', sa.String(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('state', sa.String(), nullable=False),
+        sa.Column('sessions', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('practice_id', 'day', 'state'),
+    )
+
+    # Sessions recorded so far count on the day they were created
+    op.execute(
+        """
+        INSERT INTO practice_state_daily (practice_id, day, state, sessions)
+        SELECT coalesce(practice_id, ''), (created_at AT TIME ZONE 'UTC')::date, state, count(*)
+        FROM (
+            SELECT DISTINCT i.session_id, i.practice_id, i.created_at, s.state
+            FROM interactions i, jsonb_array_elements_text(i.states) AS s(state)
+        ) AS reached
+        GROUP BY 1, 2, 3
+        """
+    )
+
+    # Built without locking writes to interactions
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_interactions_states',
+            'interactions',
+            ['states'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'states': 'jsonb_path_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_interactions_states', table_name='interactions', postgresql_using='gin')
+    op.drop_table('practice_state_daily')
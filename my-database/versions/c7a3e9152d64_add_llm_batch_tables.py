@@ -0,0 +1,52 @@
+"""Add llm_batch_chunks and llm_batch_results tables for offline model jobs
+
+Revision ID: c7a3e9152d64
+Revises: 9d41c6e2b8f3
+Create Date: 2026-10-19 17:08:33.519027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a3e9152d64'
+down_revision: Union[str, None] = '9d41c6e2b8f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'llm_batch_chunks',
+        sa.Column('job_id', sa.String(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('requests', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('status', sa.String(), server_default='pending', nullable=False),
+        sa.Column('provider_batch_id', sa.String(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('job_id', 'chunk_index'),
+    )
+    op.create_table(
+        'llm_batch_results',
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('item_key', sa.String(), nullable=False),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('source_version', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'item_key'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('llm_batch_results')
+    op.drop_table('llm_batch_chunks')
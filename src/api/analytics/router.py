@@ -0,0 +1,68 @@
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.crud import get_state_counts, get_state_totals
+from src.database.db import get_db
+from src.shared.schemas import FunnelResponse, StateCount, StateCountsResponse
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 366
+
+
+def _date_range(start: Optional[date], end: Optional[date]) -> tuple[date, date]:
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The date range cannot be longer than {MAX_RANGE_DAYS} days",
+        )
+    return start, end
+
+
+@router.get("/analytics/practices/{practice_id}/states", response_model=StateCountsResponse)
+async def state_counts(
+    practice_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    state: Optional[List[str]] = Query(default=None),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Returns, for each day, the number of sessions of a practice that reached
+    each chatflow state for the first time. Defaults to the last 30 days.
+    """
+    start, end = _date_range(start, end)
+    rows = await get_state_counts(db, practice_id, start, end, state)
+    return StateCountsResponse(
+        practiceId=practice_id,
+        start=start,
+        end=end,
+        counts=[StateCount(day=row.day, state=row.state, sessions=row.sessions) for row in rows],
+    )
+
+
+@router.get("/analytics/practices/{practice_id}/funnel", response_model=FunnelResponse)
+async def funnel(
+    practice_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Returns the number of sessions of a practice that reached each chatflow
+    state over a date range. `IDLE` counts the sessions started. Defaults to
+    the last 30 days.
+    """
+    start, end = _date_range(start, end)
+    totals = await get_state_totals(db, practice_id, start, end)
+    return FunnelResponse(practiceId=practice_id, start=start, end=end, states=totals)
@@ -0,0 +1,287 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .knowledge_data import CONDITIONS_DATA
+from src.database.crud import get_batch_results
+from src.shared.enums import InteractionType
+
+logger = logging.getLogger(__name__)
+
+# Words introducing the list of conditions in a sentence, e.g. "We support patients with ..."
+_LIST_INTRO = re.compile(
+    r"^.*\b(?:treat|support|with|such as|like|optimize|on|interested in)\s+", re.IGNORECASE
+)
+_LIST_SEPARATOR = re.compile(r",\s*(?:and\s+|or\s+)?|\s+and\s+")
+# Qualifications following a condition, e.g. "type 1 diabetes when co-managed by ..."
+_LIST_QUALIFIER = re.compile(r"\s*(?:—|\bwhen\b|\brelated to\b|\bare\b|\bfor\b).*$")
+# Qualifications restricting when a condition is treated, e.g. "autism (age 6+)"
+_RESTRICTING_QUALIFIER = re.compile(r"\(|\bwhen\b|\brelated to\b", re.IGNORECASE)
+# Longer fragments are prose rather than condition names
+_MAX_CONDITION_WORDS = 4
+
+# Mentions that need the judgement of the model, see "What We Don’t Treat" in `CONDITIONS_DATA`
+UNTREATED_TERMS = (
+    "emergency", "urgent", "911", "primary care", "screening", "vaccination", "vaccine", "immunization",
+    "pregnancy", "pregnant", "prenatal", "labor", "postpartum", "birth", "cancer", "oncology", "tumor",
+    "pediatric", "baby", "toddler", "child", "children", "kid", "daughter", "son", "year old",
+    "personality disorder", "eating disorder", "anorexia", "bulimia", "substance", "addiction",
+    "alcohol", "psychiatric", "schizophrenia", "psychosis", "immunodeficiency", "scid", "cvid",
+)
+# Goals listed with the conditions that are too generic to name one, e.g. "sleep" in "sleep apnea"
+_GENERIC_ALIASES = ("energy", "cognition", "mood", "sleep", "weight", "prevention", "longevity", "aging")
+_NEGATIONS = ("no", "not", "never", "without", "nor", "neither", "none", "nothing", "cannot")
+# The other words a question about a condition may have. Any other word may name
+# something the clinic does not treat, e.g. "hair loss from thyroid conditions".
+_QUESTION_WORDS = """
+    a an the and or also too any some i i'm im me my we you your our it it's this that these those there
+    do does did can could would will should is are am was were be been have has had get got
+    treat treats treated treating treatment help helps helping with for about of in to from by
+    what how which who anyone someone something anything patient people person work see support manage deal dealing
+    handle suffer suffering struggle struggling diagnosed diagnosis condition issue problem concern symptom
+    hi hello hey thanks thank please just really so ok okay yes wondering want know looking question ask
+    offer specialize experience doctor naturopath naturopathic clinic practice
+""".split()
+
+
+@lru_cache(maxsize=1)
+def _parse_conditions() -> Tuple[Dict[str, List[str]], Set[str]]:
+    treated = CONDITIONS_DATA.split("## What We")[0]
+    conditions, qualified = {}, set()
+    for category, body in re.findall(r"\*\*(.+?)\*\*\n(.+?)(?=\n\n|\Z)", treated, re.DOTALL):
+        names = []
+        for sentence in re.split(r"(?<=\.)\s+", body.strip()):
+            for fragment in _LIST_SEPARATOR.split(sentence.rstrip(".")):
+                fragment = _LIST_INTRO.sub("", fragment.strip())
+                name = _LIST_QUALIFIER.sub("", fragment)
+                if (
+                    name
+                    and len(name.split()) <= _MAX_CONDITION_WORDS
+                    and not name.lower().startswith(("we ", "this ", "etc"))
+                    and name not in names
+                ):
+                    names.append(name)
+                    if _RESTRICTING_QUALIFIER.search(fragment):
+                        qualified.add(f"{category}/{name}")
+        conditions[category] = names
+    return conditions, qualified
+
+
+def treated_conditions() -> Dict[str, List[str]]:
+    """
+    Returns the conditions listed in the "Conditions Treated" section of
+    `CONDITIONS_DATA`, by category.
+    """
+    return _parse_conditions()[0]
+
+
+def qualified_conditions() -> Set[str]:
+    """
+    Returns the treated conditions, as "category/condition", that are only
+    treated in some cases, e.g. "type 1 diabetes when co-managed by an endocrinologist".
+    """
+    return _parse_conditions()[1]
+
+
+@lru_cache(maxsize=1)
+def doctors() -> List[str]:
+    """
+    Returns the names of the doctors in the "Our doctors" section of `CONDITIONS_DATA`.
+    """
+    return re.findall(r"^### (Dr\. .+?)\s*$", CONDITIONS_DATA, re.MULTILINE)
+
+
+def _stem(token: str) -> str:
+    token = re.sub(r"'s?$", "", token)
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into normalized words: lowercase, with possessives and plurals removed.
+    """
+    text = text.replace("’", "'").lower()
+    return [_stem(token) for token in re.findall(r"[a-z0-9+]+(?:'[a-z]*)?", text)]
+
+
+def _aliases(condition: str) -> List[str]:
+    """The ways a condition may be written, e.g. "Parkinson’s or Alzheimer’s support" gives both diseases."""
+    name = re.sub(r"\s*\(.*?\)", "", condition)
+    aliases = [name]
+    for part in re.split(r"/|\s+or\s+", name):
+        part = re.sub(r"\s+support$", "", part.strip())
+        if part and part not in aliases:
+            aliases.append(part)
+    return aliases
+
+
+@dataclass(frozen=True)
+class ConditionMatch:
+    condition: str
+    category: str
+    doctor: Optional[str] = None
+
+
+@dataclass
+class ConditionIndex:
+    """
+    Finds the treated conditions mentioned in a message, with the precomputed
+    answers for their category.
+
+    Aliases of the conditions are kept in a trie of normalized words, so a
+    message is matched in one pass over its words. Acronyms of two letters,
+    e.g. "MS" or "RA", only match when written in capitals. Conditions only
+    treated in some cases and generic goals such as "sleep" are left out.
+    """
+    condition_answers: Dict[str, str] = field(default_factory=dict)
+    condition_doctors: Dict[str, str] = field(default_factory=dict)
+    _trie: dict = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        generic = {" ".join(tokenize(alias)) for alias in _GENERIC_ALIASES}
+        for category, conditions in treated_conditions().items():
+            for condition in conditions:
+                if f"{category}/{condition}" in qualified_conditions():
+                    continue
+                for alias in _aliases(condition):
+                    if " ".join(tokenize(alias)) in generic:
+                        continue
+                    self._add(alias, ConditionMatch(
+                        condition, category, self.condition_doctors.get(f"{category}/{condition}")
+                    ))
+
+    def _add(self, alias: str, match: ConditionMatch) -> None:
+        node = self._trie
+        for token in tokenize(alias):
+            node = node.setdefault(token, {})
+        # The first category listing a condition wins, e.g. PCOS is in Women’s Health
+        if "$" not in node:
+            node["$"] = (match, alias if re.fullmatch(r"[A-Z]{2}", alias) else None)
+
+    def find(self, text: str) -> List[ConditionMatch]:
+        """
+        Returns the conditions mentioned in `text`, longest alias first at each position.
+        """
+        return self._scan(text)[0]
+
+    def _scan(self, text: str) -> Tuple[List[ConditionMatch], List[str]]:
+        """Returns the conditions mentioned in `text`, and its words outside of them."""
+        tokens = tokenize(text)
+        original = set(re.findall(r"\b[A-Z]{2}\b", text))
+        matches, rest = [], []
+        i = 0
+        while i < len(tokens):
+            node, found, end = self._trie, None, i
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if "$" in node:
+                    match, acronym = node["$"]
+                    if acronym is None or acronym in original:
+                        found, end = match, j + 1
+            if found:
+                matches.append(found)
+                i = end
+            else:
+                rest.append(tokens[i])
+                i += 1
+        return matches, rest
+
+    def match(self, history_messages: Sequence) -> Optional[ConditionMatch]:
+        """
+        Returns the condition the user asks about in their latest message, or
+        None if it needs the judgement of the model: no known condition,
+        conditions from several categories, a negation, a word that may name
+        something else, e.g. "gout" in "anxiety and gout", or a mention of
+        something we may not treat.
+        """
+        message = next(
+            (msg.message for msg in reversed(history_messages) if msg.role == InteractionType.USER and msg.message),
+            None,
+        )
+        if not message:
+            return None
+        if _mentions(message, UNTREATED_TERMS):
+            return None
+        matches, rest = self._scan(message)
+        if not matches or len({match.category for match in matches}) > 1:
+            return None
+        if any(_is_negation(word) for word in rest) or set(rest) - _question_words():
+            return None
+        return matches[0]
+
+
+@lru_cache(maxsize=1)
+def _question_words() -> Set[str]:
+    return set(tokenize(" ".join(_QUESTION_WORDS)))
+
+
+def _is_negation(word: str) -> bool:
+    return word in _NEGATIONS or word.endswith("n't")
+
+
+def _mentions(message: str, terms: Iterable[str]) -> bool:
+    words = f" {' '.join(tokenize(message))} "
+    return any(f" {' '.join(tokenize(term))} " in words for term in terms)
+
+
+# Kinds of offline model jobs with results used by the index, see `src.jobs.batch_tasks`
+CONDITION_INDEX_KINDS = ("doctor_recommendation", "condition_answer")
+
+
+def build_condition_index(results: Dict[str, Dict[str, dict]]) -> ConditionIndex:
+    """
+    Builds the index with the results of the offline model jobs, by kind and
+    item key, see `src.jobs.batch_tasks`.
+    """
+    condition_doctors = {}
+    for key, result in results.get("doctor_recommendation", {}).items():
+        recommendation = result.get("best_doctor_for_client", "")
+        doctor = next(
+            (name for name in doctors() if name.split()[-1].lower() in recommendation.lower()), None
+        )
+        if doctor:
+            condition_doctors[key] = doctor
+
+    return ConditionIndex(
+        condition_answers={
+            key: result["content"] for key, result in results.get("condition_answer", {}).items()
+        },
+        condition_doctors=condition_doctors,
+    )
+
+
+_condition_index: Optional[ConditionIndex] = None
+
+
+def get_condition_index() -> ConditionIndex:
+    """
+    Returns a singleton instance of the condition index, without precomputed
+    answers until `load_condition_index` is called.
+    """
+    global _condition_index
+    if _condition_index is None:
+        _condition_index = ConditionIndex()
+    return _condition_index
+
+
+async def load_condition_index(db: AsyncSession) -> ConditionIndex:
+    """
+    Replaces the condition index with one that includes the latest precomputed answers.
+    """
+    global _condition_index
+    results = await get_batch_results(db, CONDITION_INDEX_KINDS)
+    index = build_condition_index(results)
+    _condition_index = index
+    logger.info(
+        f"Condition index: {len(index.condition_answers)} condition answers, "
+        f"{len(index.condition_doctors)} doctors"
+    )
+    return index
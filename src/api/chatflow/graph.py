@@ -0,0 +1,280 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+import yaml
+
+from src.config import settings
+from .state import ChatflowState
+from .workflows import WORKFLOWS
+
+logger = logging.getLogger(__name__)
+
+# Safety break to prevent infinite loops within a single turn
+MAX_WORKFLOW_HOPS = 10
+
+# Tool types evaluated from interaction data rather than by the model
+FLAG_TOOL_TYPES = {"boolean-flag"}
+
+# Model calls made by each special function, including the follow-up text generation
+SPECIAL_FUNCTION_LLM_CALLS = {
+    "generate_response": 1,
+    "save_to_mailing_list": 1,
+    "send_book_call_link": 2,
+    "send_doctor_information": 2,
+}
+
+# Node ids of `logic.yaml` naming a state stored under another name
+STATE_ALIASES = {"START": ChatflowState.IDLE}
+
+Workflow = Callable[..., Awaitable[tuple]]
+
+
+class GraphValidationError(ValueError):
+    """Custom exception for a chatflow graph that does not match the chatflow states or workflows."""
+    pass
+
+
+class UndeclaredTransitionError(RuntimeError):
+    """Custom exception for a workflow moving to a state its node does not transition to."""
+    pass
+
+
+@dataclass(frozen=True)
+class GraphNode:
+    """
+    A compiled node of the chatflow graph.
+    """
+    state: ChatflowState
+    workflow: Workflow
+    action: Optional[str]
+    decisions: Mapping[str, ChatflowState]
+    transitions: frozenset
+    awaits_user_input: bool
+    emitting_transitions: frozenset
+    llm_calls: int
+
+
+@dataclass(frozen=True)
+class TurnBudget:
+    """
+    Worst-case cost of a single turn that starts in `entry_state`.
+    """
+    entry_state: ChatflowState
+    max_llm_calls: int
+    max_depth: int
+    worst_path: tuple
+
+
+class ChatflowGraph:
+    """
+    The chatflow graph compiled into a transition table.
+    """
+
+    def __init__(self, graph_id: str, nodes: Dict[ChatflowState, GraphNode]):
+        self.graph_id = graph_id
+        self.nodes = nodes
+        self.states_awaiting_user_input = frozenset(
+            state for state, node in nodes.items() if node.awaits_user_input
+        )
+        self.states_requiring_llm = frozenset(
+            state for state, node in nodes.items() if node.llm_calls
+        )
+
+    def node(self, state: ChatflowState) -> Optional[GraphNode]:
+        return self.nodes.get(state)
+
+    def awaits_user_input(self, state: ChatflowState) -> bool:
+        return state in self.states_awaiting_user_input
+
+    def allows(self, from_state: ChatflowState, to_state: ChatflowState) -> bool:
+        node = self.nodes.get(from_state)
+        return node is not None and to_state in node.transitions
+
+    def entry_states(self) -> list[ChatflowState]:
+        """
+        States a turn can start from: the initial state and every state that waits for the user.
+        """
+        return [
+            state for state in self.nodes
+            if state == ChatflowState.IDLE or state in self.states_awaiting_user_input
+        ]
+
+    def analyze(self) -> Dict[ChatflowState, TurnBudget]:
+        """
+        Computes, for every entry state, the worst-case number of model calls and
+        workflow hops a single turn can take, following the same stop rules as
+        `handle_chatflow`.
+        """
+        return {state: self._turn_budget(state) for state in self.entry_states()}
+
+    def _turn_budget(self, entry_state: ChatflowState) -> TurnBudget:
+        worst_calls, worst_path = 0, (entry_state,)
+        max_depth = 1
+        stack = [((entry_state,), self.nodes[entry_state].llm_calls)]
+        while stack:
+            path, llm_calls = stack.pop()
+            if (llm_calls, len(path)) > (worst_calls, len(worst_path)):
+                worst_calls, worst_path = llm_calls, path
+            max_depth = max(max_depth, len(path))
+            if len(path) >= MAX_WORKFLOW_HOPS:
+                continue
+
+            node = self.nodes[path[-1]]
+            for next_state in node.transitions:
+                if next_state == node.state or next_state in path:
+                    continue
+                next_node = self.nodes[next_state]
+                if next_state in node.emitting_transitions and next_node.awaits_user_input:
+                    continue
+                stack.append((path + (next_state,), llm_calls + next_node.llm_calls))
+
+        return TurnBudget(
+            entry_state=entry_state,
+            max_llm_calls=worst_calls,
+            max_depth=max_depth,
+            worst_path=worst_path,
+        )
+
+
+def _parse_state(value: Any, context: str) -> ChatflowState:
+    if value in STATE_ALIASES:
+        return STATE_ALIASES[value]
+    try:
+        return ChatflowState(value)
+    except ValueError:
+        raise GraphValidationError(f"Unknown chatflow state '{value}' in {context}.")
+
+
+def _count_llm_calls(node_spec: Dict[str, Any]) -> int:
+    action = node_spec.get("action")
+    if action == "use_tools":
+        return sum(
+            1 for tool_spec in node_spec.get("tools") or []
+            if tool_spec.get("type") not in FLAG_TOOL_TYPES
+        )
+    if action == "use_special_function":
+        return SPECIAL_FUNCTION_LLM_CALLS.get(node_spec.get("function_name"), 1)
+    return 0
+
+
+def compile_chatflow_graph(
+    spec: Dict[str, Any],
+    workflows: Mapping[ChatflowState, Workflow] = WORKFLOWS,
+) -> ChatflowGraph:
+    """
+    Compiles the graph section of `logic.yaml` into a `ChatflowGraph`.
+
+    Every node must be a `ChatflowState`, or an alias of one in
+    `STATE_ALIASES`, with a registered workflow, every transition must target
+    a node of the graph, and every registered workflow must be reachable
+    through a node.
+
+    Args:
+        spec: The parsed contents of `logic.yaml`.
+        workflows: The workflow registered for each state.
+
+    Returns:
+        The compiled graph.
+    """
+    graph_spec = spec.get("graph") or {}
+    nodes_spec = graph_spec.get("nodes") or []
+    graph_id = graph_spec.get("id", "graph")
+
+    nodes: Dict[ChatflowState, GraphNode] = {}
+    for node_spec in nodes_spec:
+        state = _parse_state(node_spec.get("id"), f"node id of graph '{graph_id}'")
+        if state in nodes:
+            raise GraphValidationError(f"Duplicated node '{state.value}' in graph '{graph_id}'.")
+        workflow = workflows.get(state)
+        if workflow is None:
+            raise GraphValidationError(f"No workflow registered for node '{state.value}'.")
+
+        decision_spec = node_spec.get("decision") or {}
+        decisions = {
+            label: _parse_state(target, f"decision '{label}' of node '{state.value}'")
+            for label, target in decision_spec.items()
+        }
+        transitions = set(decisions.values())
+        if "next" in node_spec:
+            transitions.add(_parse_state(node_spec["next"], f"next of node '{state.value}'"))
+        if not transitions:
+            # Terminal nodes keep their own state
+            transitions.add(state)
+
+        # Decision nodes only send a message on the branches listed under `messages`
+        if decisions:
+            emitting_transitions = {
+                decisions[label] for label in node_spec.get("messages") or {}
+                if label in decisions
+            }
+        else:
+            emitting_transitions = transitions if "message" in node_spec else set()
+
+        nodes[state] = GraphNode(
+            state=state,
+            workflow=workflow,
+            action=node_spec.get("action"),
+            decisions=decisions,
+            transitions=frozenset(transitions),
+            awaits_user_input=bool(decisions),
+            emitting_transitions=frozenset(emitting_transitions),
+            llm_calls=_count_llm_calls(node_spec),
+        )
+
+    for node in nodes.values():
+        unknown_targets = [target.value for target in node.transitions if target not in nodes]
+        if unknown_targets:
+            raise GraphValidationError(
+                f"Node '{node.state.value}' transitions to states without a node: {unknown_targets}"
+            )
+
+    missing_nodes = [state.value for state in workflows if state not in nodes]
+    if missing_nodes:
+        raise GraphValidationError(f"Workflows registered for states without a node: {missing_nodes}")
+
+    if ChatflowState.IDLE not in nodes:
+        raise GraphValidationError(f"Graph '{graph_id}' has no '{ChatflowState.IDLE.value}' node.")
+
+    return ChatflowGraph(graph_id=graph_id, nodes=nodes)
+
+
+def load_chatflow_graph(path: str | Path) -> ChatflowGraph:
+    """
+    Loads and compiles the chatflow graph from a YAML file.
+    """
+    with open(path, encoding="utf-8") as f:
+        spec = yaml.safe_load(f)
+
+    graph = compile_chatflow_graph(spec)
+    logger.info(
+        f"Compiled chatflow graph '{graph.graph_id}' with {len(graph.nodes)} nodes from {path}."
+    )
+    for budget in graph.analyze().values():
+        logger.debug(
+            f"Turn from {budget.entry_state.value}: up to {budget.max_llm_calls} LLM calls, "
+            f"{budget.max_depth} workflow hops. Worst path: {' -> '.join(s.value for s in budget.worst_path)}"
+        )
+    return graph
+
+
+_chatflow_graph = None
+
+
+def get_chatflow_graph() -> ChatflowGraph:
+    """
+    Returns a singleton instance of the compiled chatflow graph.
+    """
+    global _chatflow_graph
+    if _chatflow_graph is None:
+        _chatflow_graph = load_chatflow_graph(settings.CHATFLOW_GRAPH_PATH)
+    return _chatflow_graph
+
+
+if __name__ == "__main__":
+    for budget in get_chatflow_graph().analyze().values():
+        print(
+            f"{budget.entry_state.value:<40} llm_calls<={budget.max_llm_calls:<3} "
+            f"depth<={budget.max_depth:<3} {' -> '.join(s.value for s in budget.worst_path)}"
+        )
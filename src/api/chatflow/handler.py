@@ -1,85 +1,65 @@
+import time
+
 from .workflows import *
+from .graph import MAX_WORKFLOW_HOPS, UndeclaredTransitionError, get_chatflow_graph
 from src.services.google_sheets import GoogleSheetsService
 from src.shared.schemas import InteractionMessage
+from src.shared.utils.history import ChatMessage, TurnHistory
+from src.shared.utils.metrics import observe_workflow
 from langchain_core.language_models import BaseChatModel
+from opentelemetry import trace
 
 logger = logging.getLogger(__name__)
-
-# Define states that should pause the conversation flow and await user input
-STATES_AWAITING_USER_INPUT = {
-    ChatflowState.ASK_USER_DATA,
-    ChatflowState.GET_USER_DATA,
-    ChatflowState.CLASSIFYING_INTENT,
-    ChatflowState.VALIDATE_STATE,
-    ChatflowState.AWAITING_BOOK_CALL_OFFER_RESPONSE,
-    ChatflowState.AWAITING_NEW_MESSAGE,
-}
+tracer = trace.get_tracer(__name__)
 
 
 async def handle_chatflow(
     session_id: str,
-    history_messages: list[InteractionMessage],
+    history_messages: list[ChatMessage | InteractionMessage],
     current_state: ChatflowState,
     interaction_data: Optional[dict],
     model: BaseChatModel,
     sheets_service: Optional[GoogleSheetsService],
 ) -> tuple[list[InteractionMessage], list[ChatflowState], str | None, dict]:
     interaction_data = dict(interaction_data) if interaction_data else {}
-
-    workflow_map = {
-        ChatflowState.IDLE: idle_workflow,
-        ChatflowState.CLASSIFYING_INTENT: intent_classification_workflow,
-        ChatflowState.INTENT_QUESTION_CONDITION: question_condition_workflow,
-        ChatflowState.PROVIDE_CONDITION_INFORMATION: provide_condition_information_workflow,
-        ChatflowState.ASK_USER_DATA: ask_user_data_workflow,
-        ChatflowState.INTENT_FRUSTRATED_CUSTOMER: frustrated_customer_workflow,
-        ChatflowState.INTENT_OUT_OF_SCOPE_QUESTION: out_of_scope_workflow,
-        ChatflowState.RECOMMENDED_DOCTOR: recommended_doctor_workflow,
-        ChatflowState.REPLY_FROM_EMBEDDINGS: reply_from_embeddings_workflow,
-        ChatflowState.CUSTOMER_ACKNOWLEDGES_RESPONSE: customer_acknowledges_workflow,
-        ChatflowState.CONDITION_NOT_TREATED_SEND_CONTACT_INFO: condition_not_treated_workflow,
-        ChatflowState.INTENT_EVENT_QUESTION: event_question_workflow,
-        ChatflowState.INTENT_GENERAL_FAQ_QUESTION: general_faq_question_workflow,
-        ChatflowState.INVALID_REQUEST_EMERGENCY: emergency_workflow,
-        ChatflowState.VALIDATE_STATE: validate_state_workflow,
-        ChatflowState.OFFER_BOOK_CALL: offer_book_call_workflow,
-        ChatflowState.AWAITING_NEW_MESSAGE: await_new_message_workflow,
-        ChatflowState.AWAITING_BOOK_CALL_OFFER_RESPONSE: await_book_call_response_workflow,
-        ChatflowState.BOOK_CALL_OFFER_DECLINED: book_call_declined_workflow,
-        ChatflowState.BOOK_CALL_OFFER_ACCEPTED: book_call_link_accepted_workflow,
-        ChatflowState.INTENT_MAILING_LIST: intent_mailing_list_workflow,
-        ChatflowState.INTENT_GOODBYE: goodbye_workflow,
-        ChatflowState.FINAL: final_workflow,
-    }
+    graph = get_chatflow_graph()
 
     all_new_messages = []
+    # The history for the tool calls includes the messages generated so far in this turn
+    turn_history = TurnHistory(history_messages)
 
     next_state = current_state
     final_tool_call = None
     new_states = []
 
     # Loop to handle state transitions within a single turn
-    for _ in range(10):  # Safety break to prevent infinite loops
-        workflow_func = workflow_map.get(next_state)
-        if not workflow_func:
+    for _ in range(MAX_WORKFLOW_HOPS):  # Safety break to prevent infinite loops
+        node = graph.node(next_state)
+        if not node:
             logger.warning(
                 f"No workflow for state: {next_state}. Defaulting to intent classification."
             )
-            workflow_func = intent_classification_workflow
+            node = graph.node(ChatflowState.CLASSIFYING_INTENT)
+        workflow_func = node.workflow
 
         logger.info(
             f"Session {session_id}: Executing workflow for state {next_state}: {workflow_func.__name__}"
         )
 
-        # The history for the tool call should include messages generated so far in this turn
-        current_turn_history = history_messages + all_new_messages
-
-        new_messages, new_state, tool_call, interaction_data = await workflow_func(
-            current_turn_history, interaction_data, model, sheets_service
-        )
+        with tracer.start_as_current_span(
+            f"workflow {workflow_func.__name__}",
+            attributes={"chatflow.session_id": session_id, "chatflow.state": next_state.value},
+        ) as span:
+            started = time.perf_counter()
+            new_messages, new_state, tool_call, interaction_data = await workflow_func(
+                turn_history, interaction_data, model, sheets_service
+            )
+            observe_workflow(node.state.value, time.perf_counter() - started)
+            span.set_attribute("chatflow.next_state", new_state.value)
 
         if new_messages:
             all_new_messages.extend(new_messages)
+            turn_history.extend(new_messages)
         if tool_call:
             final_tool_call = tool_call
 
@@ -87,10 +67,15 @@ async def handle_chatflow(
             # State is stable, break loop
             break
 
+        if not graph.allows(node.state, new_state):
+            raise UndeclaredTransitionError(
+                f"Session {session_id}: Transition {node.state.value} -> {new_state.value} is not declared in graph '{graph.graph_id}'."
+            )
+
         new_states.append(new_state)
         next_state = new_state
 
-        if (new_messages or tool_call) and next_state in STATES_AWAITING_USER_INPUT:
+        if (new_messages or tool_call) and graph.awaits_user_input(next_state):
             # If workflow produced output for the user and requires user input, stop for this turn
             break
 
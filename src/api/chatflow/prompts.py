@@ -36,3 +36,5 @@ PROMPT_ASK_USER_DATA = "I'll be glad to assist you. Before we continue, who do I
 PROMPT_ADDED_TO_MAILING_LIST = "You've been added to our mailing list"
 PROMPT_INTENT_GOODBYE = "It was a pleasure assisting you. Have a great day!"
 INSTRUCTION_ACKNOWLEDGE_AND_ASK_USER_DATA = "The user has sent a message. Acknowledge it specifically and friendly (e.g., 'I can certainly check our hours for you', 'I can help with information about that condition'). Do NOT answer the question yet. Immediately after acknowledging, ask for their name and email address to assist them better."
+INSTRUCTION_SUMMARIZE_CONVERSATION="Summarize the following conversation between a visitor and Linden for the clinic's CRM in 2-4 sentences. Include what the visitor asked about, any condition or state they mentioned, whether they gave their name or email, and whether they accepted a discovery call or joined the mailing list. Do not add information that is not in the conversation."
+INSTRUCTION_CATEGORY_CONDITION_ANSWER="The user asked whether we treat a condition of the category below, and we do. Write the answer to send for any condition of this category: 1. Confirm we treat it, without naming a specific condition (e.g., 'Yes, this is something we can help with.'). 2. Briefly explain our approach for this category based on the context. 3. Invite the user to take a free 15-minute discovery call. Do not include a greeting. IMPORTANT: Do NOT ask for any personal details, age, symptoms, or medical history."
@@ -1,77 +1,101 @@
+import copy
 import logging
-from fastapi import APIRouter, Depends, Request
-from langchain_openai import ChatOpenAI
+import math
+from typing import List, Optional, Set
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from langchain_core.language_models import BaseChatModel
+from opentelemetry import trace
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
 from src.api.chatflow.handler import handle_chatflow
 from src.api.chatflow.state import ChatflowState
-from src.config import settings
+from src.database.crud import StaleSessionError, get_interaction, save_interaction
 from src.database.db import get_db
-from src.database.models import Interaction
-from src.shared.schemas import (
-    InteractionRequest,
-    InteractionResponse,
-    InteractionMessage,
+from src.services.google_sheets import GoogleSheetsService
+from src.services.llm import (
+    PRIORITY_NEW_SESSION,
+    PRIORITY_ONGOING_SESSION,
+    get_chat_model,
+    llm_priority,
 )
+from src.services.session_cache import CachedSession, SessionCache, get_session_cache
+from src.shared.schemas import InteractionRequest, InteractionResponse
+from src.shared.utils.history import ChatMessage, decode_messages, encode_messages
+from src.shared.utils.metrics import track_chatflow_turn
+from src.shared.utils.resilience import OverloadedError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
 
 
-@router.post("/chatflow", response_model=InteractionResponse)
-async def handle(
+def _overloaded(error: OverloadedError) -> HTTPException:
+    logger.warning(f"Rejecting chatflow request: {error}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The assistant is busy. Please try again shortly.",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
+async def _load_session(db: AsyncSession, session_id: str) -> Optional[CachedSession]:
+    interaction = await get_interaction(db, session_id)
+    if not interaction:
+        return None
+    return CachedSession(
+        practice_id=interaction.practice_id,
+        history=decode_messages(interaction.messages),
+        states=list(interaction.states or []),
+        interaction_data=interaction.interaction_data or {},
+        version=interaction.version,
+    )
+
+
+async def _run_turn(
     interaction_request: InteractionRequest,
-    request: Request,
-    db: AsyncSession = Depends(get_db),
-):
-    """
-    Handles a user-assistant interaction for the chatflow operation,
-    continuing a conversation by loading history from the database,
-    appending the new message, and saving the updated history.
-    """
-    logger.info(f"Received chatflow request: {interaction_request.model_dump_json(indent=2)}")
+    session: Optional[CachedSession],
+    db: AsyncSession,
+    model: BaseChatModel,
+    sheets_service: Optional[GoogleSheetsService],
+    session_cache: SessionCache,
+) -> InteractionResponse:
     session_id = interaction_request.sessionId
     user_message = interaction_request.message
+    # Conversations already in progress get the models first when they are busy
+    llm_priority.set(PRIORITY_ONGOING_SESSION if session else PRIORITY_NEW_SESSION)
 
-    # Find existing interaction
-    result = await db.execute(
-        select(Interaction).where(Interaction.session_id == session_id)
-    )
-    interaction = result.scalar_one_or_none()
-
-    if interaction:
-        history_messages = [
-            InteractionMessage.model_validate(msg) for msg in interaction.messages
-        ]
+    if session:
+        history_messages = session.history
+        states = session.states
         # Get the last state from the list
-        last_state = interaction.states[-1] if interaction.states else None
+        last_state = states[-1] if states else None
         current_state = ChatflowState(last_state) if last_state else ChatflowState.IDLE
-        interaction_data = interaction.interaction_data or {}
-        if not interaction.practice_id and interaction_request.practiceId:
-            interaction.practice_id = interaction_request.practiceId
+        interaction_data = session.interaction_data
+        practice_id = session.practice_id or interaction_request.practiceId
+        version = session.version
+        previous_states = set(states)
     else:
         # New interaction
         history_messages = []
+        states = [ChatflowState.IDLE.value]
         current_state = ChatflowState.IDLE
         interaction_data = {}
-        interaction = Interaction(
-            session_id=session_id,
-            practice_id=interaction_request.practiceId,
-            messages=[],
-            states=[ChatflowState.IDLE.value],
-            interaction_data=interaction_data,
-        )
-        db.add(interaction)
+        practice_id = interaction_request.practiceId
+        version = None
+        previous_states = set()
+
+    # The messages, states and data of this turn are applied again to the stored session on a conflict
+    turn_start = len(history_messages)
+    initial_data = copy.deepcopy(interaction_data)
 
     # Append new user message to history
-    history_messages.append(user_message)
+    history_messages.append(ChatMessage.from_interaction_message(user_message))
 
-    if interaction.practice_id:
-        interaction_data["practice_id"] = interaction.practice_id
+    if practice_id:
+        interaction_data["practice_id"] = practice_id
 
     if interaction_request.user_data:
-        # Create a copy to ensure SQLAlchemy detects changes to the JSON field.
         interaction_data = interaction_data.copy()
         # If user_data already exists and is a dict, update it. Otherwise, set it.
         if "user_data" in interaction_data and isinstance(
@@ -85,48 +109,139 @@ async def handle(
 
     logger.debug(f"Interaction data before handle_chatflow: {interaction_data}")
 
-    openai_model = ChatOpenAI(
-        model=settings.OPENAI_MODEL,
-        temperature=0,
-    )
-
-    sheets_service = request.app.state.sheets_service
-    response_messages, new_states, tool_call, interaction_data = await handle_chatflow(
-        session_id=session_id,
-        history_messages=history_messages,
-        current_state=current_state,
-        interaction_data=interaction_data,
-        model=openai_model,
-        sheets_service=sheets_service,
-    )
+    with track_chatflow_turn() as turn, tracer.start_as_current_span(
+        "handle_chatflow",
+        attributes={"chatflow.session_id": session_id, "chatflow.state": current_state.value},
+    ):
+        response_messages, new_states, tool_call, interaction_data = await handle_chatflow(
+            session_id=session_id,
+            history_messages=history_messages,
+            current_state=current_state,
+            interaction_data=interaction_data,
+            model=model,
+            sheets_service=sheets_service,
+        )
+        turn.final_state = (new_states[-1] if new_states else current_state).value
 
     logger.debug(f"Interaction data after handle_chatflow: {interaction_data}")
 
     # Update history with new messages from the handler
-    history_messages.extend(response_messages)
-
-    # Persist changes
-    interaction.messages = [
-        msg.model_dump(mode="json", exclude_none=True) for msg in history_messages
-    ]
-    # Append the new state. To ensure SQLAlchemy detects the change, we re-assign the list.
-    current_states = list(interaction.states)
+    history_messages.extend(ChatMessage.from_interaction_message(msg) for msg in response_messages)
+
+    # Append the new states
     for state in new_states:
-        current_states.append(state.value)
+        states.append(state.value)
         logger.info(
-            f"Session {session_id}: State added: {state.value}. Full state list: {current_states}"
+            f"Session {session_id}: State added: {state.value}. Full state list: {states}"
         )
-    interaction.states = current_states
-    interaction.interaction_data = interaction_data
 
-    await db.commit()
-    await db.refresh(interaction)
-
-    logger.debug(f"Interaction data saved for session {session_id}: {interaction.interaction_data}")
+    turn_session = CachedSession(
+        practice_id=practice_id,
+        history=history_messages,
+        states=states,
+        interaction_data=interaction_data,
+        version=version,
+    )
+    try:
+        states = await _save_turn(db, session_id, turn_session, previous_states, session_cache)
+    except StaleSessionError:
+        # The session was written by another request during the turn. The turn is not run
+        # again, as its model calls and Sheets rows already happened: its messages, states
+        # and changed data are applied to the stored session instead.
+        logger.warning(f"Session {session_id}: stale session, saving the turn on the stored version.")
+        await session_cache.invalidate(session_id)
+        stored = await _load_session(db, session_id)
+        if stored is None:
+            raise
+        changed_data = {
+            key: value for key, value in interaction_data.items()
+            if key not in initial_data or initial_data[key] != value
+        }
+        merged_session = CachedSession(
+            practice_id=stored.practice_id or practice_id,
+            history=stored.history + history_messages[turn_start:],
+            states=stored.states + [state.value for state in new_states],
+            interaction_data={**stored.interaction_data, **changed_data},
+            version=stored.version,
+        )
+        states = await _save_turn(db, session_id, merged_session, set(stored.states), session_cache)
 
     return InteractionResponse(
         sessionId=session_id,
         messages=response_messages,
         toolCall=tool_call,
-        states=interaction.states,
-    )
\ No newline at end of file
+        states=states,
+    )
+
+
+async def _save_turn(
+    db: AsyncSession,
+    session_id: str,
+    session: CachedSession,
+    previous_states: Set[str],
+    session_cache: SessionCache,
+) -> List[str]:
+    """
+    Writes a session computed from `session.version` and caches it.
+
+    Returns:
+        The states stored for the session.
+
+    Raises:
+        StaleSessionError: If the session was written since that version was read.
+    """
+    # States reached for the first time in this session, counted in the analytics rollups
+    reached_states = [state for state in session.states if state not in previous_states]
+
+    with tracer.start_as_current_span("db commit"):
+        states, version = await save_interaction(
+            db,
+            session_id=session_id,
+            practice_id=session.practice_id,
+            messages=encode_messages(session.history),
+            states=session.states,
+            interaction_data=session.interaction_data,
+            expected_version=session.version,
+            reached_states=reached_states,
+        )
+
+    logger.debug(f"Interaction data saved for session {session_id}: {session.interaction_data}")
+
+    session.states = states
+    session.version = version
+    await session_cache.set(session_id, session)
+    return states
+
+
+@router.post("/chatflow", response_model=InteractionResponse)
+async def handle(
+    interaction_request: InteractionRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    model: BaseChatModel = Depends(get_chat_model),
+    session_cache: SessionCache = Depends(get_session_cache),
+):
+    """
+    Handles a user-assistant interaction for the chatflow operation,
+    continuing a conversation by loading history from the session cache
+    or the database, appending the new message, and saving the updated history.
+    """
+    logger.info(f"Received chatflow request: {interaction_request.model_dump_json(indent=2)}")
+    session_id = interaction_request.sessionId
+    sheets_service = request.app.state.sheets_service
+
+    session = await session_cache.get(session_id)
+    if session is None:
+        session = await _load_session(db, session_id)
+
+    try:
+        return await _run_turn(
+            interaction_request, session, db, model, sheets_service, session_cache
+        )
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except StaleSessionError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The conversation was updated by another request. Please try again.",
+        )
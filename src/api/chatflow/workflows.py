@@ -3,9 +3,11 @@ import logging
 from langchain_core.language_models import BaseChatModel
 
 from .state import ChatflowState
+from .conditions import get_condition_index
 from .knowledge_data import *
 from .prompts import *
 from .tools import *
+from src.config import settings
 from src.services.embeddings import retrieve_data
 from src.services.google_sheets import GoogleSheetsService
 from src.shared.enums import InteractionType
@@ -26,6 +28,17 @@ STATES_TO_SKIP_USER_DATA=[
     ChatflowState.INTENT_GENERAL_FAQ_QUESTION,
 ]
 
+def _precomputed_answer(interaction_data: dict, answers: dict[str, str]) -> str | None:
+    """
+    Returns the answer precomputed for the category of the condition that
+    `question_condition_workflow` found in the index, see `src.jobs.batch_tasks`.
+    """
+    match = interaction_data.get("condition_match")
+    if not match or not settings.CONDITION_INDEX_ENABLED:
+        return None
+    return answers.get(match["category"])
+
+
 async def _send_message(
     _history_messages: list[InteractionMessage],
     _model: BaseChatModel,
@@ -60,7 +73,7 @@ async def intent_classification_workflow(
     practice_id = interaction_data.get("practice_id")
     if practice_id and history_messages:
         query = history_messages[-1].message
-        response, found = retrieve_data(query=query, practice_id=practice_id)
+        response, found = await retrieve_data(query=query, practice_id=practice_id, model=model)
         if found:
             interaction_data["embeddings_response"] = response
             return [], ChatflowState.REPLY_FROM_EMBEDDINGS, None, interaction_data
@@ -107,6 +120,18 @@ async def question_condition_workflow(
     model: BaseChatModel,
     _sheets_service: Optional[GoogleSheetsService],
 ) -> tuple[list[InteractionMessage], ChatflowState, str | None, dict]:
+    match = get_condition_index().match(history_messages) if settings.CONDITION_INDEX_ENABLED else None
+    if match:
+        # A listed condition is treated, the model is only asked about the others
+        logger.info(f"Condition '{match.condition}' found in the index ({match.category})")
+        interaction_data["condition_match"] = {
+            "condition": match.condition,
+            "category": match.category,
+            "doctor": match.doctor,
+        }
+        return [], ChatflowState.PROVIDE_CONDITION_INFORMATION, None, interaction_data
+    interaction_data.pop("condition_match", None)
+
     langchain_messages = get_langchain_history(history_messages)
     tool_results = await call_single_tool(
         langchain_messages, model, is_condition_treated, CHATFLOW_SYSTEM_PROMPT
@@ -126,10 +151,12 @@ async def provide_condition_information_workflow(
     model: BaseChatModel,
     _sheets_service: Optional[GoogleSheetsService],
 ) -> tuple[list[InteractionMessage], ChatflowState, str | None, dict]:
-    context = f"{INSTRUCTION_ANSWER_ABOUT_CONDITION}\n\n{CONDITIONS_DATA}"
-    response_text = await generate_response_text(
-        history_messages, model, CHATFLOW_SYSTEM_PROMPT, context=context
-    )
+    response_text = _precomputed_answer(interaction_data, get_condition_index().condition_answers)
+    if not response_text:
+        context = f"{INSTRUCTION_ANSWER_ABOUT_CONDITION}\n\n{CONDITIONS_DATA}"
+        response_text = await generate_response_text(
+            history_messages, model, CHATFLOW_SYSTEM_PROMPT, context=context
+        )
     interaction_data["condition_info_response"] = response_text
     return (
         [],
@@ -263,6 +290,7 @@ async def recommended_doctor_workflow(
     model: BaseChatModel,
     _sheets_service: Optional[GoogleSheetsService],
 ) -> tuple[list[InteractionMessage], ChatflowState, str | None, dict]:
+    # Always chosen by the model, as it also depends on where the user lives, e.g. in California
     langchain_messages = get_langchain_history(history_messages)
     tool_results = await call_single_tool(
         langchain_messages, model, send_doctor_information, CHATFLOW_SYSTEM_PROMPT
@@ -443,15 +471,24 @@ async def validate_state_workflow(
     valid = tool_results.get("is_valid_state", False)
     if valid:
         next_state = ChatflowState.BOOK_CALL_OFFER_ACCEPTED
-        return [], next_state, None, interaction_data
     else:
-        return await _send_message(
-            history_messages,
-            model,
-            PROMPT_INVALID_STATE,
-            ChatflowState.AWAITING_NEW_MESSAGE,
-            interaction_data,
-        )
+        next_state = ChatflowState.CUSTOMER_IN_NON_VALID_STATE
+    return [], next_state, None, interaction_data
+
+
+async def customer_in_non_valid_state_workflow(
+    history_messages: list[InteractionMessage],
+    interaction_data: dict,
+    model: BaseChatModel,
+    _sheets_service: Optional[GoogleSheetsService],
+) -> tuple[list[InteractionMessage], ChatflowState, str | None, dict]:
+    return await _send_message(
+        history_messages,
+        model,
+        PROMPT_INVALID_STATE,
+        ChatflowState.AWAITING_NEW_MESSAGE,
+        interaction_data,
+    )
 
 
 async def offer_book_call_workflow(
@@ -612,7 +649,7 @@ async def intent_mailing_list_workflow(
     response_message = InteractionMessage(
         role=InteractionType.MODEL, message=full_message
     )
-    full_conversation = history_messages + [response_message]
+    full_conversation = [*history_messages, response_message]
 
     await write_candidato_a_empleo_to_sheet(
         interaction_data=interaction_data,
@@ -651,3 +688,31 @@ async def goodbye_workflow(
         ChatflowState.FINAL,
         interaction_data,
     )
+
+
+WORKFLOWS = {
+    ChatflowState.IDLE: idle_workflow,
+    ChatflowState.CLASSIFYING_INTENT: intent_classification_workflow,
+    ChatflowState.INTENT_QUESTION_CONDITION: question_condition_workflow,
+    ChatflowState.PROVIDE_CONDITION_INFORMATION: provide_condition_information_workflow,
+    ChatflowState.ASK_USER_DATA: ask_user_data_workflow,
+    ChatflowState.INTENT_FRUSTRATED_CUSTOMER: frustrated_customer_workflow,
+    ChatflowState.INTENT_OUT_OF_SCOPE_QUESTION: out_of_scope_workflow,
+    ChatflowState.RECOMMENDED_DOCTOR: recommended_doctor_workflow,
+    ChatflowState.REPLY_FROM_EMBEDDINGS: reply_from_embeddings_workflow,
+    ChatflowState.CUSTOMER_ACKNOWLEDGES_RESPONSE: customer_acknowledges_workflow,
+    ChatflowState.CONDITION_NOT_TREATED_SEND_CONTACT_INFO: condition_not_treated_workflow,
+    ChatflowState.INTENT_EVENT_QUESTION: event_question_workflow,
+    ChatflowState.INTENT_GENERAL_FAQ_QUESTION: general_faq_question_workflow,
+    ChatflowState.INVALID_REQUEST_EMERGENCY: emergency_workflow,
+    ChatflowState.VALIDATE_STATE: validate_state_workflow,
+    ChatflowState.CUSTOMER_IN_NON_VALID_STATE: customer_in_non_valid_state_workflow,
+    ChatflowState.OFFER_BOOK_CALL: offer_book_call_workflow,
+    ChatflowState.AWAITING_NEW_MESSAGE: await_new_message_workflow,
+    ChatflowState.AWAITING_BOOK_CALL_OFFER_RESPONSE: await_book_call_response_workflow,
+    ChatflowState.BOOK_CALL_OFFER_DECLINED: book_call_declined_workflow,
+    ChatflowState.BOOK_CALL_OFFER_ACCEPTED: book_call_link_accepted_workflow,
+    ChatflowState.INTENT_MAILING_LIST: intent_mailing_list_workflow,
+    ChatflowState.INTENT_GOODBYE: goodbye_workflow,
+    ChatflowState.FINAL: final_workflow,
+}
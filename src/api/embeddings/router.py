@@ -1,17 +1,25 @@
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, status
+import tempfile
+from fastapi import APIRouter, HTTPException, Request, status
 
+from src.config import settings
 from src.services.embeddings import (
     delete_data_from_document,
     delete_data_from_qa_pair,
     delete_data_from_website,
+    delete_practice,
+    delete_sources,
     store_data_from_document,
     store_data_from_qa_pair,
+    store_data_from_site,
     store_data_from_website,
+    store_document_file,
     InvalidURLError,
 )
-from src.shared.enums import SourceType
+from src.shared.enums import DocType, SourceType
 from src.shared.schemas import (
+    BulkDeleteEmbeddingsRequest,
     CreateEmbeddingsRequest,
     CreateEmbeddingsResponse,
     DeleteEmbeddingsRequest,
@@ -32,7 +40,15 @@ async def create_embeddings(
         if not request.sourceData.webPageURL:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="webPageURL is required for WEB_PAGE source type")
         try:
-            store_data_from_website(request.sourceData.webPageURL, request.practiceId)
+            if request.sourceData.crawl:
+                pages, chunks = await store_data_from_site(
+                    request.sourceData.webPageURL, request.practiceId, request.sourceData.maxPages
+                )
+                return CreateEmbeddingsResponse(
+                    status="success",
+                    message=f"Embeddings created successfully from web site. {pages} pages and {chunks} chunks stored.",
+                )
+            await store_data_from_website(request.sourceData.webPageURL, request.practiceId)
             return CreateEmbeddingsResponse(status="success", message="Embeddings created successfully from web page.")
         except InvalidURLError as e:
             logger.error(f"Failed to create embeddings from invalid web page {request.sourceData.webPageURL} for practice {request.practiceId}: {e}", exc_info=True)
@@ -44,7 +60,7 @@ async def create_embeddings(
         if not request.sourceData.qa_pair:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="qa_pair is required for QA_PAIR source type")
         try:
-            store_data_from_qa_pair(request.sourceData.qa_pair, request.practiceId)
+            await store_data_from_qa_pair(request.sourceData.qa_pair, request.practiceId)
             return CreateEmbeddingsResponse(status="success", message="Embeddings created successfully from Q&A pair.")
         except Exception as e:
             logger.error(f"Failed to create embeddings from Q&A pair for practice {request.practiceId}: {e}", exc_info=True)
@@ -53,7 +69,7 @@ async def create_embeddings(
         if not request.sourceData.document or not request.sourceData.document.data or not request.sourceData.document.docType or not request.sourceData.document.name:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="document with data, docType and name is required for DOCUMENT source type")
         try:
-            store_data_from_document(request.sourceData.document, request.practiceId)
+            await store_data_from_document(request.sourceData.document, request.practiceId)
             return CreateEmbeddingsResponse(status="success", message="Embeddings created successfully from document.")
         except Exception as e:
             logger.error(f"Failed to create embeddings from document for practice {request.practiceId}: {e}", exc_info=True)
@@ -62,6 +78,46 @@ async def create_embeddings(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Source type '{request.sourceType.value}' not supported.")
 
 
+@router.post("/embeddings/documents", response_model=CreateEmbeddingsResponse)
+async def upload_document(
+    request: Request,
+    practiceId: str,
+    name: str,
+    docType: DocType,
+):
+    """
+    Creates embeddings from a document sent as the raw request body, e.g.
+    `curl --data-binary @notes.docx "/api/v1/embeddings/documents?practiceId=p1&name=notes.docx&docType=DOCX"`.
+
+    The body is written to a temporary file as it is received and the
+    document is processed from disk, so large documents are not held in memory.
+    """
+    logger.info(f"Received document upload '{name}' ({docType.value}) for practice {practiceId}")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.INGEST_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="The document is too large.")
+
+    with tempfile.NamedTemporaryFile(prefix="upload_", suffix=f".{docType.value.lower()}") as document_file:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.INGEST_MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="The document is too large.")
+            document_file.write(chunk)
+        document_file.flush()
+        if not size:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The request body must contain the document.")
+
+        try:
+            stored = await store_document_file(document_file.name, name, docType, practiceId)
+        except Exception as e:
+            logger.error(f"Failed to create embeddings from uploaded document {name} for practice {practiceId}: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while creating embeddings from the document.")
+
+    return CreateEmbeddingsResponse(status="success", message=f"Embeddings created successfully from document. {stored} chunks stored.")
+
+
 @router.delete("/embeddings", response_model=DeleteEmbeddingsResponse)
 async def delete_embeddings(
     request: DeleteEmbeddingsRequest,
@@ -109,3 +165,35 @@ async def delete_embeddings(
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while deleting embeddings from the document.")
     else:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Source type '{request.sourceType.value}' not supported.")
+
+
+@router.delete("/embeddings/bulk", response_model=DeleteEmbeddingsResponse)
+async def delete_embeddings_bulk(
+    request: BulkDeleteEmbeddingsRequest,
+):
+    """
+    Deletes many sources of a practice at once, or all of them with `allSources`.
+    """
+    logger.info(f"Received bulk delete embeddings request: {request.model_dump_json(indent=2)}")
+
+    if not request.allSources and not (request.documentNames or request.questions or request.webPageURLs):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At least one source, or allSources, is required")
+    try:
+        if request.allSources:
+            deleted_count = await asyncio.to_thread(delete_practice, request.practiceId)
+        else:
+            deleted_count = await asyncio.to_thread(
+                delete_sources,
+                request.practiceId,
+                document_names=request.documentNames,
+                questions=request.questions,
+                websites=request.webPageURLs,
+            )
+        return DeleteEmbeddingsResponse(
+            status="success",
+            message=f"Deletion successful. {deleted_count} documents removed.",
+            deleted_count=deleted_count,
+        )
+    except Exception as e:
+        logger.error(f"Failed to delete embeddings in bulk for practice {request.practiceId}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while deleting embeddings.")
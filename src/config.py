@@ -10,6 +10,32 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     OPENAI_MODEL: str
     GEMINI_MODEL: str
+    # Secondary model, used when OpenAI is slow or failing. Disabled without a key.
+    GEMINI_API_KEY: Optional[str] = None
+    GEMINI_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+    # Model calls
+    LLM_TIMEOUT: float = 20  # Seconds a model call may take, including a hedged or fallback call
+    LLM_TOOL_TIMEOUTS: Dict[str, float] = {}  # Per tool (or "generate_response_text") overrides of LLM_TIMEOUT
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_QUANTILE: float = 0.95  # Latency of recent calls after which the secondary model is also called
+    LLM_HEDGE_MIN_DELAY: float = 1.0  # Seconds
+    LLM_CIRCUIT_FAILURES: int = 5  # Consecutive failures before a model is skipped
+    LLM_CIRCUIT_RESET: float = 30  # Seconds before a skipped model is tried again
+    # Adaptive limit of concurrent calls to each model
+    LLM_CONCURRENCY_INITIAL: int = 16
+    LLM_CONCURRENCY_MIN: int = 2
+    LLM_CONCURRENCY_MAX: int = 128
+    LLM_TOKENS_PER_MINUTE: int = 0  # Token budget of each model, 0 for none
+    LLM_QUEUE_TIMEOUT: float = 5  # Seconds a call may wait for capacity before the request is rejected with 503
+    # Identical concurrent model calls share one request
+    LLM_COALESCE_ENABLED: bool = True
+    LLM_COALESCE_TTL: float = 1.0  # Seconds a shared answer is also given to identical calls arriving after it
+    LLM_COALESCE_MAX_KEYS: int = 1024
+    # Offline model jobs, see src/jobs/llm_batch.py
+    LLM_BATCH_CHUNK_SIZE: int = 500  # Requests per provider batch
+    LLM_BATCH_POLL_INTERVAL: float = 60  # Seconds between checks of running batches
+    LLM_BATCH_LOCAL_CONCURRENCY: int = 4  # Concurrent model calls with --local
 
     # Database
     POSTGRES_HOST: str
@@ -41,6 +67,27 @@ class Settings(BaseSettings):
             return v.strip('"')
         return v
 
+    # Database connection pool
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800  # Seconds, -1 to never recycle connections
+    DB_POOL_PRE_PING: bool = False
+    DB_STATEMENT_CACHE_SIZE: int = 500  # Prepared statements per connection, 0 behind PgBouncer
+
+    # Startup
+    WARMUP_ENABLED: bool = True  # Initialize clients and models before reporting ready, see src/services/warmup.py
+
+    # Session cache
+    SESSION_CACHE_BACKEND: str = "memory"  # "memory", "redis" or "none"
+    SESSION_CACHE_MAX_SIZE: int = 10000
+    SESSION_CACHE_TTL: int = 900  # Seconds
+    SESSION_CACHE_REDIS_URL: Optional[str] = None
+
+    # Archival of idle sessions, see src/jobs/archive_interactions.py
+    ARCHIVE_IDLE_DAYS: int = 30
+    ARCHIVE_BATCH_SIZE: int = 500
+
     # Google Sheets
     GOOGLE_SA_TYPE: str = "service_account"
     GOOGLE_SA_PROJECT_ID: str
@@ -57,12 +104,53 @@ class Settings(BaseSettings):
     # Firecrawl
     FIRECRAWL_API_KEY: Optional[str] = None
 
+    # Site crawls
+    CRAWL_MAX_PAGES: int = 100
+    CRAWL_CONCURRENCY: int = 4  # Pages fetched at a time by each crawl
+    CRAWL_HOST_REQUESTS_PER_SECOND: float = 2.0  # Unless robots.txt asks for a longer crawl delay
+    CRAWL_TIMEOUT: float = 15  # Seconds
+    CRAWL_USER_AGENT: str = "LindenBot/1.0"
+    CRAWL_DUPLICATE_THRESHOLD: float = 0.9  # Estimated similarity above which a page is a near-duplicate
+    CRAWL_BOILERPLATE_SHARE: float = 0.5  # Share of the pages a block of text is found on to be boilerplate
+
+    # Document ingestion
+    INGEST_BATCH_SIZE: int = 64  # Chunks embedded and added to the vector store at a time
+    INGEST_MAX_UPLOAD_BYTES: int = 100 * 1024 * 1024
+    INGEST_EMBED_CONCURRENCY: int = 8  # Concurrent embedding calls of the process
+    INGEST_EMBED_TOKENS_PER_MINUTE: int = 1_000_000  # Token budget of the embedding model, 0 for none
+    INGEST_EMBED_QUEUE_TIMEOUT: float = 300  # Seconds a batch may wait for capacity before the ingestion fails
+    INGEST_STORE_CONCURRENCY: int = 2  # Concurrent vector store writes of each ingestion job
+    INGEST_VERSIONED_WRITES: bool = True  # Delete the previous chunks of a source in the background once the new ones are stored
+
+    # Retrieval, see src/services/retrieval.py
+    RETRIEVAL_FETCH_K: int = 12  # Chunks fetched by the similarity search before re-ranking
+    RETRIEVAL_TOP_K: int = 3  # Chunks given to the model as context
+    RETRIEVAL_RERANKER: str = "lexical"  # "lexical", "cross_encoder" or "none"
+    RETRIEVAL_CROSS_ENCODER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L6-v2"  # Hugging Face model with an ONNX export
+    RETRIEVAL_CACHE_SIZE: int = 10000  # Re-ranked queries cached, 0 for none
+    RETRIEVAL_CACHE_TTL: int = 600  # Seconds
+
     # Chroma Cloud
     CHROMA_CLOUD_API_KEY: Optional[str] = None
     CHROMA_CLOUD_TENANT: Optional[str] = None
     CHROMA_CLOUD_DATABASE: Optional[str] = None
     CHROMA_CLOUD_COLLECTION: Optional[str] = None
+    CHROMA_COLLECTION_PER_PRACTICE: bool = False  # One collection per practice, see src/jobs/reshard_vector_store.py
+    CHROMA_COLLECTION_CACHE_SIZE: int = 256  # Handles of practice collections kept open
+
+    # Chatflow
+    CHATFLOW_GRAPH_PATH: str = "logic.yaml"
+    # Answer questions about listed conditions without the model, see src/api/chatflow/conditions.py
+    CONDITION_INDEX_ENABLED: bool = True
+
+    # Tracing
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "otlp"  # "otlp" or "file"
+    TRACING_OTLP_ENDPOINT: Optional[str] = None
+    TRACING_FILE_PATH: str = "traces.jsonl"
 
+    # Metrics
+    METRICS_ENABLED: bool = False
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
@@ -0,0 +1,269 @@
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import Row, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ArchivedInteraction, Interaction, LLMBatchChunk, LLMBatchResult, PracticeStateDaily
+
+
+class StaleSessionError(ValueError):
+    """Custom exception for a write based on an outdated version of an interaction."""
+    pass
+
+
+async def get_interaction(db: AsyncSession, session_id: str) -> Optional[Row]:
+    """
+    Loads the columns of an interaction needed to continue a conversation.
+
+    Columns are selected directly, so rows are returned as plain tuples
+    without building ORM objects or tracking them in the session.
+
+    Returns:
+        A row with `practice_id`, `messages`, `states`, `interaction_data` and
+        `version`, or None if the session does not exist.
+    """
+    result = await db.execute(
+        select(
+            Interaction.practice_id,
+            Interaction.messages,
+            Interaction.states,
+            Interaction.interaction_data,
+            Interaction.version,
+        ).where(Interaction.session_id == session_id)
+    )
+    return result.one_or_none()
+
+
+async def save_interaction(
+    db: AsyncSession,
+    session_id: str,
+    practice_id: Optional[str],
+    messages: List[Dict[str, Any]],
+    states: List[str],
+    interaction_data: Optional[Dict[str, Any]],
+    expected_version: Optional[int],
+    reached_states: Sequence[str] = (),
+) -> tuple[List[str], int]:
+    """
+    Inserts or updates an interaction in a single statement and commits it.
+    A practice id that is already stored is never overwritten.
+
+    The write only succeeds if the stored version still matches the version
+    the turn was computed from. Use None for a session that did not exist.
+
+    `reached_states` are the states the session reached for the first time
+    in this turn. They are counted in `practice_state_daily` in the same
+    transaction.
+
+    Returns:
+        The states and the new version stored for the session.
+
+    Raises:
+        StaleSessionError: If the interaction was written since it was read.
+    """
+    stmt = insert(Interaction).values(
+        session_id=session_id,
+        practice_id=practice_id,
+        messages=messages,
+        states=states,
+        interaction_data=interaction_data,
+        version=1,
+    )
+    if expected_version is None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Interaction.session_id])
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Interaction.session_id],
+            set_={
+                "practice_id": func.coalesce(Interaction.practice_id, stmt.excluded.practice_id),
+                "messages": stmt.excluded.messages,
+                "states": stmt.excluded.states,
+                "interaction_data": stmt.excluded.interaction_data,
+                "version": Interaction.version + 1,
+                "last_active_at": func.now(),
+            },
+            where=Interaction.version == expected_version,
+        )
+    stmt = stmt.returning(Interaction.states, Interaction.version)
+
+    result = await db.execute(stmt)
+    row = result.one_or_none()
+    if row is None:
+        await db.rollback()
+        raise StaleSessionError(
+            f"Interaction '{session_id}' changed since version {expected_version} was read."
+        )
+    if reached_states:
+        await db.execute(_count_reached_states(practice_id, reached_states))
+    await db.commit()
+    return row.states, row.version
+
+
+def _count_reached_states(practice_id: Optional[str], states: Sequence[str]):
+    day = datetime.now(timezone.utc).date()
+    # Sorted so that concurrent turns lock the rows of a practice in the same order
+    stmt = insert(PracticeStateDaily).values([
+        {"practice_id": practice_id or "", "day": day, "state": state, "sessions": 1}
+        for state in sorted(set(states))
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[PracticeStateDaily.practice_id, PracticeStateDaily.day, PracticeStateDaily.state],
+        set_={"sessions": PracticeStateDaily.sessions + stmt.excluded.sessions},
+    )
+
+
+async def get_state_counts(
+    db: AsyncSession,
+    practice_id: str,
+    start: date,
+    end: date,
+    states: Optional[Sequence[str]] = None,
+) -> List[Row]:
+    """
+    Loads the daily number of sessions of a practice that reached each state,
+    between `start` and `end` inclusive.
+
+    Returns:
+        Rows with `day`, `state` and `sessions`, ordered by day and state.
+    """
+    stmt = select(
+        PracticeStateDaily.day, PracticeStateDaily.state, PracticeStateDaily.sessions
+    ).where(
+        PracticeStateDaily.practice_id == practice_id,
+        PracticeStateDaily.day.between(start, end),
+    )
+    if states:
+        stmt = stmt.where(PracticeStateDaily.state.in_(states))
+    result = await db.execute(stmt.order_by(PracticeStateDaily.day, PracticeStateDaily.state))
+    return list(result.all())
+
+
+async def get_state_totals(
+    db: AsyncSession, practice_id: str, start: date, end: date
+) -> Dict[str, int]:
+    """
+    Returns the number of sessions of a practice that reached each state between `start` and `end` inclusive.
+    """
+    result = await db.execute(
+        select(PracticeStateDaily.state, func.sum(PracticeStateDaily.sessions))
+        .where(
+            PracticeStateDaily.practice_id == practice_id,
+            PracticeStateDaily.day.between(start, end),
+        )
+        .group_by(PracticeStateDaily.state)
+    )
+    return {state: int(sessions) for state, sessions in result.all()}
+
+
+async def archive_idle_interactions(
+    db: AsyncSession, idle_before: datetime, batch_size: int
+) -> int:
+    """
+    Moves up to `batch_size` interactions last active before `idle_before`
+    to `interactions_archive` in a single statement and commits it.
+    Interactions locked by a turn in progress are skipped.
+
+    Returns:
+        The number of interactions archived.
+    """
+    columns = [
+        "session_id",
+        "practice_id",
+        "messages",
+        "states",
+        "interaction_data",
+        "version",
+        "created_at",
+        "last_active_at",
+    ]
+    idle = (
+        select(Interaction.session_id)
+        .where(Interaction.last_active_at < idle_before)
+        .order_by(Interaction.last_active_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    moved = (
+        delete(Interaction)
+        .where(Interaction.session_id.in_(idle.scalar_subquery()))
+        .returning(*[Interaction.__table__.c[name] for name in columns])
+        .cte("moved")
+    )
+    stmt = (
+        insert(ArchivedInteraction)
+        .from_select(columns, select(*[moved.c[name] for name in columns]))
+        .returning(ArchivedInteraction.session_id)
+    )
+
+    result = await db.execute(stmt)
+    archived = len(result.all())
+    await db.commit()
+    return archived
+
+
+async def get_batch_result_versions(db: AsyncSession, kind: str) -> Dict[str, Optional[int]]:
+    """
+    Returns the key of every item with a result of an offline model job of
+    `kind`, with the version of the session the result was computed from.
+    """
+    result = await db.execute(
+        select(LLMBatchResult.item_key, LLMBatchResult.source_version).where(LLMBatchResult.kind == kind)
+    )
+    return dict(result.all())
+
+
+async def get_batch_results(db: AsyncSession, kinds: Sequence[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Loads the results of offline model jobs of the given kinds.
+
+    Returns:
+        The results by kind and item key.
+    """
+    result = await db.execute(
+        select(LLMBatchResult.kind, LLMBatchResult.item_key, LLMBatchResult.result)
+        .where(LLMBatchResult.kind.in_(kinds))
+    )
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {kind: {} for kind in kinds}
+    for kind, item_key, row in result.all():
+        results[kind][item_key] = row
+    return results
+
+
+async def save_batch_results(
+    db: AsyncSession,
+    job_id: str,
+    chunk_index: int,
+    kind: str,
+    model: str,
+    results: List[Dict[str, Any]],
+    error: Optional[str] = None,
+) -> None:
+    """
+    Upserts the results of a chunk of an offline model job and marks the
+    chunk done in the same transaction, then commits.
+
+    `results` are dicts with `item_key`, `result` and `source_version`.
+    `error` describes the requests of the chunk that had no result.
+    """
+    # Kept well below the limit of bind parameters per statement
+    for start in range(0, len(results), 1000):
+        stmt = insert(LLMBatchResult).values([
+            {"kind": kind, "model": model, **row} for row in results[start:start + 1000]
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[LLMBatchResult.kind, LLMBatchResult.item_key],
+            set_={
+                "result": stmt.excluded.result,
+                "model": stmt.excluded.model,
+                "source_version": stmt.excluded.source_version,
+                "updated_at": func.now(),
+            },
+        ))
+    await db.execute(
+        update(LLMBatchChunk)
+        .where(LLMBatchChunk.job_id == job_id, LLMBatchChunk.chunk_index == chunk_index)
+        .values(status="done", error=error)
+    )
+    await db.commit()
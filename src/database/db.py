@@ -1,14 +1,54 @@
 import sys
 import logging
+import time
+
+import orjson
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.config import settings
+from src.shared.utils.metrics import observe_pool_checkout
 
 logger = logging.getLogger(__name__)
 
-engine = create_async_engine(str(settings.DATABASE_URL), pool_pre_ping=True)
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    Connection pool that records how long each checkout waits for a connection.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            observe_pool_checkout(time.perf_counter() - started)
+
+
+def _json_serializer(value) -> str:
+    return orjson.dumps(value).decode()
+
+
+engine = create_async_engine(
+    str(settings.DATABASE_URL),
+    poolclass=TimedAsyncQueuePool if settings.METRICS_ENABLED else AsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    # orjson encodes and decodes the JSONB columns, mostly the message history
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
+    connect_args={
+        # Cache of prepared statements kept by SQLAlchemy for each asyncpg connection
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        # asyncpg's own statement cache, disabled along with it for PgBouncer
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    },
+)
 
 AsyncSessionFactory = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, Boolean
+from sqlalchemy import Column, String, JSON, Boolean, Integer, Date, DateTime, Index, PrimaryKeyConstraint, func
 from sqlalchemy.dialects.postgresql import JSONB
 
 from .db import Base
@@ -10,9 +10,103 @@ class Interaction(Base):
     """
 
     __tablename__ = "interactions"
+    __table_args__ = (
+        # Ad-hoc queries on the states a session went through, e.g. `states @> '["INTENT_MAILING_LIST"]'`
+        Index(
+            "ix_interactions_states",
+            "states",
+            postgresql_using="gin",
+            postgresql_ops={"states": "jsonb_path_ops"},
+        ),
+    )
 
     session_id = Column(String, primary_key=True, index=True)
     practice_id = Column(String, index=True, nullable=True)
     messages = Column(JSONB, nullable=False)
     states = Column(JSONB, nullable=False, server_default='["IDLE"]')
     interaction_data = Column(JSON, nullable=True)
+    # Incremented on every write, used to detect stale cached sessions
+    version = Column(Integer, nullable=False, server_default="0")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_active_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
+class ArchivedInteraction(Base):
+    """
+    A conversation moved out of `interactions` after being idle, see `src.jobs.archive_interactions`.
+
+    The table is partitioned by month of `archived_at`, so old archives can be
+    detached, dumped and dropped without touching the live table.
+    """
+
+    __tablename__ = "interactions_archive"
+    __table_args__ = (
+        PrimaryKeyConstraint("session_id", "archived_at"),
+        {"postgresql_partition_by": "RANGE (archived_at)"},
+    )
+
+    session_id = Column(String, nullable=False)
+    practice_id = Column(String, index=True, nullable=True)
+    messages = Column(JSONB, nullable=False)
+    states = Column(JSONB, nullable=False)
+    interaction_data = Column(JSON, nullable=True)
+    version = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    last_active_at = Column(DateTime(timezone=True), nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class PracticeStateDaily(Base):
+    """
+    Number of sessions of a practice that reached a chatflow state for the
+    first time on a given day (UTC). Updated by every turn that reaches new
+    states, so analytics never scan `interactions`.
+    """
+
+    __tablename__ = "practice_state_daily"
+
+    # Empty for sessions without a practice
+    practice_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    state = Column(String, primary_key=True)
+    sessions = Column(Integer, nullable=False, server_default="0")
+
+
+class LLMBatchChunk(Base):
+    """
+    A chunk of the model requests of an offline job, see `src.jobs.llm_batch`.
+
+    Each chunk is sent as one provider batch. Its results are saved in the
+    same transaction that marks it done, so an interrupted job resumes
+    from the chunks that are not done yet.
+    """
+
+    __tablename__ = "llm_batch_chunks"
+
+    job_id = Column(String, primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    # [{"custom_id", "body", "source_version", "extra"}], `body` being a chat completions request
+    requests = Column(JSONB, nullable=False)
+    # "pending", "submitted", "done" or "failed"
+    status = Column(String, nullable=False, server_default="pending")
+    provider_batch_id = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+class LLMBatchResult(Base):
+    """
+    The latest result of an offline model job for an item, e.g. the summary of a session.
+    """
+
+    __tablename__ = "llm_batch_results"
+
+    kind = Column(String, primary_key=True)
+    item_key = Column(String, primary_key=True)
+    result = Column(JSONB, nullable=False)
+    model = Column(String, nullable=False)
+    # Version of the session the result was computed from, None for items that are not sessions
+    source_version = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,114 @@
+"""
+Moves sessions that have been idle for `ARCHIVE_IDLE_DAYS` from
+`interactions` to the `interactions_archive` table.
+
+The chatflow only reads and writes `interactions`, which this job keeps
+down to the sessions that are still active. The archive is partitioned by
+month of archival: each month is a separate table that can be detached,
+dumped and dropped on its own. A message for an archived session starts
+a new conversation.
+
+Usage:
+    python -m src.jobs.archive_interactions --idle-days 30 --batch-size 500
+    python -m src.jobs.archive_interactions --dry-run
+
+Each batch is committed on its own, so the job can be stopped at any time
+and run again. Run it periodically, e.g. daily from cron.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+
+from src.config import settings
+from src.database.crud import archive_idle_interactions
+from src.database.db import AsyncSessionFactory, engine
+from src.database.models import Interaction
+
+logger = logging.getLogger(__name__)
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+async def ensure_archive_partitions(now: datetime) -> None:
+    """
+    Creates the archive partitions for the current and the next month if they do not exist.
+    """
+    month = _month_start(now)
+    async with engine.begin() as conn:
+        for _ in range(2):
+            end = _next_month(month)
+            # Rows larger than 128 bytes are compressed and moved out of line
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS interactions_archive_{month:%Y_%m} "
+                f"PARTITION OF interactions_archive "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}') "
+                f"WITH (toast_tuple_target = 128)"
+            ))
+            month = end
+
+
+async def archive_interactions(idle_days: int, batch_size: int, dry_run: bool = False) -> int:
+    """
+    Archives every interaction idle for more than `idle_days`, in batches of `batch_size`.
+
+    Returns:
+        The number of interactions archived, or that would be archived with `dry_run`.
+    """
+    now = datetime.now(timezone.utc)
+    idle_before = now - timedelta(days=idle_days)
+
+    if dry_run:
+        async with AsyncSessionFactory() as db:
+            idle = await db.scalar(
+                select(func.count()).where(Interaction.last_active_at < idle_before)
+            )
+        logger.info(f"{idle} interactions idle since before {idle_before.isoformat()}")
+        return idle
+
+    await ensure_archive_partitions(now)
+
+    total = 0
+    async with AsyncSessionFactory() as db:
+        while True:
+            archived = await archive_idle_interactions(db, idle_before, batch_size)
+            total += archived
+            if archived:
+                logger.info(f"Archived {archived} interactions ({total} so far)")
+            if archived < batch_size:
+                break
+
+    logger.info(f"Archived {total} interactions idle since before {idle_before.isoformat()}")
+    return total
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Move idle sessions to the interactions archive.")
+    parser.add_argument("--idle-days", type=int, default=settings.ARCHIVE_IDLE_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the idle sessions.")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    try:
+        await archive_interactions(args.idle_days, args.batch_size, args.dry_run)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=settings.LOG_LEVEL.upper(),
+        format="%(levelname)s:%(name)s: [%(funcName)s] - %(message)s",
+    )
+    asyncio.run(main())
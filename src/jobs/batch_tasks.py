@@ -0,0 +1,156 @@
+"""
+The kinds of offline model work run by `src.jobs.llm_batch`.
+
+A task lists the items to process, each with the messages to send to the
+model, and optionally the tool the model must call. The arguments of the
+tool call, or the text of the answer for tasks without a tool, are the
+result stored for the item in `llm_batch_results`.
+"""
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.tools import BaseTool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.api.chatflow.conditions import treated_conditions
+from src.api.chatflow.knowledge_data import CONDITIONS_DATA, EVENTS_DATA, FAQ_DATA
+from src.api.chatflow.prompts import (
+    CHATFLOW_SYSTEM_PROMPT,
+    INSTRUCTION_CATEGORY_CONDITION_ANSWER,
+    INSTRUCTION_SUMMARIZE_CONVERSATION,
+)
+from src.api.chatflow.tools import classify_intent, send_doctor_information
+from src.database.models import ArchivedInteraction, Interaction
+from src.shared.enums import InteractionType
+from src.shared.utils.history import decode_messages, get_langchain_history
+
+# Rows read at a time when listing sessions
+_SESSIONS_PER_FETCH = 500
+
+
+@dataclass
+class BatchItem:
+    """
+    One model request of a job. `extra` is stored with the result.
+    """
+    key: str
+    messages: List[BaseMessage]
+    source_version: Optional[int] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class BatchTask:
+    kind: str
+    items: Callable[[AsyncSession], AsyncIterator[BatchItem]]
+    tool: Optional[BaseTool] = None
+
+
+async def doctor_recommendation_items(_db: AsyncSession) -> AsyncIterator[BatchItem]:
+    """
+    The doctor recommended for each condition listed in `CONDITIONS_DATA`.
+    """
+    for category, conditions in treated_conditions().items():
+        for condition in conditions:
+            yield BatchItem(
+                key=f"{category}/{condition}",
+                messages=[
+                    SystemMessage(content=CHATFLOW_SYSTEM_PROMPT),
+                    HumanMessage(content=f"I would like help with {condition}."),
+                ],
+                extra={"category": category, "condition": condition},
+            )
+
+
+def _category_items(context: str) -> List[BatchItem]:
+    return [
+        BatchItem(
+            key=category,
+            messages=[
+                SystemMessage(content=f"{CHATFLOW_SYSTEM_PROMPT}\n\n## Context\n{context}"),
+                HumanMessage(content=f"{category}: {', '.join(conditions)}"),
+            ],
+            extra={"category": category},
+        )
+        for category, conditions in treated_conditions().items()
+    ]
+
+
+async def condition_answer_items(_db: AsyncSession) -> AsyncIterator[BatchItem]:
+    """
+    The answer to a question about a treated condition, for each category of
+    `CONDITIONS_DATA`. Used instead of the model by `provide_condition_information_workflow`.
+    """
+    for item in _category_items(f"{INSTRUCTION_CATEGORY_CONDITION_ANSWER}\n\n{CONDITIONS_DATA}"):
+        yield item
+
+
+async def summary_items(db: AsyncSession) -> AsyncIterator[BatchItem]:
+    """
+    A summary of each active session, for the CRM export.
+    """
+    rows = await db.stream(
+        select(Interaction.session_id, Interaction.messages, Interaction.version)
+        .execution_options(yield_per=_SESSIONS_PER_FETCH)
+    )
+    async for session_id, messages, version in rows:
+        # The transcript is sent as one message, so the model does not continue the conversation
+        transcript = "\n".join(
+            f"{msg.role.value}: {msg.message}"
+            for msg in decode_messages(messages)
+            if msg.role != InteractionType.TOOL and msg.message
+        )
+        if not transcript:
+            continue
+        yield BatchItem(
+            key=session_id,
+            messages=[
+                SystemMessage(content=INSTRUCTION_SUMMARIZE_CONVERSATION),
+                HumanMessage(content=transcript),
+            ],
+            source_version=version,
+        )
+
+
+async def reclassification_items(db: AsyncSession) -> AsyncIterator[BatchItem]:
+    """
+    The intent that started each archived session, classified again with the current prompts.
+    """
+    context = f"## Events Information\n{EVENTS_DATA}\n\n## FAQ Information\n{FAQ_DATA}"
+    system_prompt = f"{CHATFLOW_SYSTEM_PROMPT}\n\n## Context\n{context}"
+    rows = await db.stream(
+        select(
+            ArchivedInteraction.session_id,
+            ArchivedInteraction.archived_at,
+            ArchivedInteraction.messages,
+            ArchivedInteraction.version,
+        ).execution_options(yield_per=_SESSIONS_PER_FETCH)
+    )
+    async for session_id, archived_at, messages, version in rows:
+        history = decode_messages(messages)
+        first_user_message = next(
+            (i for i, msg in enumerate(history) if msg.role == InteractionType.USER), None
+        )
+        if first_user_message is None:
+            continue
+        yield BatchItem(
+            key=f"{session_id}@{archived_at.isoformat()}",
+            messages=[
+                SystemMessage(content=system_prompt),
+                *get_langchain_history(history[:first_user_message + 1]),
+            ],
+            source_version=version,
+        )
+
+
+BATCH_TASKS: Dict[str, BatchTask] = {
+    task.kind: task
+    for task in (
+        BatchTask("doctor_recommendation", doctor_recommendation_items, send_doctor_information),
+        BatchTask("condition_answer", condition_answer_items),
+        BatchTask("summary", summary_items),
+        BatchTask("reclassification", reclassification_items, classify_intent),
+    )
+}
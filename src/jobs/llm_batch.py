@@ -0,0 +1,359 @@
+"""
+Runs offline model work through the OpenAI Batch API: doctor
+recommendations for every treated condition, the answers to questions
+about conditions used by the chatflow, summaries of sessions for the CRM,
+and re-classification of archived sessions. See `batch_tasks.py`.
+
+Batches run on their own quota at a lower price and within 24 hours, so
+this work never takes from the rate limits of the chatflow. Items are
+split into chunks of `--chunk-size` requests, each sent as one batch and
+saved to `llm_batch_chunks` before it is sent. The results of a chunk are
+written to `llm_batch_results` in the same transaction that marks it done.
+
+With `--local`, chunks are sent to the chat model with concurrent requests
+instead, for development or providers without a batch API.
+
+Usage:
+    python -m src.jobs.llm_batch summary
+    python -m src.jobs.llm_batch doctor_recommendation --local
+    python -m src.jobs.llm_batch reclassification --job-id reclassification-20261019
+
+Items that already have an up to date result are skipped, unless
+`--refresh` is given. An interrupted job resumes when it is run again with
+the same `--job-id`: chunks already sent are polled instead of being sent
+again, and failed chunks are sent again.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from langchain_core.messages import AIMessage, convert_to_messages, convert_to_openai_messages
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from openai import AsyncOpenAI
+from sqlalchemy import func, select, update
+
+from src.config import settings
+from src.database.crud import get_batch_result_versions, save_batch_results
+from src.database.db import AsyncSessionFactory, engine
+from src.database.models import LLMBatchChunk
+from src.jobs.batch_tasks import BATCH_TASKS, BatchItem, BatchTask
+from src.services.llm import get_chat_model
+from src.shared.utils.functions import get_model_name
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+PENDING, SUBMITTED, DONE, FAILED = "pending", "submitted", "done", "failed"
+# Provider batch statuses after which a batch does not change anymore
+FINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_request(task: BatchTask, item: BatchItem) -> Dict[str, Any]:
+    body = {
+        "model": settings.OPENAI_MODEL,
+        "messages": convert_to_openai_messages(item.messages),
+        "temperature": 0,
+    }
+    if task.tool is not None:
+        body["tools"] = [convert_to_openai_tool(task.tool)]
+        body["tool_choice"] = {"type": "function", "function": {"name": task.tool.name}}
+    return {
+        "custom_id": item.key,
+        "body": body,
+        "source_version": item.source_version,
+        "extra": item.extra,
+    }
+
+
+def build_result(
+    task: BatchTask, request: Dict[str, Any], content: Any, tool_args: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Returns the row to store for the answer to a request, or None if the answer is not usable.
+    """
+    if task.tool is None:
+        if not content:
+            return None
+        result = {"content": content}
+    else:
+        if tool_args is None:
+            return None
+        try:
+            # Validates the arguments, e.g. that an intent is one of the known ones
+            task.tool.invoke(tool_args)
+        except Exception as e:
+            logger.warning(f"Invalid arguments for {task.tool.name} in {request['custom_id']}: {e}")
+            return None
+        result = tool_args
+    return {
+        "item_key": request["custom_id"],
+        "result": {**request["extra"], **result},
+        "source_version": request["source_version"],
+    }
+
+
+async def plan_job(task: BatchTask, job_id: str, chunk_size: int, refresh: bool) -> int:
+    """
+    Saves the requests of a new job in chunks of `chunk_size`.
+
+    Returns:
+        The number of requests.
+    """
+    async with AsyncSessionFactory() as db:
+        existing = {} if refresh else await get_batch_result_versions(db, task.kind)
+
+    chunks = 0
+    requests: List[Dict[str, Any]] = []
+    total = 0
+
+    async def save_chunk() -> None:
+        nonlocal chunks
+        async with AsyncSessionFactory() as db:
+            db.add(LLMBatchChunk(job_id=job_id, chunk_index=chunks, kind=task.kind, requests=requests))
+            await db.commit()
+        chunks += 1
+
+    # Items are read on their own connection, which streams the rows
+    async with AsyncSessionFactory() as db:
+        async for item in task.items(db):
+            if item.key in existing and (
+                item.source_version is None
+                or (existing[item.key] or 0) >= item.source_version
+            ):
+                continue
+            requests.append(build_request(task, item))
+            total += 1
+            if len(requests) == chunk_size:
+                await save_chunk()
+                requests = []
+    if requests:
+        await save_chunk()
+
+    logger.info(f"Job {job_id}: {total} {task.kind} requests in {chunks} chunks")
+    return total
+
+
+async def set_chunk_status(chunk: LLMBatchChunk, status: str, **values: Any) -> None:
+    async with AsyncSessionFactory() as db:
+        await db.execute(
+            update(LLMBatchChunk)
+            .where(LLMBatchChunk.job_id == chunk.job_id, LLMBatchChunk.chunk_index == chunk.chunk_index)
+            .values(status=status, **values)
+        )
+        await db.commit()
+
+
+async def save_chunk_results(
+    task: BatchTask, chunk: LLMBatchChunk, model: str, answers: Dict[str, Tuple[Any, Optional[Dict[str, Any]]]]
+) -> int:
+    """
+    Saves the usable answers of a chunk, by custom id, and marks the chunk done.
+
+    Returns:
+        The number of results saved.
+    """
+    results = []
+    for request in chunk.requests:
+        content, tool_args = answers.get(request["custom_id"], (None, None))
+        row = build_result(task, request, content, tool_args)
+        if row is not None:
+            results.append(row)
+
+    missing = len(chunk.requests) - len(results)
+    # Requests without a result are sent again by the next job
+    error = f"{missing} of {len(chunk.requests)} requests have no result" if missing else None
+    async with AsyncSessionFactory() as db:
+        await save_batch_results(db, chunk.job_id, chunk.chunk_index, task.kind, model, results, error)
+    logger.info(
+        f"Job {chunk.job_id}: chunk {chunk.chunk_index} done, {len(results)} results"
+        + (f", {missing} failed" if missing else "")
+    )
+    return len(results)
+
+
+async def run_chunk_locally(task: BatchTask, chunk: LLMBatchChunk, concurrency: int) -> int:
+    model = get_chat_model()
+    if task.tool is not None:
+        model = model.bind_tools([task.tool], tool_choice=task.tool.name)
+    messages = [convert_to_messages(request["body"]["messages"]) for request in chunk.requests]
+    responses = await model.abatch(
+        messages, config={"max_concurrency": concurrency}, return_exceptions=True
+    )
+
+    answers = {}
+    for request, response in zip(chunk.requests, responses):
+        if not isinstance(response, AIMessage):
+            logger.warning(f"Request {request['custom_id']} failed: {response}")
+            continue
+        tool_args = response.tool_calls[0]["args"] if response.tool_calls else None
+        answers[request["custom_id"]] = (response.content, tool_args)
+    return await save_chunk_results(task, chunk, get_model_name(get_chat_model()), answers)
+
+
+async def submit_chunk(client: AsyncOpenAI, chunk: LLMBatchChunk) -> None:
+    lines = [
+        orjson.dumps({
+            "custom_id": request["custom_id"],
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": request["body"],
+        })
+        for request in chunk.requests
+    ]
+    batch_file = await client.files.create(
+        file=(f"{chunk.job_id}-{chunk.chunk_index}.jsonl", b"\n".join(lines)),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"job_id": chunk.job_id, "chunk_index": str(chunk.chunk_index)},
+    )
+    await set_chunk_status(chunk, SUBMITTED, provider_batch_id=batch.id, error=None)
+    chunk.status, chunk.provider_batch_id = SUBMITTED, batch.id
+    logger.info(f"Job {chunk.job_id}: chunk {chunk.chunk_index} submitted as batch {batch.id}")
+
+
+def parse_batch_output(raw: bytes) -> Tuple[Optional[str], Dict[str, Tuple[Any, Optional[Dict[str, Any]]]]]:
+    """
+    Returns the model and the answers, by custom id, of the output file of a batch.
+    """
+    model = None
+    answers = {}
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Request {record['custom_id']} failed: {record.get('error') or response}")
+            continue
+        model = model or response["body"].get("model")
+        message = response["body"]["choices"][0]["message"]
+        tool_args = None
+        if message.get("tool_calls"):
+            try:
+                tool_args = orjson.loads(message["tool_calls"][0]["function"]["arguments"])
+            except orjson.JSONDecodeError:
+                logger.warning(f"Request {record['custom_id']} returned invalid tool arguments")
+        answers[record["custom_id"]] = (message.get("content"), tool_args)
+    return model, answers
+
+
+async def collect_chunk(client: AsyncOpenAI, task: BatchTask, chunk: LLMBatchChunk) -> Optional[int]:
+    """
+    Saves the results of the batch of a chunk if it has finished.
+
+    Returns:
+        The number of results saved, or None while the batch is still running.
+    """
+    batch = await client.batches.retrieve(chunk.provider_batch_id)
+    if batch.status not in FINAL_BATCH_STATUSES:
+        return None
+
+    if batch.status != "completed" and not batch.output_file_id:
+        error = f"Batch {batch.id} {batch.status}: {batch.errors}"
+        logger.error(f"Job {chunk.job_id}: chunk {chunk.chunk_index} failed. {error}")
+        await set_chunk_status(chunk, FAILED, error=error)
+        return 0
+
+    # Expired and cancelled batches keep the answers they already have
+    answers = {}
+    model = None
+    if batch.output_file_id:
+        output = await client.files.content(batch.output_file_id)
+        model, answers = parse_batch_output(output.content)
+    return await save_chunk_results(task, chunk, model or settings.OPENAI_MODEL, answers)
+
+
+async def run_batch_job(
+    kind: str,
+    job_id: Optional[str] = None,
+    chunk_size: int = settings.LLM_BATCH_CHUNK_SIZE,
+    local: bool = False,
+    poll_interval: float = settings.LLM_BATCH_POLL_INTERVAL,
+    refresh: bool = False,
+) -> int:
+    """
+    Runs, or resumes, the job `job_id` of the given kind until every chunk is done or failed.
+
+    Returns:
+        The number of results saved.
+    """
+    task = BATCH_TASKS[kind]
+    job_id = job_id or f"{kind}-{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+
+    async with AsyncSessionFactory() as db:
+        planned = await db.scalar(select(func.count()).where(LLMBatchChunk.job_id == job_id))
+    if planned:
+        logger.info(f"Resuming job {job_id}")
+    else:
+        await plan_job(task, job_id, chunk_size, refresh)
+
+    async with AsyncSessionFactory() as db:
+        result = await db.execute(
+            select(LLMBatchChunk)
+            .where(LLMBatchChunk.job_id == job_id, LLMBatchChunk.status != DONE)
+            .order_by(LLMBatchChunk.chunk_index)
+        )
+        chunks = list(result.scalars())
+
+    saved = 0
+    if local:
+        for chunk in chunks:
+            saved += await run_chunk_locally(task, chunk, settings.LLM_BATCH_LOCAL_CONCURRENCY)
+    else:
+        client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        for chunk in chunks:
+            if chunk.status in (PENDING, FAILED):
+                await submit_chunk(client, chunk)
+
+        running = chunks
+        while running:
+            still_running = []
+            for chunk in running:
+                collected = await collect_chunk(client, task, chunk)
+                if collected is None:
+                    still_running.append(chunk)
+                else:
+                    saved += collected
+            running = still_running
+            if running:
+                logger.info(f"Job {job_id}: {len(running)} batches running")
+                await asyncio.sleep(poll_interval)
+
+    logger.info(f"Job {job_id}: saved {saved} {kind} results")
+    return saved
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run offline model work as batches.")
+    parser.add_argument("kind", choices=sorted(BATCH_TASKS))
+    parser.add_argument("--job-id", help="Job to resume, or id of the new job.")
+    parser.add_argument("--chunk-size", type=int, default=settings.LLM_BATCH_CHUNK_SIZE)
+    parser.add_argument("--local", action="store_true", help="Call the chat model instead of the Batch API.")
+    parser.add_argument("--poll-interval", type=float, default=settings.LLM_BATCH_POLL_INTERVAL)
+    parser.add_argument("--refresh", action="store_true", help="Also process items with an up to date result.")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    try:
+        await run_batch_job(
+            args.kind, args.job_id, args.chunk_size, args.local, args.poll_interval, args.refresh
+        )
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=settings.LOG_LEVEL.upper(),
+        format="%(levelname)s:%(name)s: [%(funcName)s] - %(message)s",
+    )
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""
+Copies the chunks of the shared Chroma collection, `CHROMA_CLOUD_COLLECTION`,
+to the collection of their practice, as read with
+`CHROMA_COLLECTION_PER_PRACTICE`.
+
+Chunks are copied with their ids, embeddings and metadata, so nothing is
+embedded again, and copying a chunk twice overwrites it. Once every chunk
+is copied, the number of chunks of each practice collection is compared
+with the number copied, and with `--delete` the chunks copied to a
+complete collection are deleted from the shared one.
+
+Usage:
+    python -m src.jobs.reshard_vector_store --dry-run
+    python -m src.jobs.reshard_vector_store --batch-size 500
+    python -m src.jobs.reshard_vector_store --practice <practice_id> --delete
+
+To switch, run the job, pause ingestion, run it again to copy the chunks
+written in between, then set `CHROMA_COLLECTION_PER_PRACTICE` and resume.
+Chunks written to the shared collection after the last run are not copied.
+"""
+import argparse
+import collections
+import logging
+from typing import Dict, List, Optional
+
+from src.config import settings
+from src.services.vector_store import get_practice_vector_store, get_vector_store, practice_collection_name
+from src.shared.constants import DELETE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def reshard_vector_store(
+    batch_size: int,
+    practices: Optional[List[str]] = None,
+    dry_run: bool = False,
+    delete: bool = False,
+) -> Dict[str, int]:
+    """
+    Copies the chunks of the shared collection to the collections of their
+    practices, `batch_size` chunks at a time, only those of `practices` if given.
+
+    Returns:
+        The number of chunks copied, or that would be copied with `dry_run`, by practice.
+    """
+    if settings.CHROMA_COLLECTION_PER_PRACTICE:
+        logger.warning("CHROMA_COLLECTION_PER_PRACTICE is set: chunks written since then are not in the shared collection")
+    shared = get_vector_store()._collection
+    where = {"practice_id": {"$in": practices}} if practices else None
+    include = ["metadatas"] if dry_run else ["documents", "metadatas", "embeddings"]
+
+    copied: Dict[str, int] = collections.Counter()
+    ids_by_practice: Dict[str, List[str]] = collections.defaultdict(list)
+    without_practice = 0
+    offset = 0
+    while True:
+        batch = shared.get(where=where, limit=batch_size, offset=offset, include=include)
+        ids = batch["ids"]
+        if not ids:
+            break
+        offset += len(ids)
+
+        groups: Dict[str, List[int]] = collections.defaultdict(list)
+        for i, metadata in enumerate(batch["metadatas"]):
+            practice_id = (metadata or {}).get("practice_id")
+            if practice_id:
+                groups[practice_id].append(i)
+            else:
+                without_practice += 1
+
+        for practice_id, indexes in groups.items():
+            if not dry_run:
+                get_practice_vector_store(practice_id)._collection.upsert(
+                    ids=[ids[i] for i in indexes],
+                    embeddings=[batch["embeddings"][i] for i in indexes],
+                    documents=[batch["documents"][i] for i in indexes],
+                    metadatas=[batch["metadatas"][i] for i in indexes],
+                )
+            copied[practice_id] += len(indexes)
+            if delete:
+                ids_by_practice[practice_id].extend(ids[i] for i in indexes)
+        logger.info(f"{'Read' if dry_run else 'Copied'} {offset} chunks of the shared collection")
+
+    if without_practice:
+        logger.warning(f"Skipped {without_practice} chunks without a practice_id")
+
+    for practice_id, chunks in sorted(copied.items()):
+        name = practice_collection_name(practice_id)
+        if dry_run:
+            logger.info(f"{chunks} chunks of practice {practice_id} would be copied to {name}")
+            continue
+        stored = get_practice_vector_store(practice_id)._collection.count()
+        if stored < chunks:
+            logger.error(f"{name} holds {stored} chunks of the {chunks} copied, keeping them in the shared collection")
+            continue
+        logger.info(f"Copied {chunks} chunks of practice {practice_id} to {name}, which holds {stored}")
+        if delete:
+            practice_ids = ids_by_practice[practice_id]
+            for start in range(0, len(practice_ids), DELETE_BATCH_SIZE):
+                shared.delete(ids=practice_ids[start:start + DELETE_BATCH_SIZE])
+            logger.info(f"Deleted {len(practice_ids)} chunks of practice {practice_id} from the shared collection")
+    return copied
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Copy the shared Chroma collection to one collection per practice.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--practice", action="append", dest="practices", help="Only copy this practice, may be repeated.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the chunks of each practice.")
+    parser.add_argument(
+        "--delete", action="store_true", help="Delete the copied chunks from the shared collection."
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    reshard_vector_store(args.batch_size, args.practices, args.dry_run, args.delete and not args.dry_run)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=settings.LOG_LEVEL.upper(),
+        format="%(levelname)s:%(name)s: [%(funcName)s] - %(message)s",
+    )
+    main()
@@ -1,16 +1,23 @@
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, Request, Response, status
 from fastapi.responses import JSONResponse
+from opentelemetry import propagate, trace
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
+from src.api.analytics.router import router as analytics_router
+from src.api.chatflow.graph import get_chatflow_graph
 from src.api.chatflow.router import router as chatflow_router
 from src.api.embeddings.router import router as embeddings_router
 from src.config import settings
 from src.database.db import engine, test_db_connection
 from src.services.google_sheets import GoogleSheetsService
-from src.shared.schemas import HealthResponse
+from src.services.source_versions import get_version_collector
+from src.services.warmup import startup_warmup
+from src.shared.schemas import HealthResponse, ReadinessResponse
+from src.shared.utils.metrics import render_metrics
+from src.shared.utils.tracing import instrument_engine, setup_tracing, shutdown_tracing
 
 log_level = settings.LOG_LEVEL.upper()
 logging.basicConfig(
@@ -25,19 +32,20 @@ if log_level != "DEBUG":
     logging.getLogger("httpcore").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.debug("Starting up application...")
-    if not await test_db_connection():
-        logger.warning(
-            "Database connection could not be established on startup."
-        )
-    else:
-        logger.debug("Database connection successful.")
+    setup_tracing()
+    instrument_engine(engine)
 
+    # Fail fast if logic.yaml does not match the chatflow states and workflows
+    get_chatflow_graph()
+
+    # Created before serving, as chat turns export job candidates to it
     try:
         app.state.sheets_service = GoogleSheetsService()
         logger.info("Google Sheets Service initialized.")
@@ -45,25 +53,47 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to initialize Google Sheets Service: {e}")
         app.state.sheets_service = None
 
-    yield
-    # Shutdown
-    logger.info("Shutting down application...")
-    await engine.dispose()
+    app.state.warmup = startup_warmup(app)
+    app.state.warmup.start()
 
     yield
     # Shutdown
     logger.info("Shutting down application...")
+    await app.state.warmup.stop()
+    await get_version_collector().drain()
     await engine.dispose()
+    shutdown_tracing()
 
 
 app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
 
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Starts a server span for each request, continuing the caller's trace
+    when a W3C `traceparent` header is present.
+    """
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=propagate.extract(request.headers),
+        kind=trace.SpanKind.SERVER,
+        attributes={"http.request.method": request.method, "url.path": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.update_name(f"{request.method} {route.path}")
+        span.set_attribute("http.response.status_code", response.status_code)
+        return response
+
+
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"error": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -78,6 +108,7 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 app.include_router(chatflow_router, prefix="/api/v1", tags=["Chatflow"])
 app.include_router(embeddings_router, prefix="/api/v1", tags=["Embeddings"])
+app.include_router(analytics_router, prefix="/api/v1", tags=["Analytics"])
 
 
 @app.get("/health", response_model=HealthResponse, tags=["Health"])
@@ -93,3 +124,31 @@ async def health_check(request: Request):
         db_connection="ok" if db_ok else "failed",
         sheets_connection="ok" if sheets_ok else "failed",
     )
+
+
+@app.get("/ready", response_model=ReadinessResponse, tags=["Health"])
+async def readiness_check(request: Request):
+    """
+    Checks whether the application finished warming up, with the time taken
+    to initialize each component. Answers 503 until then, or if the database
+    could not be reached.
+    """
+    warmup = request.app.state.warmup
+    readiness = ReadinessResponse(
+        status="ready" if warmup.ready else "failed" if warmup.done else "warming_up",
+        components=warmup.report(),
+    )
+    if not warmup.ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=readiness.model_dump())
+    return readiness
+
+
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+def metrics():
+    """
+    Exposes the application metrics in the Prometheus text format.
+    """
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"error": "Metrics are disabled."})
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,149 @@
+"""
+Splits the text of a source into chunks for the vector store.
+
+Markdown is split at its headings first. A chunk holds one section, or
+consecutive short sections, and starts with the headings the section is
+under, so it can be matched without the rest of the page. Sections longer
+than a chunk are split at paragraphs, then lines, sentences and words, each
+part starting with the headings of its section.
+
+Lengths are counted in tokens of the encoding of the embedding model, which
+is loaded once per process.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List
+
+import tiktoken
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.shared.constants import CHUNK_ENCODING, CHUNK_SIZES
+from src.shared.enums import SourceType
+
+_HEADING = re.compile(r"^(#{1,6})\s+\S")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+@lru_cache(maxsize=1)
+def get_encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding(CHUNK_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+@dataclass
+class _Section:
+    headings: List[str]
+    body: str
+
+
+def _sections(text: str) -> Iterator[_Section]:
+    """
+    Splits markdown at its headings, ignoring lines of code blocks. Each
+    section has the heading lines it is under, from the top level down.
+    """
+    path: List[tuple[int, str]] = []
+    lines: List[str] = []
+    in_code = False
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            in_code = not in_code
+        heading = None if in_code else _HEADING.match(line)
+        if heading is None:
+            lines.append(line)
+            continue
+        if path or "".join(lines).strip():
+            yield _Section([h for _, h in path], "\n".join(lines).strip())
+        level = len(heading.group(1))
+        path = [(lvl, h) for lvl, h in path if lvl < level] + [(level, line.strip())]
+        lines = []
+    if path or "".join(lines).strip():
+        yield _Section([h for _, h in path], "\n".join(lines).strip())
+
+
+class MarkdownChunker:
+    """
+    Splits markdown into chunks of at most `chunk_size` tokens. Parts of a
+    section split across chunks overlap by up to `chunk_overlap` tokens.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._splitters: Dict[int, RecursiveCharacterTextSplitter] = {}
+
+    def _splitter(self, chunk_size: int) -> RecursiveCharacterTextSplitter:
+        """The splitter of long sections, by the size left after their headings."""
+        splitter = self._splitters.get(chunk_size)
+        if splitter is None:
+            splitter = self._splitters[chunk_size] = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=min(self.chunk_overlap, chunk_size // 4),
+                length_function=count_tokens,
+                separators=["\n\n", "\n", ". ", " ", ""],
+                keep_separator="end",
+            )
+        return splitter
+
+    def split_text(self, text: str) -> List[str]:
+        chunks: List[str] = []
+        # Short sections waiting to be merged into one chunk
+        pending: List[str] = []
+        pending_tokens = 0
+        pending_headings: List[str] = []
+
+        def flush() -> None:
+            nonlocal pending, pending_tokens, pending_headings
+            if pending:
+                chunks.append("\n\n".join(pending))
+            pending, pending_tokens, pending_headings = [], 0, []
+
+        for section in _sections(text):
+            context = "\n".join(section.headings)
+            full = "\n\n".join(part for part in (context, section.body) if part)
+            tokens = count_tokens(full)
+
+            if tokens > self.chunk_size:
+                flush()
+                context_tokens = count_tokens(context) + 1 if context else 0
+                splitter = self._splitter(max(self.chunk_size - context_tokens, self.chunk_size // 2))
+                for part in splitter.split_text(section.body):
+                    chunks.append(f"{context}\n\n{part}" if context else part)
+                continue
+
+            if pending:
+                # Headings shared with the previous section are not repeated
+                shared = 0
+                while (
+                    shared < min(len(pending_headings), len(section.headings))
+                    and pending_headings[shared] == section.headings[shared]
+                ):
+                    shared += 1
+                piece = "\n\n".join(
+                    part for part in ("\n".join(section.headings[shared:]), section.body) if part
+                )
+                if not piece:
+                    continue
+                piece_tokens = count_tokens(piece) + 1
+                if pending_tokens + piece_tokens <= self.chunk_size:
+                    pending.append(piece)
+                    pending_tokens += piece_tokens
+                    pending_headings = section.headings
+                    continue
+                flush()
+
+            pending, pending_tokens, pending_headings = [full], tokens, section.headings
+        flush()
+        return chunks
+
+
+@lru_cache(maxsize=None)
+def get_chunker(source_type: SourceType) -> MarkdownChunker:
+    """
+    Returns the chunker of a type of source, with its chunk size from `CHUNK_SIZES`.
+    """
+    chunk_size, chunk_overlap = CHUNK_SIZES[source_type.value]
+    return MarkdownChunker(chunk_size, chunk_overlap)
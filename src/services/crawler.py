@@ -0,0 +1,302 @@
+"""
+Crawls the pages of a website for ingestion.
+
+Pages are discovered from the sitemaps of the site, listed in robots.txt or
+at /sitemap.xml, or by following the links of the pages from the root URL
+when there is no sitemap. Only pages of the same host allowed by robots.txt
+are fetched, by `CRAWL_CONCURRENCY` workers, with requests to a host spaced
+by `1 / CRAWL_HOST_REQUESTS_PER_SECOND` seconds or the crawl delay of
+robots.txt if longer.
+
+Only hosts resolving to public addresses are requested, so a crawl cannot
+reach the services of the private network of the API. Redirects are
+followed one at a time, and only to pages of the same host.
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+from opentelemetry import trace
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+# Elements without content worth answering questions with, links are kept as text
+_REMOVED_TAGS = [
+    "script", "style", "noscript", "template", "svg", "iframe", "img", "source", "track", "embed",
+    "form", "input", "nav", "header", "footer", "aside",
+]
+_SKIPPED_EXTENSIONS = (
+    ".pdf", ".doc", ".docx", ".zip", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico",
+    ".mp3", ".mp4", ".mov", ".css", ".js", ".json", ".xml",
+)
+# Sitemaps read at most, including those listed in sitemap indexes
+_MAX_SITEMAPS = 20
+_MAX_REDIRECTS = 5
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    title: str
+    markdown: str
+
+
+class HostRateLimiter:
+    """
+    Spaces the start of the requests to a host by `interval` seconds.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_at = 0.0
+
+    async def wait(self) -> None:
+        now = time.monotonic()
+        start_at = max(now, self._next_at)
+        self._next_at = start_at + self.interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+
+def _host(url: str) -> str:
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+async def _is_public(url: str) -> bool:
+    """
+    Returns whether every address the host of `url` resolves to is public,
+    i.e. not loopback, link-local, private or reserved.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, parsed.port or None)
+    except (socket.gaierror, UnicodeError, ValueError):
+        return False
+    return bool(addresses) and all(
+        ipaddress.ip_address(address[4][0].split("%")[0]).is_global for address in addresses
+    )
+
+
+def _normalize(url: str) -> str:
+    url = urldefrag(url).url
+    parsed = urlparse(url)
+    if not parsed.path:
+        url = parsed._replace(path="/").geturl()
+    return url
+
+
+def _extract(html: str, url: str) -> Tuple[str, str, List[str]]:
+    """
+    Returns the title, the content as markdown, and the links of an HTML page.
+    """
+    # Imported on first use, as the processes that only chat never crawl
+    import pypandoc
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    links = [_normalize(urljoin(url, a["href"])) for a in soup.find_all("a", href=True)]
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for tag in soup.find_all(_REMOVED_TAGS):
+        tag.decompose()
+    for tag in soup.find_all("a"):
+        tag.unwrap()
+    content = soup.find("main") or soup.body or soup
+    markdown = pypandoc.convert_text(str(content), "gfm", format="html", extra_args=["--wrap=none"])
+    return title, markdown.strip(), links
+
+
+class SiteCrawler:
+    """
+    Crawls at most `max_pages` pages of the site of `root_url`.
+    """
+
+    def __init__(self, root_url: str, max_pages: int, client: httpx.AsyncClient):
+        self.root_url = _normalize(root_url)
+        self.host = _host(root_url)
+        self.max_pages = max_pages
+        self.client = client
+        self.pages: List[CrawledPage] = []
+        self.failed = 0
+        self._robots: Optional[RobotFileParser] = None
+        self._limiters: Dict[str, HostRateLimiter] = {}
+        self._seen: Set[str] = set()
+        self._public_hosts: Dict[str, bool] = {}
+
+    def _allowed(self, url: str) -> bool:
+        parsed = urlparse(url)
+        return (
+            parsed.scheme in ("http", "https")
+            and _host(url) == self.host
+            and not parsed.path.lower().endswith(_SKIPPED_EXTENSIONS)
+            and (self._robots is None or self._robots.can_fetch(settings.CRAWL_USER_AGENT, url))
+        )
+
+    async def _is_public(self, url: str) -> bool:
+        host = urlparse(url).netloc.lower()
+        if host not in self._public_hosts:
+            self._public_hosts[host] = await _is_public(url)
+        return self._public_hosts[host]
+
+    async def _get(self, url: str) -> Optional[httpx.Response]:
+        for _ in range(_MAX_REDIRECTS + 1):
+            if not await self._is_public(url):
+                logger.warning(f"Skipping {url}: not a public address")
+                return None
+            host = urlparse(url).netloc.lower()
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                interval = 1 / settings.CRAWL_HOST_REQUESTS_PER_SECOND
+                if self._robots is not None:
+                    interval = max(interval, float(self._robots.crawl_delay(settings.CRAWL_USER_AGENT) or 0))
+                limiter = self._limiters[host] = HostRateLimiter(interval)
+            await limiter.wait()
+            try:
+                response = await self.client.get(url)
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to fetch {url}: {e}")
+                return None
+            if not response.has_redirect_location:
+                break
+            location = urljoin(url, response.headers["location"])
+            if _host(location) != _host(url):
+                logger.info(f"Skipping {url}: redirected to another site")
+                return None
+            url = location
+        else:
+            logger.info(f"Skipping {url}: too many redirects")
+            return None
+        if response.status_code != 200:
+            logger.info(f"Skipping {url}: status {response.status_code}")
+            return None
+        return response
+
+    async def _load_robots(self) -> None:
+        robots = RobotFileParser()
+        response = await self._get(urljoin(self.root_url, "/robots.txt"))
+        robots.parse(response.text.splitlines() if response is not None else [])
+        self._robots = robots
+        crawl_delay = float(robots.crawl_delay(settings.CRAWL_USER_AGENT) or 0)
+        for limiter in self._limiters.values():
+            limiter.interval = max(limiter.interval, crawl_delay)
+
+    async def _sitemap_urls(self) -> List[str]:
+        pending = list(self._robots.site_maps() or []) or [urljoin(self.root_url, "/sitemap.xml")]
+        read: Set[str] = set()
+        urls: List[str] = []
+        while pending and len(read) < _MAX_SITEMAPS and len(urls) < self.max_pages:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in read:
+                continue
+            read.add(sitemap_url)
+            response = await self._get(sitemap_url)
+            if response is None:
+                continue
+            try:
+                root = ElementTree.fromstring(response.content)
+            except ElementTree.ParseError:
+                logger.warning(f"Invalid sitemap at {sitemap_url}")
+                continue
+            locations = [
+                element.text.strip() for element in root.iter()
+                if element.tag.rsplit("}", 1)[-1] == "loc" and element.text
+            ]
+            if root.tag.rsplit("}", 1)[-1] == "sitemapindex":
+                pending.extend(locations)
+            else:
+                urls.extend(_normalize(url) for url in locations)
+        return urls
+
+    def _enqueue(self, url: str, queue: asyncio.Queue) -> None:
+        if url in self._seen or len(self._seen) >= self.max_pages or not self._allowed(url):
+            return
+        self._seen.add(url)
+        queue.put_nowait(url)
+
+    async def _visit(self, url: str, queue: asyncio.Queue, follow_links: bool) -> None:
+        response = await self._get(url)
+        if response is None:
+            self.failed += 1
+            return
+        if "html" not in response.headers.get("content-type", ""):
+            return
+        final_url = _normalize(str(response.url))
+        if final_url != url and (final_url in self._seen or _host(final_url) != self.host):
+            # Redirected to a page crawled already or to another site
+            return
+        self._seen.add(final_url)
+
+        title, markdown, links = await asyncio.to_thread(_extract, response.text, final_url)
+        if markdown:
+            self.pages.append(CrawledPage(final_url, title, markdown))
+        if follow_links:
+            for link in links:
+                self._enqueue(link, queue)
+
+    async def _worker(self, queue: asyncio.Queue, follow_links: bool) -> None:
+        while True:
+            url = await queue.get()
+            try:
+                await self._visit(url, queue, follow_links)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Failed to crawl {url}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    async def crawl(self) -> List[CrawledPage]:
+        with tracer.start_as_current_span("crawl site", attributes={"url": self.root_url}) as span:
+            await self._load_robots()
+            sitemap_urls = await self._sitemap_urls()
+            # Without a sitemap, pages are discovered from the links of the pages crawled
+            follow_links = not sitemap_urls
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for url in [self.root_url, *sitemap_urls]:
+                self._enqueue(url, queue)
+            workers = [
+                asyncio.create_task(self._worker(queue, follow_links)) for _ in range(settings.CRAWL_CONCURRENCY)
+            ]
+            try:
+                await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            span.set_attribute("pages", len(self.pages))
+            logger.info(
+                f"Crawled {len(self.pages)} pages of {self.root_url} "
+                f"({'sitemap' if sitemap_urls else 'links'}), {self.failed} failed."
+            )
+            return self.pages
+
+
+async def crawl_site(root_url: str, max_pages: int) -> List[CrawledPage]:
+    """
+    Returns the pages of the site of `root_url` with content, at most `max_pages`,
+    or none if its host does not resolve to public addresses.
+    """
+    if not await _is_public(root_url):
+        logger.warning(f"Not crawling {root_url}: not a public address")
+        return []
+    # Redirects are followed by `SiteCrawler._get`, which checks each of them
+    async with httpx.AsyncClient(
+        headers={"User-Agent": settings.CRAWL_USER_AGENT},
+        timeout=settings.CRAWL_TIMEOUT,
+        follow_redirects=False,
+    ) as client:
+        return await SiteCrawler(root_url, max_pages, client).crawl()
@@ -1,29 +1,44 @@
+import asyncio
 import base64
+import hashlib
 import logging
+import os
+import tempfile
+import time
+from functools import lru_cache
 from urllib.parse import urlparse
 
-import pypandoc
 import regex
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
 
-from firecrawl import Firecrawl
-from firecrawl.v2.utils.error_handler import BadRequestError
 from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from opentelemetry import trace
 
 from src.config import settings
-from src.services.vector_store import get_vector_store
+from src.services.chunking import MarkdownChunker, get_chunker
+from src.services.crawler import CrawledPage, crawl_site
+from src.services.ingest import ingest_documents
+from src.services.llm import get_chat_model
+from src.services.retrieval import rank_results
+from src.services.source_versions import all_of, any_of, delete_where, replace_source
+from src.services.vector_store import drop_practice_collection, get_vector_store, uses_practice_collections
 from src.shared.constants import (
-    INVALID_UNICODE_CLEANUP_REGEX,
+    INGEST_SECTION_CHARS,
     VECTOR_EMBEDDINGS_SIMILARITY_THRESHOLD,
     VECTOR_EMBEDDINGS_QUERY_SYSTEM_PROMPT
 )
 from src.shared.enums import DocType, SourceType
 from src.shared.schemas import DocumentData, QAPair
+from src.shared.utils.functions import _invoke_model
+from src.shared.utils.metrics import observe_ingest, observe_vector_search
+from src.shared.utils.minhash import NearDuplicateIndex, remove_boilerplate
+from src.shared.utils.resilience import OverloadedError
+from src.shared.utils.text import normalize_query, normalize_sections, normalize_text
 
 logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
 
 
 class InvalidURLError(ValueError):
@@ -36,47 +51,39 @@ def _sanitize_for_doc_id(text: str) -> str:
     return regex.sub(r'[^a-zA-Z0-9]+', '_', text.lower()).strip('_')
 
 
-def store_data_from_qa_pair(qa_pair: QAPair, practice_id: str):
+def _page_doc_id(url: str) -> str:
     """
-    Stores a Q&A pair in Chroma.
+    Returns the document ID of a crawled page. A hash of the whole URL keeps
+    pages differing only by their query string or trailing slash apart.
     """
-    vector_store = get_vector_store()
+    parsed_url = urlparse(url)
+    sanitized_url = _sanitize_for_doc_id(parsed_url.netloc + parsed_url.path)
+    return f"{sanitized_url}_{hashlib.blake2b(url.encode('utf-8'), digest_size=4).hexdigest()}"
 
-    doc_id = _sanitize_for_doc_id(qa_pair.question)
 
-    try:
-        logger.info(f"Checking for existing document with doc_id '{doc_id}' for practice_id: {practice_id}...")
-        existing_docs = vector_store.get(
-            where={
-                "$and": [
-                    {"practice_id": practice_id},
-                    {"source_type": SourceType.QA_PAIR.value},
-                    {"doc_id": doc_id}
-                ]
-            },
-            include=[]
-        )
-        existing_ids = existing_docs.get("ids", [])
+async def store_data_from_qa_pair(qa_pair: QAPair, practice_id: str):
+    """
+    Stores a Q&A pair in Chroma, replacing the previous answer to the question.
+    """
+    doc_id = _sanitize_for_doc_id(qa_pair.question)
+    content = f"Q: {qa_pair.question}\nA: {qa_pair.answer}"
 
-        if existing_ids:
-            logger.info(f"Found {len(existing_ids)} existing documents for Q&A pair. Deleting them before adding new document...")
-            vector_store.delete(ids=existing_ids)
-            logger.info(f"Successfully deleted {len(existing_ids)} existing documents for Q&A pair.")
-        else:
-            logger.info(f"No existing document found for Q&A pair with doc_id '{doc_id}'.")
-    except Exception as e:
-        logger.error(f"Error while checking/deleting existing documents for Q&A pair: {e}", exc_info=True)
-        raise
+    async def write(version: int) -> None:
+        doc = Document(page_content=content)
+        doc.metadata["doc_id"] = doc_id
+        doc.metadata["practice_id"] = practice_id
+        doc.metadata["source_type"] = SourceType.QA_PAIR.value
+        doc.metadata["source_version"] = version
 
-    content = f"Q: {qa_pair.question}\nA: {qa_pair.answer}"
-    doc = Document(page_content=content)
-    doc.metadata["doc_id"] = doc_id
-    doc.metadata["practice_id"] = practice_id
-    doc.metadata["source_type"] = SourceType.QA_PAIR.value
+        logger.info(f"Adding new Q&A pair document to vector store with ID {doc_id}.")
+        started = time.perf_counter()
+        vector_store = await asyncio.to_thread(get_vector_store, practice_id)
+        with tracer.start_as_current_span("vector_store add_documents"):
+            await asyncio.to_thread(vector_store.add_documents, documents=[doc], ids=[f"{doc_id}_{version}"])
+        observe_ingest(SourceType.QA_PAIR.value, 1, time.perf_counter() - started)
 
     try:
-        logger.info(f"Adding new Q&A pair document to vector store with ID {doc_id}.")
-        vector_store.add_documents(documents=[doc], ids=[doc_id])
+        await replace_source(practice_id, f"Q&A pair '{doc_id}'", _source_filter(practice_id, qa_ids=[doc_id]), write)
         logger.info(
             f"Successfully added new Q&A pair from '{qa_pair.question}' to the collection."
         )
@@ -85,88 +92,141 @@ def store_data_from_qa_pair(qa_pair: QAPair, practice_id: str):
         raise
 
 
-def store_data_from_document(document_data: DocumentData, practice_id: str):
+def _read_sections(text_file: TextIO, section_chars: int) -> Iterator[str]:
     """
-    Processes a document and stores its content in Chroma.
+    Reads a text file in sections of about `section_chars` characters that end at a line break.
     """
-    vector_store = get_vector_store()
-    doc_id = _sanitize_for_doc_id(document_data.name)
+    lines = []
+    size = 0
+    for line in text_file:
+        lines.append(line)
+        size += len(line)
+        if size >= section_chars:
+            yield "".join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield "".join(lines)
+
+
+def _split_sections(sections: Iterable[str], text_splitter: MarkdownChunker) -> Iterator[str]:
+    """
+    Splits a text read in sections into chunks, holding a single section in memory.
 
-    try:
-        logger.info(f"Checking for existing document with doc_id '{doc_id}' for practice_id: {practice_id}...")
-        existing_docs = vector_store.get(
-            where={
-                "$and": [
-                    {"practice_id": practice_id},
-                    {"source_type": SourceType.DOCUMENT.value},
-                    {"doc_type": document_data.docType},
-                    {"doc_id": doc_id}
-                ]
-            },
-            include=[]
-        )
-        existing_ids = existing_docs.get("ids", [])
+    The last chunk of a section may continue in the next one, so it is split
+    again with the next section, which gives the chunks of the whole text.
+    """
+    carry = ""
+    for section in sections:
+        chunks = text_splitter.split_text(f"{carry}\n{section}" if carry else section)
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+    if carry:
+        yield carry
+
+
+async def store_document_file(path: str, name: str, doc_type: DocType, practice_id: str) -> int:
+    """
+    Processes a document stored in a file and stores its content in Chroma.
 
-        if existing_ids:
-            logger.info(f"Found {len(existing_ids)} existing documents for document. Deleting them before adding new document...")
-            vector_store.delete(ids=existing_ids)
-            logger.info(f"Successfully deleted {len(existing_ids)} existing documents for document.")
-        else:
-            logger.info(f"No existing document found for document with doc_id '{doc_id}'.")
-    except Exception as e:
-        logger.error(f"Error while checking/deleting existing documents for document: {e}", exc_info=True)
-        raise
+    DOCX files are converted to markdown by a pandoc process writing to
+    disk. The text is then read and split in sections as the chunks are
+    embedded and stored by `ingest_documents`, so memory use does not grow
+    with the size of the document.
 
-    try:
-        decoded_data = base64.b64decode(document_data.data)
-        if document_data.docType == DocType.DOCX:
-            # Note: pypandoc requires pandoc to be installed on the system.
-            content = pypandoc.convert_text(decoded_data, "markdown", format="docx")
-        elif document_data.docType == DocType.TXT:
-            content = decoded_data.decode('utf-8')
+    Returns:
+        The number of chunks stored.
+    """
+    doc_id = _sanitize_for_doc_id(name)
+
+    with tempfile.TemporaryDirectory(prefix="ingest_") as workdir:
+        if doc_type == DocType.DOCX:
+            text_path = os.path.join(workdir, "document.md")
+            try:
+                # Note: pypandoc requires pandoc to be installed on the system.
+                import pypandoc
+
+                with tracer.start_as_current_span("pandoc convert_file"):
+                    await asyncio.to_thread(
+                        pypandoc.convert_file, path, "markdown", format="docx", outputfile=text_path
+                    )
+            except Exception as e:
+                logger.error(f"Error processing document {name}: {e}", exc_info=True)
+                raise
+        elif doc_type == DocType.TXT:
+            text_path = path
         else:
-            logger.warning(f"Unsupported docType: {document_data.docType}. Skipping.")
-            return
-    except Exception as e:
-        logger.error(f"Error processing document {document_data.name}: {e}", exc_info=True)
-        raise
+            logger.warning(f"Unsupported docType: {doc_type}. Skipping.")
+            return 0
 
-    cleaned_content = regex.sub(INVALID_UNICODE_CLEANUP_REGEX, '', content)
+        text_splitter = get_chunker(SourceType.DOCUMENT)
+
+        async def write(version: int) -> int:
+            metadata = {
+                "doc_id": doc_id,
+                "practice_id": practice_id,
+                "source_type": SourceType.DOCUMENT.value,
+                "doc_type": doc_type.value,
+                "source_version": version,
+            }
+
+            def documents() -> Iterator[Document]:
+                with open(text_path, encoding="utf-8") as text_file:
+                    sections = normalize_sections(_read_sections(text_file, INGEST_SECTION_CHARS))
+                    chunks = _split_sections(sections, text_splitter)
+                    for i, chunk in enumerate(chunks):
+                        yield Document(id=f"{doc_id}_{version}_{i}", page_content=chunk, metadata=metadata.copy())
+
+            progress = await ingest_documents(documents(), SourceType.DOCUMENT.value, f"document {name}", practice_id)
+            return progress.stored
+
+        try:
+            stored = await replace_source(
+                practice_id,
+                f"document '{doc_id}'",
+                # Without doc_type, which the chunks stored before it was added do not have
+                _source_filter(practice_id, doc_ids=[doc_id]),
+                write,
+            )
+        except Exception as e:
+            logger.error(f"Error adding document chunks to vector store for practice_id {practice_id}: {e}", exc_info=True)
+            raise
+
+    logger.info(f"Successfully added {stored} new chunks from {name} to the collection.")
+    return stored
+
+
+async def store_data_from_document(document_data: DocumentData, practice_id: str):
+    """
+    Processes a base64 encoded document and stores its content in Chroma.
+    """
+    if document_data.docType not in (DocType.DOCX, DocType.TXT):
+        logger.warning(f"Unsupported docType: {document_data.docType}. Skipping.")
+        return
 
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=512,
-        chunk_overlap=128,
-    )
-    docs = text_splitter.create_documents([cleaned_content])
-    logger.info(f"Split content from {document_data.name} into {len(docs)} documents.")
+    with tempfile.NamedTemporaryFile(prefix="ingest_", suffix=f".{document_data.docType.value.lower()}") as document_file:
+        try:
+            document_file.write(base64.b64decode(document_data.data))
+            document_file.flush()
+        except Exception as e:
+            logger.error(f"Error processing document {document_data.name}: {e}", exc_info=True)
+            raise
+        await store_document_file(document_file.name, document_data.name, document_data.docType, practice_id)
 
-    ids = []
-    for i, doc in enumerate(docs):
-        chunk_id = f"{doc_id}_{i}"
-        doc.metadata["doc_id"] = doc_id
-        doc.metadata["practice_id"] = practice_id
-        doc.metadata["source_type"] = SourceType.DOCUMENT.value
-        ids.append(chunk_id)
 
-    try:
-        logger.info(f"Adding {len(docs)} new document chunks to vector store.")
-        vector_store.add_documents(documents=docs, ids=ids)
-        logger.info(
-            f"Successfully added {len(docs)} new chunks from {document_data.name} to the collection."
-        )
-    except Exception as e:
-        logger.error(f"Error adding document chunks to vector store for practice_id {practice_id}: {e}", exc_info=True)
-        raise
-
-
-def store_data_from_website(website: str, practice_id: str):
+async def store_data_from_website(website: str, practice_id: str):
     """
     Scrapes a website and stores its content in Chroma.
     """
     if not settings.FIRECRAWL_API_KEY:
         raise ValueError("FIRECRAWL_API_KEY not found in settings")
 
-    vector_store = get_vector_store()
+    # Imported on first use, as the processes that only chat never scrape
+    from firecrawl import Firecrawl
+    from firecrawl.v2.utils.error_handler import BadRequestError
+
     firecrawl = Firecrawl(
         api_key=settings.FIRECRAWL_API_KEY,
     )
@@ -175,38 +235,17 @@ def store_data_from_website(website: str, practice_id: str):
     endpoint = parsed_url.netloc + parsed_url.path
     sanitized_url = _sanitize_for_doc_id(endpoint)
 
-    try:
-        logger.info(f"Checking for existing documents with URL prefix '{sanitized_url}' for practice_id: {practice_id}...")
-        existing_docs = vector_store.get(
-            where={
-                "$and": [
-                    {"practice_id": practice_id},
-                    {"source_type": SourceType.WEB_PAGE.value},
-                    {"source_url": website}
-                ]
-            },
-            include=[]
-        )
-        existing_ids = existing_docs.get("ids", [])
-        
-        if existing_ids:
-            logger.info(f"Found {len(existing_ids)} existing documents for URL {website}. Deleting them before adding new chunks...")
-            vector_store.delete(ids=existing_ids)
-            logger.info(f"Successfully deleted {len(existing_ids)} existing chunks for {website}.")
-        else:
-            logger.info(f"No existing documents found for URL {website}.")
-    except Exception as e:
-        logger.error(f"Error while checking/deleting existing documents for {website}: {e}", exc_info=True)
-        raise
-
     logger.info(f"Scraping {website} for practice_id: {practice_id}...")
     try:
-        scraped_website = firecrawl.scrape(
-            url=website,
-            formats=["markdown"],
-            exclude_tags=
-                ["script", "style", "img", "a", "source", "track", "embed", "base", "col", "area", "form", "input"],
-        )
+        with tracer.start_as_current_span("firecrawl scrape"):
+            scraped_website = await asyncio.to_thread(
+                firecrawl.scrape,
+                url=website,
+                formats=["markdown"],
+                only_main_content=True,
+                exclude_tags=
+                    ["script", "style", "img", "a", "source", "track", "embed", "base", "col", "area", "form", "input"],
+            )
     except BadRequestError as e:
         logger.warning(f"Firecrawl failed to scrape URL {website} due to a bad request: {e}")
         raise InvalidURLError(f"The URL '{website}' is invalid or could not be scraped.") from e
@@ -215,212 +254,337 @@ def store_data_from_website(website: str, practice_id: str):
         logger.warning(f"No markdown content scraped from {website}. Skipping.")
         return
         
-    cleaned_markdown = regex.sub(INVALID_UNICODE_CLEANUP_REGEX, '', output_markdown)
-
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=512,
-        chunk_overlap=128,
-    )
-    docs = text_splitter.create_documents([cleaned_markdown])
-    logger.info(f"Split content from {website} into {len(docs)} documents.")
-
-    ids = []
-    for i, doc in enumerate(docs):
-        doc_id = f"{sanitized_url}_{i}"
-        doc.metadata["doc_id"] = doc_id
-        doc.metadata["practice_id"] = practice_id
-        doc.metadata["source_type"] = SourceType.WEB_PAGE.value
-        doc.metadata["source_page_title"] = getattr(scraped_website.metadata, 'title', 'No Title')
-        doc.metadata["source_url"] = website
-        ids.append(doc_id)
+    cleaned_markdown = await asyncio.to_thread(normalize_text, output_markdown)
+    text_splitter = get_chunker(SourceType.WEB_PAGE)
+
+    async def write(version: int) -> int:
+        metadata = {
+            "practice_id": practice_id,
+            "source_type": SourceType.WEB_PAGE.value,
+            "source_page_title": getattr(scraped_website.metadata, 'title', 'No Title'),
+            "source_url": website,
+            "source_version": version,
+        }
+
+        def documents() -> Iterator[Document]:
+            for i, chunk in enumerate(text_splitter.split_text(cleaned_markdown)):
+                doc_id = f"{sanitized_url}_{version}_{i}"
+                yield Document(id=doc_id, page_content=chunk, metadata={**metadata, "doc_id": doc_id})
+
+        progress = await ingest_documents(documents(), SourceType.WEB_PAGE.value, f"website {website}", practice_id)
+        return progress.stored
 
     try:
-        logger.info(f"Adding {len(docs)} new documents to vector store.")
-        vector_store.add_documents(documents=docs, ids=ids)
+        stored = await replace_source(
+            practice_id,
+            f"web page {website}",
+            all_of([
+                {"practice_id": practice_id},
+                {"source_type": SourceType.WEB_PAGE.value},
+                {"source_url": website},
+            ]),
+            write,
+        )
         logger.info(
-            f"Successfully added {len(docs)} new chunks from {website} to the collection."
+            f"Successfully added {stored} new chunks from {website} to the collection."
         )
     except Exception as e:
         logger.error(f"Error adding documents to vector store for website {website} and practice_id {practice_id}: {e}", exc_info=True)
         raise
 
 
-def delete_data_from_document(document_name: str, practice_id: str) -> int:
+def _deduplicate_pages(pages: List[CrawledPage]) -> tuple[List[CrawledPage], int]:
     """
-    Deletes all chunks of a document from Chroma based on the document name and practice ID.
-    Returns the number of documents deleted.
+    Removes the boilerplate repeated across the pages of a site, then the
+    pages that are near-duplicates of another page. The boilerplate is kept
+    once, at the end of the first page, usually the home page.
+
+    Returns:
+        The pages kept, and the number of duplicates removed.
+    """
+    contents, boilerplate = remove_boilerplate(
+        {page.url: page.markdown for page in pages},
+        share=settings.CRAWL_BOILERPLATE_SHARE,
+    )
+    index = NearDuplicateIndex(threshold=settings.CRAWL_DUPLICATE_THRESHOLD)
+    kept = []
+    # Shorter URLs first, so the canonical page of duplicates is usually kept
+    for page in sorted(pages, key=lambda page: (len(page.url), page.url)):
+        content = contents[page.url]
+        if not content.strip():
+            continue
+        duplicate_of = index.add(page.url, content)
+        if duplicate_of:
+            logger.info(f"Skipping {page.url}, a near-duplicate of {duplicate_of}.")
+            continue
+        kept.append(CrawledPage(page.url, page.title, content))
+    if kept and boilerplate:
+        first = kept[0]
+        kept[0] = CrawledPage(first.url, first.title, "\n\n".join([first.markdown, *boilerplate]))
+    return kept, len(pages) - len(kept)
+
+
+async def store_data_from_site(root_url: str, practice_id: str, max_pages: Optional[int] = None) -> tuple[int, int]:
+    """
+    Crawls the pages of a website and stores their content in Chroma.
+
+    Boilerplate and near-duplicate pages are removed before embedding. The
+    chunks of the previous crawls of the site are replaced by
+    `replace_source`.
+
+    Returns:
+        The number of pages and chunks stored.
     """
-    vector_store = get_vector_store()
-    doc_id = _sanitize_for_doc_id(document_name)
+    if urlparse(root_url).scheme not in ("http", "https"):
+        raise InvalidURLError(f"The URL '{root_url}' is invalid or could not be scraped.")
+    max_pages = min(max_pages or settings.CRAWL_MAX_PAGES, settings.CRAWL_MAX_PAGES)
+
+    logger.info(f"Crawling {root_url} for practice_id: {practice_id}, up to {max_pages} pages...")
+    pages = await crawl_site(root_url, max_pages)
+    if not pages:
+        raise InvalidURLError(f"The URL '{root_url}' is invalid or could not be scraped.")
+    pages, duplicates = await asyncio.to_thread(_deduplicate_pages, pages)
+    logger.info(f"Kept {len(pages)} pages of {root_url}, {duplicates} near-duplicates skipped.")
+
+    text_splitter = get_chunker(SourceType.WEB_PAGE)
+
+    async def write(version: int) -> int:
+        def documents() -> Iterator[Document]:
+            for page in pages:
+                page_id = _page_doc_id(page.url)
+                for i, chunk in enumerate(text_splitter.split_text(normalize_text(page.markdown))):
+                    doc_id = f"{page_id}_{version}_{i}"
+                    yield Document(
+                        id=doc_id,
+                        page_content=chunk,
+                        metadata={
+                            "doc_id": doc_id,
+                            "practice_id": practice_id,
+                            "source_type": SourceType.WEB_PAGE.value,
+                            "source_page_title": page.title or "No Title",
+                            "source_url": page.url,
+                            "site_url": root_url,
+                            "source_version": version,
+                        },
+                    )
+
+        progress = await ingest_documents(documents(), SourceType.WEB_PAGE.value, f"site {root_url}", practice_id)
+        return progress.stored
 
     try:
-        logger.info(f"Searching for document to delete with doc_id: {doc_id} and practice_id: {practice_id}...")
-        existing_docs = vector_store.get(
-            where={
-                "$and": [
-                    {"practice_id": practice_id},
-                    {"source_type": SourceType.DOCUMENT.value},
-                    {"doc_id": doc_id}
-                ]
-            },
-            include=[]
+        stored = await replace_source(
+            practice_id,
+            f"site {root_url}",
+            all_of([
+                {"practice_id": practice_id},
+                {"source_type": SourceType.WEB_PAGE.value},
+                {"site_url": root_url},
+            ]),
+            write,
         )
-        existing_ids = existing_docs.get("ids", [])
-
-        if existing_ids:
-            logger.info(f"Found {len(existing_ids)} documents for document. Deleting them...")
-            vector_store.delete(ids=existing_ids)
-            logger.info(f"Successfully deleted {len(existing_ids)} chunks for document.")
-            return len(existing_ids)
-        else:
-            logger.info(f"No existing documents found for document.")
-            return 0
     except Exception as e:
-        logger.error(f"Error while deleting document chunks: {e}", exc_info=True)
+        logger.error(f"Error adding documents to vector store for site {root_url} and practice_id {practice_id}: {e}", exc_info=True)
         raise
 
+    logger.info(f"Successfully added {stored} new chunks from {len(pages)} pages of {root_url} to the collection.")
+    return len(pages), stored
 
-def delete_data_from_qa_pair(question: str, practice_id: str) -> int:
+
+def _source_filter(
+    practice_id: str,
+    doc_ids: Iterable[str] = (),
+    qa_ids: Iterable[str] = (),
+    urls: Iterable[str] = (),
+) -> Dict[str, Any]:
     """
-    Deletes a Q&A pair from Chroma based on the question and practice ID.
+    Returns the filter matching the chunks of many sources of a practice:
+    documents and Q&A pairs by their `doc_id`, and web pages by their URL or
+    the URL of the site they were crawled from.
+    """
+    doc_ids, qa_ids, urls = list(doc_ids), list(qa_ids), list(urls)
+    clauses = []
+    if doc_ids:
+        clauses.append({"$and": [{"source_type": SourceType.DOCUMENT.value}, {"doc_id": {"$in": doc_ids}}]})
+    if qa_ids:
+        clauses.append({"$and": [{"source_type": SourceType.QA_PAIR.value}, {"doc_id": {"$in": qa_ids}}]})
+    if urls:
+        clauses.append({
+            "$and": [
+                {"source_type": SourceType.WEB_PAGE.value},
+                {"$or": [{"source_url": {"$in": urls}}, {"site_url": {"$in": urls}}]},
+            ]
+        })
+    if not clauses:
+        raise ValueError("At least one source is required.")
+    return all_of([{"practice_id": practice_id}, any_of(clauses)])
+
+
+def delete_sources(
+    practice_id: str,
+    document_names: Iterable[str] = (),
+    questions: Iterable[str] = (),
+    websites: Iterable[str] = (),
+) -> int:
+    """
+    Deletes all chunks of many sources of a practice from Chroma with a
+    single filter: documents by name, Q&A pairs by question and web pages
+    by URL, including the pages of a site crawled from that URL.
     Returns the number of documents deleted.
     """
-    vector_store = get_vector_store()
-    doc_id = _sanitize_for_doc_id(question)
-
+    where = _source_filter(
+        practice_id,
+        doc_ids=[_sanitize_for_doc_id(name) for name in document_names],
+        qa_ids=[_sanitize_for_doc_id(question) for question in questions],
+        urls=websites,
+    )
     try:
-        logger.info(f"Searching for Q&A pair to delete with doc_id: {doc_id} and practice_id: {practice_id}...")
-        existing_docs = vector_store.get(
-            where={
-                "$and": [
-                    {"practice_id": practice_id},
-                    {"source_type": SourceType.QA_PAIR.value},
-                    {"doc_id": doc_id}
-                ]
-            },
-            include=[]
-        )
-        existing_ids = existing_docs.get("ids", [])
-
-        if existing_ids:
-            logger.info(f"Found {len(existing_ids)} documents for Q&A pair. Deleting them...")
-            vector_store.delete(ids=existing_ids)
-            logger.info(f"Successfully deleted {len(existing_ids)} chunks for Q&A pair.")
-            return len(existing_ids)
-        else:
-            logger.info(f"No existing documents found for Q&A pair.")
-            return 0
+        deleted = delete_where(practice_id, where)
+        logger.info(f"Successfully deleted {deleted} chunks of sources of practice_id {practice_id}.")
+        return deleted
     except Exception as e:
-        logger.error(f"Error while deleting Q&A pair documents: {e}", exc_info=True)
+        logger.error(f"Error while deleting sources of practice_id {practice_id}: {e}", exc_info=True)
         raise
 
 
-def delete_data_from_website(website: str, practice_id: str) -> int:
+def delete_practice(practice_id: str) -> int:
     """
-    Deletes all documents from Chroma that are associated with a specific website URL and practice ID.
+    Deletes every chunk of a practice from Chroma, with the collection of
+    the practice if it has one.
     Returns the number of documents deleted.
     """
-    vector_store = get_vector_store()
-
     try:
-        logger.info(f"Searching for documents to delete for URL: {website} and practice_id: {practice_id}...")
-        existing_docs = vector_store.get(
-            where={
-                "$and": [
-                    {"practice_id": practice_id},
-                    {"source_type": SourceType.WEB_PAGE.value},
-                    {"source_url": website}
-                ]
-            },
-            include=[]
-        )
-        existing_ids = existing_docs.get("ids", [])
-
-        if existing_ids:
-            logger.info(f"Found {len(existing_ids)} documents for URL {website}. Deleting them...")
-            vector_store.delete(ids=existing_ids)
-            logger.info(f"Successfully deleted {len(existing_ids)} chunks for {website}.")
-            return len(existing_ids)
+        if uses_practice_collections():
+            deleted = drop_practice_collection(practice_id)
         else:
-            logger.info(f"No existing documents found for URL {website}.")
-            return 0
+            deleted = delete_where(practice_id, {"practice_id": practice_id})
+        logger.info(f"Successfully deleted all {deleted} chunks of practice_id {practice_id}.")
+        return deleted
     except Exception as e:
-        logger.error(f"Error while deleting documents for {website}: {e}", exc_info=True)
+        logger.error(f"Error while deleting the chunks of practice_id {practice_id}: {e}", exc_info=True)
         raise
 
 
-def retrieve_data(query: str, practice_id: str, filters: Optional[Dict[str, Any]] = None) -> tuple[str, bool]:
+def delete_data_from_document(document_name: str, practice_id: str) -> int:
     """
-    Retrieves data from the vector store based on a query and optional filters,
-    and generates a response using an LLM.
+    Deletes all chunks of a document from Chroma based on the document name and practice ID.
+    Returns the number of documents deleted.
+    """
+    return delete_sources(practice_id, document_names=[document_name])
 
-    Args:
-        query: The user's question.
-        practice_id: The practice ID to filter the search results.
-        filters: A dictionary of metadata to filter the search results.
 
-    Returns:
-        A tuple containing:
-        - The content of the model's response (str).
-        - A boolean indicating if relevant data was found (bool).
+def delete_data_from_qa_pair(question: str, practice_id: str) -> int:
     """
-    vector_store = get_vector_store()
+    Deletes a Q&A pair from Chroma based on the question and practice ID.
+    Returns the number of documents deleted.
+    """
+    return delete_sources(practice_id, questions=[question])
 
-    search_filters = filters.copy() if filters else {}
-    search_filters["practice_id"] = practice_id
 
-    results_with_scores = vector_store.similarity_search_with_score(
-        query=query, k=3, filter=search_filters
-    )
+def delete_data_from_website(website: str, practice_id: str) -> int:
+    """
+    Deletes all documents from Chroma that are associated with a specific website URL and practice ID,
+    including the pages of a site crawled from that URL.
+    Returns the number of documents deleted.
+    """
+    return delete_sources(practice_id, websites=[website])
+
+
+@lru_cache(maxsize=1)
+def get_query_prompt() -> ChatPromptTemplate:
+    """Returns the prompt answering a question from the retrieved context."""
+    return ChatPromptTemplate.from_template(VECTOR_EMBEDDINGS_QUERY_SYSTEM_PROMPT)
 
-    if not results_with_scores:
-        logger.warning(f"No results found for query: '{query}' with filters: {search_filters}")
-        return "No relevant information was found to answer your question.", False
 
-    filtered_results_with_scores = [
-        (doc, score) for doc, score in results_with_scores if score < VECTOR_EMBEDDINGS_SIMILARITY_THRESHOLD
-    ]
+def _search(query: str, practice_id: str, filters: Optional[Dict[str, Any]]) -> List[Document]:
+    """
+    Returns the chunks of a practice closest to a normalized query, within the
+    similarity threshold and ranked by `rank_results`.
+    """
+    vector_store = get_vector_store(practice_id, create=False)
+    if vector_store is None:
+        logger.warning(f"No collection found for practice_id {practice_id}")
+        return []
 
-    if filtered_results_with_scores:
-        source_types_present = {doc.metadata.get("source_type") for doc, _ in filtered_results_with_scores}
+    search_filters = filters.copy() if filters else {}
+    if not uses_practice_collections():
+        search_filters["practice_id"] = practice_id
+
+    with tracer.start_as_current_span("embeddings embed_query"):
+        query_embedding = vector_store.embeddings.embed_query(query)
+    started = time.perf_counter()
+    with tracer.start_as_current_span("vector_store similarity_search", attributes={"practice_id": practice_id}):
+        results_with_scores = vector_store.similarity_search_by_vector_with_relevance_scores(
+            embedding=query_embedding, k=settings.RETRIEVAL_FETCH_K, filter=search_filters or None
+        )
+    observe_vector_search(time.perf_counter() - started)
 
-        priority_order = [SourceType.QA_PAIR.value, SourceType.WEB_PAGE.value, SourceType.DOCUMENT.value]
+    if not results_with_scores:
+        logger.warning(f"No results found for query: '{query}' with filters: {search_filters}")
+        return []
 
-        for source_type in priority_order:
-            if source_type in source_types_present:
-                prioritized_results = [
-                    (doc, score) for doc, score in filtered_results_with_scores
-                    if doc.metadata.get("source_type") == source_type
-                ]
-                if prioritized_results:
-                    logger.info(f"Found {len(prioritized_results)} results of priority type '{source_type}', prioritizing them.")
-                    filtered_results_with_scores = prioritized_results
-                    break
+    filtered_results_with_scores = []
+    seen = set()
+    for doc, score in results_with_scores:
+        # The chunks of a source being replaced may be found in both versions until the previous one is deleted
+        if score < VECTOR_EMBEDDINGS_SIMILARITY_THRESHOLD and doc.page_content not in seen:
+            seen.add(doc.page_content)
+            filtered_results_with_scores.append((doc, score))
+    filtered_results_with_scores = rank_results(query, filtered_results_with_scores)
 
     logger.info(f"Found {len(filtered_results_with_scores)} results for query: '{query}'")
     for doc, score in filtered_results_with_scores:
         doc_id = doc.metadata.get('doc_id', 'N/A')
         logger.info(f"  - Document ID: {doc_id}, Score (distance): {score:.4f}")
 
-    results = [
-        doc for doc, _ in filtered_results_with_scores
-    ]
-
-    if not results:
+    if not filtered_results_with_scores:
         logger.warning(
             f"No results found within similarity threshold ({VECTOR_EMBEDDINGS_SIMILARITY_THRESHOLD}) for query: '{query}'"
         )
-        return "No relevant information was found to answer your question.", False
+    return [doc for doc, _ in filtered_results_with_scores]
 
-    context = "\n---\n".join([doc.page_content for doc in results])
-    prompt = ChatPromptTemplate.from_template(VECTOR_EMBEDDINGS_QUERY_SYSTEM_PROMPT)
-    model = ChatOpenAI(
-        model=settings.OPENAI_MODEL,
-        temperature=0,
-    )
 
-    chain = prompt | model
+async def retrieve_data(
+    query: str,
+    practice_id: str,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[BaseChatModel] = None,
+) -> tuple[str, bool]:
+    """
+    Retrieves data from the vector store based on a query and optional filters,
+    and generates a response using an LLM.
 
-    response = chain.invoke({"context": context, "question": query})
+    The embedding, search and ranking run in a worker thread, and the model is
+    called like the other chatflow calls, within its latency budget and with
+    the fallback model.
+
+    Args:
+        query: The user's question.
+        practice_id: The practice ID to filter the search results.
+        filters: A dictionary of metadata to filter the search results.
+        model: The chat model used to generate the answer. Defaults to the chatflow model.
+
+    Returns:
+        A tuple containing:
+        - The content of the model's response (str).
+        - A boolean indicating if relevant data was found (bool).
+
+    Raises:
+        OverloadedError: If the model has no capacity for the call.
+    """
+    query = normalize_query(query)
+    results = await asyncio.to_thread(_search, query, practice_id, filters)
+    if not results:
+        return "No relevant information was found to answer your question.", False
+
+    context = "\n---\n".join([doc.page_content for doc in results])
+    messages = get_query_prompt().format_messages(context=context, question=query)
+    try:
+        response = await _invoke_model(model or get_chat_model(), messages, "retrieve_data")
+    except OverloadedError:
+        raise
+    except Exception as e:
+        # The question is then classified as if nothing was found
+        logger.error(f"Error in retrieve_data: {e}")
+        return "No relevant information was found to answer your question.", False
 
     return response.content, True
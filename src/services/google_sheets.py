@@ -1,5 +1,5 @@
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import gspread
 from google.oauth2.service_account import Credentials
@@ -17,6 +17,8 @@ class GoogleSheetsService:
     def __init__(self):
         self.creds = self._authenticate()
         self.client = gspread.authorize(self.creds)
+        # Worksheets opened so far, by spreadsheet ID and worksheet name
+        self._worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
 
     def _authenticate(self) -> Credentials:
         """
@@ -61,7 +63,7 @@ class GoogleSheetsService:
         self, spreadsheet_id: str, worksheet_name: str
     ) -> Optional[gspread.Worksheet]:
         """
-        Gets a specific worksheet from a spreadsheet.
+        Gets a specific worksheet from a spreadsheet, opened on the first call only.
 
         Args:
             spreadsheet_id: The ID of the Google Spreadsheet.
@@ -70,9 +72,13 @@ class GoogleSheetsService:
         Returns:
             A gspread.Worksheet object or None if not found.
         """
+        worksheet = self._worksheets.get((spreadsheet_id, worksheet_name))
+        if worksheet is not None:
+            return worksheet
         try:
             spreadsheet = self.client.open_by_key(spreadsheet_id)
             worksheet = spreadsheet.worksheet(worksheet_name)
+            self._worksheets[(spreadsheet_id, worksheet_name)] = worksheet
             return worksheet
         except gspread.exceptions.SpreadsheetNotFound:
             logger.error(f"Spreadsheet with ID '{spreadsheet_id}' not found.")
@@ -0,0 +1,206 @@
+"""
+Pipeline adding chunks of a source to the vector store.
+
+Chunks are read from the split stage in a worker thread, embedded in
+batches by concurrent calls to the embedding model, and upserted to Chroma
+while the next batches are embedded. The stages are connected by bounded
+queues, so a large source is never held in memory and a slow stage holds
+back the ones before it. Batches may be stored out of order, each chunk
+has its own id.
+
+Embedding calls share one `AdaptiveLimiter`: its token budget keeps the
+ingestion jobs of the process within the tokens per minute of the
+embedding model, and its concurrency limit is halved when the model
+answers 429.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from langchain_core.documents import Document
+from opentelemetry import trace
+
+from src.config import settings
+from src.services.vector_store import get_vector_store
+from src.shared.utils.metrics import observe_ingest
+from src.shared.utils.resilience import AdaptiveLimiter
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+# Seconds between progress logs of a job
+_PROGRESS_LOG_SECONDS = 5.0
+# Attempts of an embedding batch answered with 429
+_RATE_LIMITED_ATTEMPTS = 5
+
+_embedding_limiter: Optional[AdaptiveLimiter] = None
+
+
+def get_embedding_limiter() -> AdaptiveLimiter:
+    """
+    Returns the limiter of the embedding calls, shared by every ingestion job in the process.
+    """
+    global _embedding_limiter
+    if _embedding_limiter is None:
+        _embedding_limiter = AdaptiveLimiter(
+            "embeddings",
+            initial_limit=settings.INGEST_EMBED_CONCURRENCY,
+            min_limit=1,
+            max_limit=settings.INGEST_EMBED_CONCURRENCY,
+            tokens_per_minute=settings.INGEST_EMBED_TOKENS_PER_MINUTE,
+            queue_timeout=settings.INGEST_EMBED_QUEUE_TIMEOUT,
+        )
+    return _embedding_limiter
+
+
+@dataclass
+class IngestProgress:
+    """
+    Progress of an ingestion job, in chunks through each stage.
+    """
+    job: str
+    source_type: str
+    split: int = 0
+    embedded: int = 0
+    stored: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    _logged_at: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_second(self) -> float:
+        seconds = self.seconds
+        return self.stored / seconds if seconds > 0 else 0.0
+
+    def log(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._logged_at < _PROGRESS_LOG_SECONDS:
+            return
+        self._logged_at = now
+        logger.info(
+            f"Ingestion of {self.job}: {self.split} chunks split, {self.embedded} embedded, "
+            f"{self.stored} stored in {self.seconds:.1f}s ({self.chunks_per_second:.1f} chunks/s)"
+        )
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _estimate_tokens(texts: List[str]) -> int:
+    # About 4 characters per token
+    return sum(len(text) for text in texts) // 4
+
+
+async def _embed(embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeds a batch of texts once the limiter has capacity for it. Batches
+    answered with 429 are retried once the limiter has capacity again.
+    """
+    limiter = get_embedding_limiter()
+    tokens = _estimate_tokens(texts)
+    for attempt in range(1, _RATE_LIMITED_ATTEMPTS + 1):
+        await limiter.acquire(tokens)
+        started = time.perf_counter()
+        vectors = None
+        overloaded = False
+        try:
+            with tracer.start_as_current_span("embeddings embed_documents", attributes={"chunks": len(texts)}):
+                vectors = await embeddings.aembed_documents(texts)
+            return vectors
+        except Exception as e:
+            overloaded = _is_rate_limited(e)
+            if not overloaded or attempt == _RATE_LIMITED_ATTEMPTS:
+                raise
+            logger.warning(f"Embedding batch of {len(texts)} chunks was rate limited, retrying (attempt {attempt}).")
+        finally:
+            limiter.release(
+                tokens,
+                seconds=time.perf_counter() - started if vectors is not None else None,
+                overloaded=overloaded,
+            )
+
+
+def _upsert(vector_store, documents: List[Document], vectors: List[List[float]]) -> None:
+    # The embeddings are computed by the pipeline, so the collection is written directly
+    # instead of through `add_documents`, which would embed the documents again
+    with tracer.start_as_current_span("vector_store upsert", attributes={"chunks": len(documents)}):
+        vector_store._collection.upsert(
+            ids=[doc.id for doc in documents],
+            embeddings=vectors,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+        )
+
+
+async def ingest_documents(
+    documents: Iterator[Document], source_type: str, job: str, practice_id: str
+) -> IngestProgress:
+    """
+    Embeds and stores documents of a practice with their `id`,
+    `INGEST_BATCH_SIZE` at a time.
+
+    `documents` is consumed in a worker thread, so it may read and split
+    the source lazily. If a stage fails, the others are cancelled and the
+    error is raised; the batches stored until then are kept.
+
+    Returns:
+        The progress of the job once every document is stored.
+    """
+    vector_store = await asyncio.to_thread(get_vector_store, practice_id)
+    concurrency = settings.INGEST_EMBED_CONCURRENCY
+    progress = IngestProgress(job, source_type)
+    # Batches waiting for an embedding worker, and embedded batches waiting to be stored
+    to_embed: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    to_store: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+
+    def next_batch() -> List[Document]:
+        return list(itertools.islice(documents, settings.INGEST_BATCH_SIZE))
+
+    async def split() -> None:
+        while batch := await asyncio.to_thread(next_batch):
+            progress.split += len(batch)
+            await to_embed.put(batch)
+        for _ in range(concurrency):
+            await to_embed.put(None)
+
+    async def embed() -> None:
+        while (batch := await to_embed.get()) is not None:
+            vectors = await _embed(vector_store.embeddings, [doc.page_content for doc in batch])
+            progress.embedded += len(batch)
+            await to_store.put((batch, vectors))
+
+    async def embed_all() -> None:
+        await asyncio.gather(*(embed() for _ in range(concurrency)))
+        for _ in range(settings.INGEST_STORE_CONCURRENCY):
+            await to_store.put(None)
+
+    async def store() -> None:
+        while (item := await to_store.get()) is not None:
+            batch, vectors = item
+            await asyncio.to_thread(_upsert, vector_store, batch, vectors)
+            progress.stored += len(batch)
+            progress.log()
+
+    with tracer.start_as_current_span("ingest documents", attributes={"source_type": source_type}) as span:
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                tasks.create_task(split())
+                tasks.create_task(embed_all())
+                for _ in range(settings.INGEST_STORE_CONCURRENCY):
+                    tasks.create_task(store())
+        except ExceptionGroup as group:
+            # Raise the error of the failed stage rather than the group
+            raise group.exceptions[0]
+        finally:
+            span.set_attribute("chunks", progress.stored)
+
+    progress.log(force=True)
+    observe_ingest(source_type, progress.stored, progress.seconds)
+    return progress
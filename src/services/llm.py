@@ -0,0 +1,119 @@
+from contextvars import ContextVar
+from typing import Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+
+from src.config import settings
+from src.shared.utils.resilience import AdaptiveLimiter, CircuitBreaker, LatencyWindow, SingleFlight
+
+
+class ModelUnavailableError(ValueError):
+    """Custom exception for a model call while the circuit of every model is open."""
+    pass
+
+
+# Priority of the model calls of the current request, lower goes first when models are busy
+PRIORITY_ONGOING_SESSION = 0
+PRIORITY_NEW_SESSION = 1
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_ONGOING_SESSION)
+
+_chat_model = None
+_fallback_chat_model = None
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_limiters: dict[str, AdaptiveLimiter] = {}
+_single_flight = None
+_latency_windows: dict[tuple[str, str], LatencyWindow] = {}
+
+
+def get_chat_model() -> BaseChatModel:
+    """
+    Returns a singleton instance of the chat model used by the chatflow.
+    """
+    global _chat_model
+    if _chat_model is not None:
+        return _chat_model
+
+    _chat_model = ChatOpenAI(
+        model=settings.OPENAI_MODEL,
+        temperature=0,
+    )
+    return _chat_model
+
+
+def get_fallback_chat_model() -> Optional[BaseChatModel]:
+    """
+    Returns a singleton instance of the secondary chat model, or None if it is not configured.
+
+    Gemini is called through its OpenAI compatible endpoint, so tool calls
+    are bound the same way as for the primary model.
+    """
+    global _fallback_chat_model
+    if _fallback_chat_model is not None or not settings.GEMINI_API_KEY:
+        return _fallback_chat_model
+
+    _fallback_chat_model = ChatOpenAI(
+        model=settings.GEMINI_MODEL,
+        api_key=settings.GEMINI_API_KEY,
+        base_url=settings.GEMINI_BASE_URL,
+        temperature=0,
+    )
+    return _fallback_chat_model
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    """
+    Returns the circuit breaker of a model, shared by every call in the process.
+    """
+    breaker = _circuit_breakers.get(model_name)
+    if breaker is None:
+        breaker = CircuitBreaker(model_name, settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_RESET)
+        _circuit_breakers[model_name] = breaker
+    return breaker
+
+
+def get_limiter(model_name: str) -> AdaptiveLimiter:
+    """
+    Returns the concurrency limiter of a model, shared by every call in the process.
+    """
+    limiter = _limiters.get(model_name)
+    if limiter is None:
+        limiter = AdaptiveLimiter(
+            model_name,
+            initial_limit=settings.LLM_CONCURRENCY_INITIAL,
+            min_limit=settings.LLM_CONCURRENCY_MIN,
+            max_limit=settings.LLM_CONCURRENCY_MAX,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+        )
+        _limiters[model_name] = limiter
+    return limiter
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Returns a singleton instance of the coalescer of identical model calls.
+    """
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight(settings.LLM_COALESCE_TTL, settings.LLM_COALESCE_MAX_KEYS)
+    return _single_flight
+
+
+def get_latency_window(model_name: str, operation: str) -> LatencyWindow:
+    """
+    Returns the recent latencies of a model for one tool or operation.
+    """
+    key = (model_name, operation)
+    window = _latency_windows.get(key)
+    if window is None:
+        window = LatencyWindow()
+        _latency_windows[key] = window
+    return window
+
+
+def get_timeout(operation: str) -> float:
+    """
+    Returns the latency budget in seconds of a tool or operation.
+    """
+    return settings.LLM_TOOL_TIMEOUTS.get(operation, settings.LLM_TIMEOUT)
@@ -0,0 +1,239 @@
+"""
+Ranks the chunks found by a similarity search before they are given to the model.
+
+The search fetches `RETRIEVAL_FETCH_K` chunks within the similarity
+threshold. They are re-ranked against the query by `RETRIEVAL_RERANKER`:
+
+- "lexical": BM25 over the terms of the candidates, no model
+- "cross_encoder": `RETRIEVAL_CROSS_ENCODER_MODEL`, a small cross-encoder
+  run on the CPU with onnxruntime; if it cannot be loaded, "lexical" is used
+- "none": the chunks are ranked by distance only
+
+The ranks by distance and by the re-ranker are combined with reciprocal
+rank fusion, then weighted by `RETRIEVAL_SOURCE_WEIGHTS`, so a Q&A pair
+outranks a page or a document matching the query about as well, but not
+one matching it clearly better. The `RETRIEVAL_TOP_K` best chunks are kept.
+
+The scores of the re-ranker are cached by query and content of the
+candidates, for `RETRIEVAL_CACHE_TTL` seconds.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+from langchain_core.documents import Document
+from opentelemetry import trace
+
+from src.config import settings
+from src.shared.constants import RETRIEVAL_RRF_K, RETRIEVAL_SOURCE_WEIGHTS
+from src.shared.utils.metrics import observe_rerank
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+_TERM = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from have how i if in is it my of on or our "
+    "should so that the their there this to was we what when where which who why will with you your".split()
+)
+
+
+def _terms(text: str) -> List[str]:
+    """Lowercased words of a text without stopwords, with a crude plural stripping."""
+    terms = []
+    for term in _TERM.findall(text.lower()):
+        if term in _STOPWORDS:
+            continue
+        if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+class LexicalReranker:
+    """
+    Scores texts with BM25 against a query, the candidates being the corpus.
+    """
+
+    name = "lexical"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        query_terms = set(_terms(query))
+        documents = [Counter(_terms(text)) for text in texts]
+        if not query_terms or not documents:
+            return [0.0] * len(texts)
+        mean_length = sum(sum(document.values()) for document in documents) / len(documents) or 1
+        idf = {}
+        for term in query_terms:
+            frequency = sum(term in document for document in documents)
+            idf[term] = math.log(1 + (len(documents) - frequency + 0.5) / (frequency + 0.5))
+        scores = []
+        for document in documents:
+            length = sum(document.values())
+            score = 0.0
+            for term in query_terms:
+                count = document.get(term, 0)
+                if count:
+                    score += idf[term] * count * (self.k1 + 1) / (
+                        count + self.k1 * (1 - self.b + self.b * length / mean_length)
+                    )
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker:
+    """
+    Scores query and text pairs with a cross-encoder exported to ONNX,
+    downloaded from the Hugging Face Hub on first use.
+    """
+
+    name = "cross_encoder"
+
+    def __init__(self, model: str, max_length: int = 512):
+        # Optional at runtime, only loaded when the cross-encoder is configured
+        import numpy as np
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        self._np = np
+        self._tokenizer = Tokenizer.from_file(hf_hub_download(model, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=max_length)
+        self._tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            hf_hub_download(model, "onnx/model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {inputs.name for inputs in self._session.get_inputs()}
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        encodings = self._tokenizer.encode_batch([(query, text) for text in texts])
+        features = {
+            "input_ids": [encoding.ids for encoding in encodings],
+            "attention_mask": [encoding.attention_mask for encoding in encodings],
+            "token_type_ids": [encoding.type_ids for encoding in encodings],
+        }
+        feed = {name: self._np.array(values, dtype=self._np.int64) for name, values in features.items() if name in self._inputs}
+        logits = self._session.run(None, feed)[0]
+        return [float(logit) for logit in logits[:, 0]]
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+_scores: Optional[TTLCache] = None
+_scores_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Returns the re-ranker configured by `RETRIEVAL_RERANKER`, or None to rank by distance only.
+    """
+    global _reranker
+    if settings.RETRIEVAL_RERANKER == "none":
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                if settings.RETRIEVAL_RERANKER == "cross_encoder":
+                    try:
+                        _reranker = CrossEncoderReranker(settings.RETRIEVAL_CROSS_ENCODER_MODEL)
+                    except Exception as e:
+                        logger.error(
+                            f"Failed to load the cross-encoder {settings.RETRIEVAL_CROSS_ENCODER_MODEL}, "
+                            f"re-ranking lexically instead: {e}",
+                            exc_info=True,
+                        )
+                        _reranker = LexicalReranker()
+                else:
+                    _reranker = LexicalReranker()
+    return _reranker
+
+
+def _get_scores_cache() -> TTLCache:
+    global _scores
+    if _scores is None:
+        _scores = TTLCache(maxsize=settings.RETRIEVAL_CACHE_SIZE, ttl=settings.RETRIEVAL_CACHE_TTL)
+    return _scores
+
+
+def _document_key(doc: Document) -> bytes:
+    # By content, as the chunks of a source are found in both versions while it is replaced
+    return hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).digest()
+
+
+def rerank_scores(reranker, query: str, docs: Sequence[Document]) -> List[float]:
+    """Scores the documents against the query, cached by query and documents."""
+    key = (reranker.name, query, tuple(_document_key(doc) for doc in docs))
+    cache = _get_scores_cache() if settings.RETRIEVAL_CACHE_SIZE > 0 else None
+    started = time.perf_counter()
+    if cache is not None:
+        with _scores_lock:
+            scores = cache.get(key)
+        if scores is not None:
+            observe_rerank(reranker.name, "hit", time.perf_counter() - started)
+            return scores
+
+    with tracer.start_as_current_span("retrieval rerank", attributes={"reranker": reranker.name, "candidates": len(docs)}):
+        scores = reranker.score(query, [doc.page_content for doc in docs])
+    if cache is not None:
+        with _scores_lock:
+            cache[key] = scores
+    observe_rerank(reranker.name, "miss", time.perf_counter() - started)
+    return scores
+
+
+def _ranks(scores: Sequence[float], reverse: bool) -> List[int]:
+    """1-based rank of each score, equal scores sharing the best of their ranks."""
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=reverse)
+    ranks = [0] * len(scores)
+    for rank, i in enumerate(order, start=1):
+        previous = order[rank - 2] if rank > 1 else None
+        ranks[i] = ranks[previous] if previous is not None and scores[previous] == scores[i] else rank
+    return ranks
+
+
+def rank_results(
+    query: str,
+    results_with_distance: Sequence[Tuple[Document, float]],
+    top_k: Optional[int] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Ranks the chunks found for a query, see the module docstring.
+
+    Args:
+        query: The normalized query.
+        results_with_distance: The chunks found and their distance to the query.
+        top_k: The number of chunks kept. Defaults to `RETRIEVAL_TOP_K`.
+
+    Returns:
+        The best chunks and their distance, best first.
+    """
+    top_k = top_k or settings.RETRIEVAL_TOP_K
+    reranker = get_reranker()
+    results = list(results_with_distance)
+    if not results:
+        return []
+
+    rankings = [_ranks([distance for _, distance in results], reverse=False)]
+    if reranker is not None and len(results) > 1:
+        rankings.append(_ranks(rerank_scores(reranker, query, [doc for doc, _ in results]), reverse=True))
+
+    fused = []
+    for i, (doc, _) in enumerate(results):
+        score = sum(1 / (RETRIEVAL_RRF_K + ranking[i]) for ranking in rankings)
+        fused.append(score * (1 + RETRIEVAL_SOURCE_WEIGHTS.get(doc.metadata.get("source_type"), 0.0)))
+    order = sorted(range(len(results)), key=lambda i: fused[i], reverse=True)
+    return [results[i] for i in order[:top_k]]
@@ -0,0 +1,175 @@
+import copy
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import orjson
+from cachetools import TTLCache
+
+from src.config import settings
+from src.shared.utils.history import ChatMessage, decode_messages, encode_messages
+from src.shared.utils.metrics import observe_session_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedSession:
+    """
+    A conversation as stored in the `interactions` table, with its history deserialized.
+    """
+    practice_id: Optional[str]
+    history: List[ChatMessage]
+    states: List[str]
+    interaction_data: Dict[str, Any] = field(default_factory=dict)
+    version: int = 0
+
+    def copy(self) -> "CachedSession":
+        # Turns modify the history and interaction data they are given
+        return CachedSession(
+            practice_id=self.practice_id,
+            history=list(self.history),
+            states=list(self.states),
+            interaction_data=copy.deepcopy(self.interaction_data),
+            version=self.version,
+        )
+
+
+class MemorySessionCache:
+    """
+    Per-process session cache with size and TTL eviction.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self._sessions = TTLCache(maxsize=max_size, ttl=ttl)
+
+    async def get(self, session_id: str) -> Optional[CachedSession]:
+        session = self._sessions.get(session_id)
+        return session.copy() if session else None
+
+    async def set(self, session_id: str, session: CachedSession) -> None:
+        self._sessions[session_id] = session.copy()
+
+    async def invalidate(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
+class RedisSessionCache:
+    """
+    Session cache shared by every worker through Redis. Entries expire `ttl` seconds after their last write.
+    """
+
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"linden:session:{session_id}"
+
+    async def get(self, session_id: str) -> Optional[CachedSession]:
+        try:
+            raw = await self._client.get(self._key(session_id))
+        except Exception as e:
+            logger.error(f"Failed to read session {session_id} from Redis: {e}")
+            return None
+        if raw is None:
+            return None
+
+        data = orjson.loads(raw)
+        return CachedSession(
+            practice_id=data["practice_id"],
+            history=decode_messages(data["messages"]),
+            states=data["states"],
+            interaction_data=data["interaction_data"] or {},
+            version=data["version"],
+        )
+
+    async def set(self, session_id: str, session: CachedSession) -> None:
+        raw = orjson.dumps({
+            "practice_id": session.practice_id,
+            "messages": encode_messages(session.history),
+            "states": session.states,
+            "interaction_data": session.interaction_data,
+            "version": session.version,
+        })
+        try:
+            await self._client.set(self._key(session_id), raw, ex=self._ttl)
+        except Exception as e:
+            logger.error(f"Failed to write session {session_id} to Redis: {e}")
+
+    async def invalidate(self, session_id: str) -> None:
+        try:
+            await self._client.delete(self._key(session_id))
+        except Exception as e:
+            logger.error(f"Failed to invalidate session {session_id} in Redis: {e}")
+
+
+class NullSessionCache:
+    """
+    Disables caching: every turn reads the session from the database.
+    """
+
+    async def get(self, session_id: str) -> Optional[CachedSession]:
+        return None
+
+    async def set(self, session_id: str, session: CachedSession) -> None:
+        pass
+
+    async def invalidate(self, session_id: str) -> None:
+        pass
+
+
+class SessionCache:
+    """
+    Write-through cache of recently active conversations.
+
+    The cache holds each session together with the row version it was read
+    or written at. Writes to the database are conditional on that version,
+    so a turn computed from a stale entry is detected when it is saved.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def get(self, session_id: str) -> Optional[CachedSession]:
+        session = await self.backend.get(session_id)
+        observe_session_cache("hit" if session else "miss")
+        return session
+
+    async def set(self, session_id: str, session: CachedSession) -> None:
+        await self.backend.set(session_id, session)
+
+    async def invalidate(self, session_id: str) -> None:
+        observe_session_cache("stale")
+        await self.backend.invalidate(session_id)
+
+
+_session_cache = None
+
+
+def get_session_cache() -> SessionCache:
+    """
+    Returns a singleton instance of the session cache configured in settings.
+    """
+    global _session_cache
+    if _session_cache is not None:
+        return _session_cache
+
+    backend_name = settings.SESSION_CACHE_BACKEND
+    if backend_name == "memory":
+        backend = MemorySessionCache(settings.SESSION_CACHE_MAX_SIZE, settings.SESSION_CACHE_TTL)
+    elif backend_name == "redis":
+        if not settings.SESSION_CACHE_REDIS_URL:
+            raise ValueError("SESSION_CACHE_REDIS_URL not found in settings")
+        backend = RedisSessionCache(settings.SESSION_CACHE_REDIS_URL, settings.SESSION_CACHE_TTL)
+    elif backend_name == "none":
+        backend = NullSessionCache()
+    else:
+        raise ValueError(f"Unsupported session cache backend: {backend_name}")
+
+    logger.info(f"Session cache backend: {backend_name}")
+    _session_cache = SessionCache(backend)
+    return _session_cache
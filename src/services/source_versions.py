@@ -0,0 +1,171 @@
+"""
+Deletes and replaces the chunks of sources in the vector store.
+
+Chunks are deleted by metadata filters, which match many sources at once
+with `$in`, and by ids in batches of `DELETE_BATCH_SIZE`.
+
+With `INGEST_VERSIONED_WRITES`, a source is replaced by writing its chunks
+under a new `source_version`, next to the chunks of the previous version.
+Once every new chunk is stored, the previous chunks are retired: they are
+deleted in the background by the `VersionCollector`, out of the request.
+Searches always find the chunks of the source during its re-ingestion, and
+may find both versions until the previous one is deleted. If the new
+version fails to be written, its chunks are deleted and the previous version
+is kept.
+
+Retired chunks not deleted, e.g. when the process stops first, are deleted
+with the previous version of the source the next time it is replaced.
+"""
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, TypeVar
+
+from opentelemetry import trace
+
+from src.config import settings
+from src.services.vector_store import get_vector_store
+from src.shared.constants import DELETE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+T = TypeVar("T")
+
+
+def all_of(clauses: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combines filters with `$and`, which Chroma only accepts with two filters or more."""
+    clauses = list(clauses)
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def any_of(clauses: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combines filters with `$or`, which Chroma only accepts with two filters or more."""
+    clauses = list(clauses)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def get_ids(practice_id: str, where: Dict[str, Any]) -> List[str]:
+    vector_store = get_vector_store(practice_id, create=False)
+    if vector_store is None:
+        return []
+    with tracer.start_as_current_span("vector_store get"):
+        return vector_store.get(where=where, include=[]).get("ids", [])
+
+
+def delete_ids(practice_id: str, ids: List[str]) -> int:
+    vector_store = get_vector_store(practice_id, create=False)
+    if vector_store is None:
+        return 0
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        batch = ids[start:start + DELETE_BATCH_SIZE]
+        with tracer.start_as_current_span("vector_store delete", attributes={"chunks": len(batch)}):
+            vector_store.delete(ids=batch)
+    return len(ids)
+
+
+def delete_where(practice_id: str, where: Dict[str, Any]) -> int:
+    """
+    Deletes the chunks of a practice matched by a metadata filter.
+
+    Returns:
+        The number of chunks deleted.
+    """
+    return delete_ids(practice_id, get_ids(practice_id, where))
+
+
+class VersionCollector:
+    """
+    Deletes the chunks of retired versions of sources in the background,
+    one source at a time.
+    """
+
+    def __init__(self):
+        self._pending: Deque[tuple[str, str, List[str]]] = collections.deque()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Chunks waiting to be deleted."""
+        return sum(len(ids) for _, _, ids in self._pending)
+
+    def retire(self, practice_id: str, source: str, ids: List[str]) -> None:
+        if not ids:
+            return
+        self._pending.append((practice_id, source, ids))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._pending:
+            practice_id, source, ids = self._pending[0]
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(delete_ids, practice_id, ids)
+                logger.info(
+                    f"Deleted {len(ids)} chunks of the previous version of {source} "
+                    f"in {time.perf_counter() - started:.2f}s."
+                )
+            except Exception as e:
+                # They are deleted with the previous version the next time the source is replaced
+                logger.error(f"Failed to delete {len(ids)} chunks of the previous version of {source}: {e}", exc_info=True)
+            self._pending.popleft()
+
+    async def drain(self) -> None:
+        """Waits for the retired chunks to be deleted, e.g. before shutting down."""
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+        if self._task is not None and not self._task.done():
+            await self._task
+
+
+_version_collector: Optional[VersionCollector] = None
+
+
+def get_version_collector() -> VersionCollector:
+    """
+    Returns the collector of retired versions, shared by every ingestion job in the process.
+    """
+    global _version_collector
+    if _version_collector is None:
+        _version_collector = VersionCollector()
+    return _version_collector
+
+
+def new_version() -> int:
+    """Returns the version of chunks written now, in milliseconds since the epoch."""
+    return time.time_ns() // 1_000_000
+
+
+async def replace_source(
+    practice_id: str, source: str, where: Dict[str, Any], write: Callable[[int], Awaitable[T]]
+) -> T:
+    """
+    Replaces the chunks of a source of a practice matched by `where` with the chunks
+    written by `write(version)`, which sets `source_version` on each of them.
+
+    Without `INGEST_VERSIONED_WRITES`, the chunks of the source are deleted
+    before the new ones are written.
+
+    Returns:
+        The result of `write`.
+    """
+    version = new_version()
+    if not settings.INGEST_VERSIONED_WRITES:
+        deleted = await asyncio.to_thread(delete_where, practice_id, where)
+        if deleted:
+            logger.info(f"Deleted {deleted} existing chunks of {source} before adding the new ones.")
+        return await write(version)
+
+    previous = await asyncio.to_thread(get_ids, practice_id, where)
+    try:
+        result = await write(version)
+    except Exception:
+        # Keep the previous version of the source rather than part of the new one
+        await asyncio.to_thread(delete_where, practice_id, all_of([where, {"source_version": version}]))
+        raise
+    if previous:
+        logger.info(f"Retiring {len(previous)} chunks of the previous version of {source}.")
+    get_version_collector().retire(practice_id, source, previous)
+    return result
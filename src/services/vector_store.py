@@ -1,37 +1,157 @@
+"""
+Chroma collections of the embedded sources.
+
+By default every practice shares the `CHROMA_CLOUD_COLLECTION` collection
+and searches filter on the `practice_id` metadata. With
+`CHROMA_COLLECTION_PER_PRACTICE`, each practice has a collection of its
+own, so a search only scans the chunks of its practice. The collection
+of a practice is created by its first write; searches and deletions of a
+practice without one find no chunks. The handles of these collections are
+kept in an LRU cache of `CHROMA_COLLECTION_CACHE_SIZE`, and share the
+Chroma client and the embeddings. Existing chunks are copied to the
+collections of their practices by `src/jobs/reshard_vector_store.py`.
+"""
+import hashlib
+import logging
+import re
+import threading
+from typing import Optional
+
+import chromadb
+from cachetools import LRUCache
+from chromadb.errors import NotFoundError
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 
 from src.config import settings
 
+logger = logging.getLogger(__name__)
+
 _vector_store = None
+_practice_stores: Optional[LRUCache] = None
+_client = None
+_embeddings = None
+_lock = threading.Lock()
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_-]+")
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        if not all([settings.CHROMA_CLOUD_API_KEY, settings.CHROMA_CLOUD_TENANT, settings.CHROMA_CLOUD_DATABASE]):
+            raise ValueError("One or more Chroma Cloud environment variables are not set in settings.")
+        _client = chromadb.CloudClient(
+            tenant=settings.CHROMA_CLOUD_TENANT,
+            database=settings.CHROMA_CLOUD_DATABASE,
+            api_key=settings.CHROMA_CLOUD_API_KEY,
+        )
+    return _client
+
 
+def _get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        if not settings.OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY not found in settings")
+        _embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    return _embeddings
 
-def get_vector_store():
+
+def uses_practice_collections() -> bool:
+    return settings.CHROMA_COLLECTION_PER_PRACTICE
+
+
+def practice_collection_name(practice_id: str) -> str:
     """
-    Returns a singleton instance of the Chroma vector store.
+    Returns the name of the collection of a practice. Characters not allowed
+    in collection names are replaced, with a hash of the ID to keep names unique.
+    """
+    prefix = settings.CHROMA_CLOUD_COLLECTION or "practice"
+    name = _INVALID_NAME_CHARS.sub("-", practice_id).strip("-_")[:64]
+    if name != practice_id:
+        name = f"{name}-{hashlib.blake2b(practice_id.encode('utf-8'), digest_size=4).hexdigest()}"
+    return f"{prefix}-{name}"
+
+
+def get_vector_store(practice_id: Optional[str] = None, create: bool = True):
+    """
+    Returns the Chroma vector store holding the chunks of a practice: the
+    collection of the practice with `CHROMA_COLLECTION_PER_PRACTICE`,
+    otherwise, or without `practice_id`, the shared collection.
+
+    Without `create`, None is returned if the collection of the practice does not exist.
     """
     global _vector_store
-    if _vector_store is not None:
-        return _vector_store
+    if practice_id is not None and uses_practice_collections():
+        return get_practice_vector_store(practice_id, create)
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                _vector_store = Chroma(
+                    collection_name=settings.CHROMA_CLOUD_COLLECTION,
+                    embedding_function=_get_embeddings(),
+                    client=_get_client(),
+                )
+    return _vector_store
 
-    if not settings.OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY not found in settings")
 
-    chroma_cloud_api_key = settings.CHROMA_CLOUD_API_KEY
-    chroma_cloud_tenant = settings.CHROMA_CLOUD_TENANT
-    chroma_cloud_database = settings.CHROMA_CLOUD_DATABASE
-    chroma_cloud_collection = settings.CHROMA_CLOUD_COLLECTION
+def get_practice_vector_store(practice_id: str, create: bool = True):
+    """
+    Returns the Chroma vector store of the collection of a practice, whether
+    or not `CHROMA_COLLECTION_PER_PRACTICE` is set.
 
-    if not all([chroma_cloud_api_key, chroma_cloud_tenant, chroma_cloud_database]):
-        raise ValueError("One or more Chroma Cloud environment variables are not set in settings.")
+    Without `create`, None is returned if the collection does not exist.
+    """
+    global _practice_stores
+    with _lock:
+        if _practice_stores is None:
+            _practice_stores = LRUCache(maxsize=settings.CHROMA_COLLECTION_CACHE_SIZE)
+        vector_store = _practice_stores.get(practice_id)
+    if vector_store is not None:
+        return vector_store
 
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    # Opened outside of the lock, as it is a request to Chroma
+    try:
+        vector_store = Chroma(
+            collection_name=practice_collection_name(practice_id),
+            embedding_function=_get_embeddings(),
+            client=_get_client(),
+            create_collection_if_not_exists=create,
+        )
+    except NotFoundError:
+        return None
+    with _lock:
+        return _practice_stores.setdefault(practice_id, vector_store)
 
-    _vector_store = Chroma(
-        collection_name=chroma_cloud_collection,
-        embedding_function=embeddings,
-        chroma_cloud_api_key=chroma_cloud_api_key,
-        tenant=chroma_cloud_tenant,
-        database=chroma_cloud_database,
-    )
-    return _vector_store
+
+def warm_up() -> None:
+    """
+    Creates the Chroma client and the embeddings, and opens the shared
+    collection unless each practice has a collection of its own.
+    """
+    _get_client()
+    _get_embeddings()
+    if not uses_practice_collections():
+        get_vector_store()
+
+
+def drop_practice_collection(practice_id: str) -> int:
+    """
+    Deletes the collection of a practice.
+
+    Returns:
+        The number of chunks the collection held.
+    """
+    name = practice_collection_name(practice_id)
+    with _lock:
+        if _practice_stores is not None:
+            _practice_stores.pop(practice_id, None)
+    client = _get_client()
+    try:
+        chunks = client.get_collection(name).count()
+        client.delete_collection(name)
+    except NotFoundError:
+        return 0
+    logger.info(f"Deleted the collection {name} of practice {practice_id}.")
+    return chunks
@@ -0,0 +1,172 @@
+"""
+Initializes at startup what the first requests would otherwise wait for.
+
+The components are initialized concurrently once the application starts,
+each in a worker thread unless it is a coroutine, while `/health` already
+answers. The time taken by each one is logged and exported as
+`linden_warmup_seconds`, and `/ready` answers 503 until every component is
+initialized or failed to be, and while a required one, the database, failed.
+Any other component that failed is initialized again on first use, as
+without the warm-up.
+
+The Google Sheets service is still created before the application serves
+requests, and only its export worksheet is opened here. With
+`WARMUP_ENABLED` off, only the database and the condition index are
+initialized, as they always were at startup.
+"""
+import asyncio
+import inspect
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from fastapi import FastAPI
+from opentelemetry import trace
+
+from src.api.chatflow.conditions import get_condition_index, load_condition_index
+from src.config import settings
+from src.database.db import AsyncSessionFactory, test_db_connection
+from src.services import vector_store
+from src.services.chunking import get_encoding
+from src.services.embeddings import get_query_prompt
+from src.services.google_sheets import GoogleSheetsService
+from src.services.llm import get_chat_model, get_fallback_chat_model
+from src.services.retrieval import get_reranker
+from src.shared.constants import SHEETS_EXPORT_WORKSHEET
+from src.shared.schemas import ComponentStatus
+from src.shared.utils.metrics import observe_warmup
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+@dataclass
+class ComponentWarmup:
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        if self.seconds is None:
+            return "pending"
+        return "failed" if self.error else "ok"
+
+
+class Warmup:
+    """
+    Initializes components concurrently in the background, see the module docstring.
+    """
+
+    def __init__(self, components: Dict[str, Callable[[], Any]], required: Iterable[str] = ()):
+        self.components = components
+        self.required = set(required)
+        self.results = {name: ComponentWarmup() for name in components}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    @property
+    def ready(self) -> bool:
+        return self.done and not any(self.results[name].error for name in self.required)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def wait(self) -> None:
+        """Waits for every component to be initialized or to fail."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self) -> None:
+        """Cancels the warm-up if it is still running, e.g. when shutting down right after starting."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self) -> Dict[str, ComponentStatus]:
+        return {
+            name: ComponentStatus(status=result.status, seconds=result.seconds, error=result.error)
+            for name, result in self.results.items()
+        }
+
+    async def _run(self) -> None:
+        started = time.perf_counter()
+        await asyncio.gather(*(self._warm(name, component) for name, component in self.components.items()))
+        failed = [name for name, result in self.results.items() if result.error]
+        logger.info(
+            f"Warm-up finished in {time.perf_counter() - started:.2f}s"
+            + (f", failed: {', '.join(failed)}" if failed else "")
+        )
+
+    async def _warm(self, name: str, component: Callable[[], Any]) -> None:
+        result = self.results[name]
+        started = time.perf_counter()
+        try:
+            with tracer.start_as_current_span(f"warmup {name}"):
+                if inspect.iscoroutinefunction(component):
+                    await component()
+                else:
+                    await asyncio.to_thread(component)
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+            logger.error(f"Failed to warm up {name}: {e}", exc_info=True)
+        finally:
+            result.seconds = time.perf_counter() - started
+            observe_warmup(name, result.seconds, result.error is None)
+        if result.error is None:
+            logger.info(f"Warmed up {name} in {result.seconds:.2f}s")
+
+
+async def _check_database() -> None:
+    if not await test_db_connection():
+        raise RuntimeError("Database connection could not be established on startup.")
+
+
+async def _load_condition_index() -> None:
+    if settings.CONDITION_INDEX_ENABLED:
+        try:
+            async with AsyncSessionFactory() as db:
+                await load_condition_index(db)
+            return
+        except Exception as e:
+            # Questions about conditions are then answered by the model
+            logger.error(f"Failed to load the precomputed condition answers: {e}")
+    get_condition_index()
+
+
+def _open_export_worksheet(sheets_service: GoogleSheetsService) -> None:
+    if sheets_service.get_worksheet(settings.GOOGLE_SHEET_ID_EXPORT, SHEETS_EXPORT_WORKSHEET) is None:
+        raise RuntimeError(f"The worksheet '{SHEETS_EXPORT_WORKSHEET}' could not be opened.")
+
+
+def _load_models() -> None:
+    get_chat_model()
+    get_fallback_chat_model()
+    get_query_prompt()
+
+
+def startup_warmup(app: FastAPI) -> Warmup:
+    """
+    Returns the warm-up of the application, once `app.state.sheets_service` is set.
+    """
+    components: Dict[str, Callable[[], Any]] = {
+        "database": _check_database,
+        "condition_index": _load_condition_index,
+    }
+    if settings.WARMUP_ENABLED:
+        components.update({
+            "vector_store": vector_store.warm_up,
+            "models": _load_models,
+            "reranker": get_reranker,
+            "tokenizer": get_encoding,
+        })
+        sheets_service = app.state.sheets_service
+        if sheets_service is not None and settings.GOOGLE_SHEET_ID_EXPORT:
+            components["sheets_worksheet"] = lambda: _open_export_worksheet(sheets_service)
+    return Warmup(components, required=["database"])
@@ -1,3 +1,27 @@
 INVALID_UNICODE_CLEANUP_REGEX = r'[\p{Cf}\p{Cn}\p{Co}\p{Cs}\p{So}]'
+# Characters of a document read and split at a time during ingestion
+INGEST_SECTION_CHARS = 64 * 1024
+# Chunks deleted from the vector store at a time
+DELETE_BATCH_SIZE = 300
+# Worksheet of GOOGLE_SHEET_ID_EXPORT the job candidates are written to
+SHEETS_EXPORT_WORKSHEET = "TESTS"
+# Encoding of the embedding model, text-embedding-3-small
+CHUNK_ENCODING = "cl100k_base"
+# Chunk size and overlap in tokens by source type. Sections are kept whole
+# when they fit, so the overlap only applies within long sections.
+CHUNK_SIZES = {
+    "WEB_PAGE": (512, 64),
+    "DOCUMENT": (768, 96),
+}
 VECTOR_EMBEDDINGS_SIMILARITY_THRESHOLD = 1.15
+# Boost of the fused score of a chunk by source type. Q&A pairs are written
+# for the questions patients ask, so they outrank pages and documents
+# ranked about a place above them, but not further.
+RETRIEVAL_SOURCE_WEIGHTS = {
+    "QA_PAIR": 0.1,
+    "WEB_PAGE": 0.05,
+    "DOCUMENT": 0.0,
+}
+# Constant of the reciprocal rank fusion, 1 / (k + rank)
+RETRIEVAL_RRF_K = 10
 VECTOR_EMBEDDINGS_QUERY_SYSTEM_PROMPT = "You are an assistant for a naturopathic medicine clinic. For general questions, provide a brief, high-level summary as a reply but avoid long answers. Provide more detail if the user asks specific follow-up questions. Answer the question based only on the following context: {context}\n\nDo not tell the user to contact the clinic in your answer, simply provide the information requested.\n\nQuestion: {question}"
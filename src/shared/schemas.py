@@ -1,4 +1,4 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
@@ -11,6 +11,17 @@ class HealthResponse(BaseModel):
     sheets_connection: str
 
 
+class ComponentStatus(BaseModel):
+    status: str
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ReadinessResponse(BaseModel):
+    status: str
+    components: Dict[str, ComponentStatus]
+
+
 class InteractionMessage(BaseModel):
     role: InteractionType
     message: str
@@ -45,6 +56,9 @@ class DocumentData(BaseModel):
 
 class SourceData(BaseModel):
     webPageURL: Optional[str] = None
+    # Crawls the pages of the site of webPageURL rather than the single page
+    crawl: bool = False
+    maxPages: Optional[int] = Field(None, ge=1)
     qa_pair: Optional[QAPair] = None
     document: Optional[DocumentData] = None
 
@@ -66,7 +80,35 @@ class DeleteEmbeddingsRequest(BaseModel):
     sourceData: SourceData
 
 
+class BulkDeleteEmbeddingsRequest(BaseModel):
+    practiceId: str
+    documentNames: List[str] = []
+    questions: List[str] = []
+    webPageURLs: List[str] = []
+    allSources: bool = False  # Deletes every source of the practice
+
+
 class DeleteEmbeddingsResponse(BaseModel):
     status: str
     message: str
     deleted_count: int
+
+
+class StateCount(BaseModel):
+    day: date
+    state: str
+    sessions: int
+
+
+class StateCountsResponse(BaseModel):
+    practiceId: str
+    start: date
+    end: date
+    counts: List[StateCount]
+
+
+class FunnelResponse(BaseModel):
+    practiceId: str
+    start: date
+    end: date
+    states: Dict[str, int]
@@ -1,19 +1,282 @@
+import asyncio
 import datetime
+import hashlib
 import json
 import logging
+import time
 from typing import Any, Dict, List, Optional
 
+import orjson
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AIMessage, SystemMessage, BaseMessage
 from langchain_core.tools import BaseTool
+from opentelemetry import trace
 
 from src.config import settings
 from src.services.google_sheets import GoogleSheetsService
+from src.shared.constants import SHEETS_EXPORT_WORKSHEET
+from src.services.llm import (
+    ModelUnavailableError,
+    get_circuit_breaker,
+    get_fallback_chat_model,
+    get_latency_window,
+    get_limiter,
+    get_single_flight,
+    get_timeout,
+    llm_priority,
+)
 from src.shared.enums import InteractionType
 from src.shared.schemas import InteractionMessage
 from src.shared.utils.history import get_langchain_history
+from src.shared.utils.metrics import (
+    observe_circuit,
+    observe_coalesced_call,
+    observe_llm_call,
+    observe_llm_queue,
+    observe_llm_request,
+    observe_sheets_export,
+)
+from src.shared.utils.resilience import OverloadedError
+from src.shared.utils.tracing import set_token_usage
 
 logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+ESTIMATED_OUTPUT_TOKENS = 256
+
+
+def get_model_name(model: Any) -> str:
+    """Returns the provider model name of a LangChain chat model, or its class name."""
+    bound = getattr(model, "bound", None)
+    if bound is not None:
+        model = bound
+    return (
+        getattr(model, "model_name", None)
+        or getattr(model, "model", None)
+        or type(model).__name__
+    )
+
+
+def _estimate_tokens(messages: List[BaseMessage]) -> int:
+    # About 4 characters per token, plus a typical answer
+    return sum(len(str(message.content)) for message in messages) // 4 + ESTIMATED_OUTPUT_TOKENS
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+async def _call_model(
+    model: BaseChatModel,
+    messages: List[BaseMessage],
+    operation: str,
+    tool: BaseTool | None,
+) -> BaseMessage:
+    """
+    Makes a single call to a chat model, bound to `tool` if given, inside an
+    LLM span, recording its latency, token usage and outcome.
+
+    The call first waits for the concurrency limiter of the model.
+
+    Raises:
+        OverloadedError: If the model has no capacity for the call in time.
+    """
+    model_name = get_model_name(model)
+    name = tool.name if tool else operation
+    runnable = model.bind_tools([tool], tool_choice=tool.name) if tool else model
+    breaker = get_circuit_breaker(model_name)
+    limiter = get_limiter(model_name)
+    with tracer.start_as_current_span(
+        f"llm {operation}",
+        kind=trace.SpanKind.CLIENT,
+        attributes={
+            "gen_ai.operation.name": operation,
+            "gen_ai.request.model": model_name,
+        },
+    ) as span:
+        if tool:
+            span.set_attribute("gen_ai.tool.name", tool.name)
+
+        tokens = _estimate_tokens(messages)
+        queued = time.perf_counter()
+        try:
+            await limiter.acquire(tokens, llm_priority.get())
+        except OverloadedError:
+            observe_llm_queue(model_name, time.perf_counter() - queued, False, limiter.limit)
+            raise
+        observe_llm_queue(model_name, time.perf_counter() - queued, True, limiter.limit)
+        span.set_attribute("llm.queue_seconds", time.perf_counter() - queued)
+
+        started = time.perf_counter()
+        response = None
+        outcome = "error"
+        overloaded = False
+        try:
+            response = await runnable.ainvoke(messages)
+            outcome = "ok"
+        except asyncio.CancelledError:
+            # Lost to a hedged call or ran out of budget, the caller decides
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            overloaded = _is_rate_limited(e)
+            breaker.record_failure()
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            usage = getattr(response, "usage_metadata", None) or {}
+            limiter.release(
+                tokens,
+                used_tokens=usage.get("total_tokens"),
+                seconds=seconds if response is not None else None,
+                overloaded=overloaded,
+            )
+            observe_llm_call(name, model_name, seconds, response, outcome)
+            observe_circuit(model_name, breaker.is_open)
+        breaker.record_success()
+        get_latency_window(model_name, name).add(seconds)
+        set_token_usage(span, response)
+        return response
+
+
+def _hedge_delay(model: BaseChatModel, name: str, budget: float) -> float:
+    latency = get_latency_window(get_model_name(model), name).quantile(settings.LLM_HEDGE_QUANTILE)
+    if latency is None:
+        # Not enough calls yet to know what is slow, leave half of the budget to the secondary model
+        latency = budget / 2
+    return min(max(latency, settings.LLM_HEDGE_MIN_DELAY), budget / 2)
+
+
+async def _invoke_with_fallback(
+    model: BaseChatModel,
+    messages: List[BaseMessage],
+    operation: str,
+    tool: BaseTool | None = None,
+) -> BaseMessage:
+    """
+    Invokes a chat model, bound to `tool` if given, within the latency budget
+    of the tool or operation.
+
+    When a secondary model is configured, it is also called if the primary
+    model has not answered after the usual (p95) latency of its recent calls,
+    and the first answer is used. It replaces the primary model when that
+    fails or its circuit is open.
+
+    Raises:
+        ModelUnavailableError: If the circuit of every model is open.
+        OverloadedError: If no model had capacity for the call.
+        TimeoutError: If no model answered within the budget.
+    """
+    name = tool.name if tool else operation
+    budget = get_timeout(name)
+    fallback = get_fallback_chat_model()
+    candidates = [model] if fallback is None or fallback is model else [model, fallback]
+    tasks: Dict[asyncio.Task, BaseChatModel] = {}
+
+    def start_next() -> bool:
+        while candidates:
+            candidate = candidates.pop(0)
+            if get_circuit_breaker(get_model_name(candidate)).allow():
+                tasks[asyncio.create_task(_call_model(candidate, messages, operation, tool))] = candidate
+                return True
+        return False
+
+    started = time.perf_counter()
+    outcome = "ok"
+    if not start_next():
+        observe_llm_request(name, "none", "unavailable", 0)
+        raise ModelUnavailableError(f"No model available for {name}: every circuit is open.")
+    if tasks[next(iter(tasks))] is not model:
+        outcome = "fallback"
+    hedge_at = _hedge_delay(model, name, budget) if candidates and settings.LLM_HEDGE_ENABLED else None
+
+    last_error = None
+    try:
+        while tasks:
+            elapsed = time.perf_counter() - started
+            if elapsed >= budget:
+                break
+            timeout = budget - elapsed
+            if hedge_at is not None:
+                timeout = min(timeout, max(hedge_at - elapsed, 0))
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                if hedge_at is not None and time.perf_counter() - started >= hedge_at:
+                    hedge_at = None
+                    if start_next():
+                        outcome = "hedged"
+                        logger.info(f"Model call for {name} is slow, sending a hedged call.")
+                continue
+
+            for task in done:
+                candidate = tasks.pop(task)
+                if task.exception() is None:
+                    observe_llm_request(
+                        name, get_model_name(candidate), outcome, time.perf_counter() - started
+                    )
+                    return task.result()
+                last_error = task.exception()
+                logger.warning(f"Model call to {get_model_name(candidate)} for {name} failed: {last_error}")
+
+            if not tasks:
+                hedge_at = None
+                if start_next():
+                    outcome = "fallback"
+
+        if last_error is not None and not tasks:
+            outcome = "overloaded" if isinstance(last_error, OverloadedError) else "error"
+            observe_llm_request(name, "none", outcome, time.perf_counter() - started)
+            raise last_error
+
+        # The calls still running ran out of budget
+        for candidate in tasks.values():
+            get_circuit_breaker(get_model_name(candidate)).record_failure()
+        observe_llm_request(name, "none", "timeout", time.perf_counter() - started)
+        raise TimeoutError(f"No model answered {name} within {budget}s.")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _coalescing_key(
+    model: BaseChatModel,
+    messages: List[BaseMessage],
+    operation: str,
+    tool: BaseTool | None,
+) -> str:
+    payload = orjson.dumps([
+        get_model_name(model),
+        operation,
+        tool.name if tool else None,
+        [[message.type, message.content] for message in messages],
+    ])
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+async def _invoke_model(
+    model: BaseChatModel,
+    messages: List[BaseMessage],
+    operation: str,
+    tool: BaseTool | None = None,
+) -> BaseMessage:
+    """
+    Invokes a chat model, bound to `tool` if given, as `_invoke_with_fallback` does.
+
+    Identical calls (same model, operation, tool and messages) made at the
+    same time share a single request, as do calls arriving within
+    `LLM_COALESCE_TTL` seconds of its answer.
+    """
+    if not settings.LLM_COALESCE_ENABLED:
+        return await _invoke_with_fallback(model, messages, operation, tool)
+
+    response, shared = await get_single_flight().do(
+        _coalescing_key(model, messages, operation, tool),
+        lambda: _invoke_with_fallback(model, messages, operation, tool),
+    )
+    if shared:
+        observe_coalesced_call(tool.name if tool else operation)
+    return response
 
 
 async def call_single_tool(
@@ -31,18 +294,13 @@ async def call_single_tool(
     with the messages, and if the model decides to call the tool, it executes
     the tool with the provided arguments and returns the result.
     """
-    model_with_tools = model.bind_tools(
-        [tool_instance],
-        tool_choice=tool_instance.name
-    )
-
     full_system_prompt = system_prompt
     if context:
         full_system_prompt += f"\n\n## Context\n{context}"
     prompt_messages = [SystemMessage(content=full_system_prompt)] + messages
 
     try:
-        ai_msg = await model_with_tools.ainvoke(prompt_messages)
+        ai_msg = await _invoke_model(model, prompt_messages, "call_single_tool", tool_instance)
 
         if not isinstance(ai_msg, AIMessage):
             logger.warning(f"Expected an AIMessage, but got {type(ai_msg).__name__}")
@@ -60,6 +318,9 @@ async def call_single_tool(
         tool_output = tool_instance.invoke(tool_call["args"])
 
         return {tool_call["name"]: tool_output}
+    except OverloadedError:
+        # Rejected to shed load, the request fails with 503 instead of continuing without the tool
+        raise
     except Exception as e:
         logger.error(f"Error in call_single_tool: {e}", exc_info=True)
         return {}
@@ -92,8 +353,10 @@ async def generate_response_text(
     ] + get_langchain_history(history_messages)
 
     try:
-        response = await model.ainvoke(langchain_messages)
+        response = await _invoke_model(model, langchain_messages, "generate_response_text")
         return str(response.content)
+    except OverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_response_text: {e}")
         return ""
@@ -113,13 +376,15 @@ async def write_candidato_a_empleo_to_sheet(
         )
         return
 
+    started = time.perf_counter()
     try:
-        worksheet = sheets_service.get_worksheet(
-            spreadsheet_id=settings.GOOGLE_SHEET_ID_EXPORT,
-            worksheet_name="TESTS",
-        )
+        with tracer.start_as_current_span("sheets get_worksheet"):
+            worksheet = sheets_service.get_worksheet(
+                spreadsheet_id=settings.GOOGLE_SHEET_ID_EXPORT,
+                worksheet_name=SHEETS_EXPORT_WORKSHEET,
+            )
         if not worksheet:
-            logger.error("Could not find TESTS worksheet.")
+            logger.error(f"Could not find {SHEETS_EXPORT_WORKSHEET} worksheet.")
             return
 
         date_and_time = datetime.datetime.now().strftime("%Y/%m/%d %H:%M")
@@ -142,7 +407,9 @@ async def write_candidato_a_empleo_to_sheet(
             conversation_str,
         ]
 
-        sheets_service.append_row(worksheet, row_to_append)
+        with tracer.start_as_current_span("sheets append_row"):
+            sheets_service.append_row(worksheet, row_to_append)
+        observe_sheets_export(time.perf_counter() - started)
         interaction_data["sheet_row_added"] = True
         logger.info("Successfully wrote data for job candidate to Google Sheet and marked as added.")
 
@@ -1,28 +1,201 @@
+from datetime import datetime, timezone
+from collections.abc import Sequence
+from typing import Any, Iterable, Optional
+
 from langchain_core.messages import AIMessage, HumanMessage, BaseMessage, ToolMessage
 
 from src.shared.enums import InteractionType
 from src.shared.schemas import InteractionMessage
 
+# Roles are stored on `ChatMessage` as their index in this tuple
+ROLES = (InteractionType.USER, InteractionType.MODEL, InteractionType.TOOL)
+ROLE_CODES = {role.value: code for code, role in enumerate(ROLES)}
+
+_UNSET = object()
+
+
+def _format_timestamp(timestamp: float) -> str:
+    # Same format as `InteractionMessage.model_dump(mode="json")`
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class ChatMessage:
+    """
+    Compact form of an `InteractionMessage` used for the conversation history.
+
+    The role is kept as a small int and the timestamp as epoch seconds.
+    Messages read from storage keep the dict they were decoded from, so
+    saving them again costs nothing, and their timestamp is only parsed
+    when it is read. The LangChain message is built once, on first use.
+    """
+
+    __slots__ = ("role_code", "message", "tool_calls", "_timestamp", "_stored", "_langchain")
+
+    def __init__(
+        self,
+        role_code: int,
+        message: str,
+        tool_calls: Optional[list[str]] = None,
+        timestamp: Optional[float] = None,
+        stored: Optional[dict[str, Any]] = None,
+    ):
+        self.role_code = role_code
+        self.message = message
+        self.tool_calls = tool_calls
+        self._timestamp = timestamp
+        self._stored = stored
+        self._langchain = _UNSET
+
+    @classmethod
+    def from_stored(cls, data: dict[str, Any]) -> "ChatMessage":
+        return cls(ROLE_CODES[data["role"]], data["message"], data.get("tool_calls"), stored=data)
+
+    @classmethod
+    def from_interaction_message(cls, msg: InteractionMessage) -> "ChatMessage":
+        return cls(
+            ROLE_CODES[msg.role.value], msg.message, msg.tool_calls, msg.timestamp.timestamp()
+        )
+
+    @property
+    def role(self) -> InteractionType:
+        return ROLES[self.role_code]
+
+    @property
+    def timestamp(self) -> float:
+        if self._timestamp is None:
+            raw = self._stored.get("timestamp") if self._stored else None
+            self._timestamp = (
+                datetime.fromisoformat(raw).timestamp()
+                if raw
+                else datetime.now(timezone.utc).timestamp()
+            )
+        return self._timestamp
+
+    def to_stored(self) -> dict[str, Any]:
+        """
+        Returns the message in the format stored in the `messages` column.
+        """
+        if self._stored is None:
+            data = {"role": ROLES[self.role_code].value, "message": self.message}
+            if self.tool_calls is not None:
+                data["tool_calls"] = self.tool_calls
+            data["timestamp"] = _format_timestamp(self.timestamp)
+            self._stored = data
+        return self._stored
+
+    def to_interaction_message(self) -> InteractionMessage:
+        return InteractionMessage(
+            role=self.role,
+            message=self.message,
+            tool_calls=self.tool_calls,
+            timestamp=datetime.fromtimestamp(self.timestamp, timezone.utc),
+        )
+
+    def to_langchain(self) -> Optional[BaseMessage]:
+        """
+        Returns the message as a LangChain message, or None for roles that are not sent to the model.
+        """
+        if self._langchain is _UNSET:
+            self._langchain = _to_langchain(self.role, self.message)
+        return self._langchain
+
+
+def decode_messages(stored: Optional[Iterable[dict[str, Any]]]) -> list[ChatMessage]:
+    """
+    Builds the history of a conversation from the `messages` column.
+    """
+    return [ChatMessage.from_stored(data) for data in stored or ()]
+
+
+def encode_messages(messages: Iterable[ChatMessage | InteractionMessage]) -> list[dict[str, Any]]:
+    """
+    Converts a conversation history to the format stored in the `messages` column.
+    """
+    return [
+        (
+            msg if isinstance(msg, ChatMessage) else ChatMessage.from_interaction_message(msg)
+        ).to_stored()
+        for msg in messages
+    ]
+
+
+def _to_langchain(role: InteractionType, message: str) -> Optional[BaseMessage]:
+    if role == InteractionType.USER:
+        return HumanMessage(content=message)
+    if role == InteractionType.MODEL:
+        return AIMessage(content=message)
+    return None
+
+
+def _langchain_message(msg: ChatMessage | InteractionMessage) -> Optional[BaseMessage]:
+    if isinstance(msg, ChatMessage):
+        return msg.to_langchain()
+    return _to_langchain(msg.role, msg.message)
+
+
+class TurnHistory(Sequence):
+    """
+    Append-only view of the conversation history passed through the workflows of a turn.
+
+    The LangChain form of the history is kept next to the messages and only
+    the messages appended since the last model call are converted, so the
+    workflows of a turn do not convert the whole conversation again.
+    """
+
+    __slots__ = ("_messages", "_langchain", "_converted")
+
+    def __init__(self, messages: Iterable[ChatMessage | InteractionMessage] = ()):
+        self._messages = list(messages)
+        self._langchain: list[BaseMessage] = []
+        self._converted = 0
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def extend(self, messages: Iterable[ChatMessage | InteractionMessage]) -> None:
+        self._messages.extend(messages)
+
+    def langchain_messages(self) -> list[BaseMessage]:
+        """
+        Returns the history as LangChain messages. The list is shared by
+        every caller of the turn and must not be modified.
+        """
+        for msg in self._messages[self._converted:]:
+            langchain_msg = _langchain_message(msg)
+            if langchain_msg is not None:
+                self._langchain.append(langchain_msg)
+        self._converted = len(self._messages)
+        return self._langchain
+
 
 def get_langchain_history(
-    history_messages: list[InteractionMessage],
+    history_messages: Sequence[ChatMessage | InteractionMessage],
 ) -> list[BaseMessage]:
     """
     Converts the application's internal message history format to the
     format required by LangChain.
 
+    Messages of the stored history are converted once and reused on every
+    model call of the turn. A `TurnHistory` returns its own converted
+    messages, which must not be modified.
+
     Args:
         history_messages: A list of messages in the application's format.
 
     Returns:
         A list of `BaseMessage` objects ready to be sent to the model.
     """
+    if isinstance(history_messages, TurnHistory):
+        return history_messages.langchain_messages()
+
     langchain_history = []
     for msg in history_messages:
-        if msg.role == InteractionType.USER:
-            langchain_history.append(HumanMessage(content=msg.message))
-        elif msg.role == InteractionType.MODEL:
-            langchain_history.append(AIMessage(content=msg.message))
+        langchain_msg = _langchain_message(msg)
+        if langchain_msg is not None:
+            langchain_history.append(langchain_msg)
     return langchain_history
 
 
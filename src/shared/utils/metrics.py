@@ -0,0 +1,255 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+from src.config import settings
+
+REGISTRY = CollectorRegistry()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+CHATFLOW_TURN_SECONDS = Histogram(
+    "linden_chatflow_turn_seconds",
+    "Latency of a chatflow turn, labeled by the state the turn ended in.",
+    ["final_state"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+WORKFLOW_SECONDS = Histogram(
+    "linden_workflow_seconds",
+    "Execution time of a single workflow, labeled by the chatflow state it runs for.",
+    ["state"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+LLM_CALLS_PER_TURN = Histogram(
+    "linden_llm_calls_per_turn",
+    "Number of model calls made during a chatflow turn.",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15),
+    registry=REGISTRY,
+)
+LLM_CALL_SECONDS = Histogram(
+    "linden_llm_call_seconds",
+    "Latency of a single model call.",
+    ["tool", "model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "linden_llm_request_seconds",
+    "Latency of a model request within its budget, including hedged and fallback calls, "
+    "labeled by the model that answered and how the request was served "
+    "(ok, hedged, fallback, timeout, error, unavailable).",
+    ["tool", "model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+LLM_CIRCUIT_OPEN = Gauge(
+    "linden_llm_circuit_open",
+    "1 while calls to a model are skipped after consecutive failures.",
+    ["model"],
+    registry=REGISTRY,
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "linden_llm_queue_seconds",
+    "Time a model call waited for the concurrency limiter, labeled by whether it was admitted or rejected.",
+    ["model", "result"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "linden_llm_concurrency_limit",
+    "Current adaptive limit of concurrent calls to a model.",
+    ["model"],
+    registry=REGISTRY,
+)
+LLM_COALESCED_CALLS = Counter(
+    "linden_llm_coalesced_calls",
+    "Model calls answered by an identical call made at the same time instead of a request of their own.",
+    ["tool"],
+    registry=REGISTRY,
+)
+LLM_TOKENS = Histogram(
+    "linden_llm_tokens",
+    "Tokens sent to (input) and received from (output) the model per call.",
+    ["tool", "model", "direction"],
+    buckets=TOKEN_BUCKETS,
+    registry=REGISTRY,
+)
+VECTOR_SEARCH_SECONDS = Histogram(
+    "linden_vector_search_seconds",
+    "Latency of a vector store similarity search.",
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+INGEST_CHUNKS_PER_SECOND = Histogram(
+    "linden_ingest_chunks_per_second",
+    "Embedding ingest throughput of a single ingestion job.",
+    ["source_type"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+    registry=REGISTRY,
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "linden_db_pool_checkout_seconds",
+    "Time spent waiting for a database connection from the pool.",
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+SHEETS_EXPORT_LAG_SECONDS = Histogram(
+    "linden_sheets_export_lag_seconds",
+    "Time from starting a Google Sheets export until the row is appended.",
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+RERANK_SECONDS = Histogram(
+    "linden_rerank_seconds",
+    "Latency of re-ranking the chunks found for a query, labeled by whether the scores were cached (hit, miss).",
+    ["reranker", "cache"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+WARMUP_SECONDS = Gauge(
+    "linden_warmup_seconds",
+    "Time taken to initialize a component at startup, labeled by whether it succeeded (ok, failed).",
+    ["component", "outcome"],
+    registry=REGISTRY,
+)
+SESSION_CACHE_REQUESTS = Counter(
+    "linden_session_cache_requests",
+    "Session cache lookups (hit, miss) and entries found stale when saving a turn.",
+    ["result"],
+    registry=REGISTRY,
+)
+
+_llm_calls_in_turn: ContextVar[Optional[list]] = ContextVar("llm_calls_in_turn", default=None)
+
+
+class TurnMetrics:
+    """
+    Collects the metrics of a single chatflow turn.
+    The caller sets `final_state` before the turn finishes.
+    """
+
+    def __init__(self):
+        self.final_state: Optional[str] = None
+        self.llm_calls = 0
+
+
+@contextmanager
+def track_chatflow_turn() -> Iterator[TurnMetrics]:
+    """
+    Times a chatflow turn and counts the model calls made while it runs.
+    """
+    turn = TurnMetrics()
+    if not settings.METRICS_ENABLED:
+        yield turn
+        return
+
+    calls = []
+    token = _llm_calls_in_turn.set(calls)
+    started = time.perf_counter()
+    try:
+        yield turn
+    finally:
+        _llm_calls_in_turn.reset(token)
+        turn.llm_calls = len(calls)
+        CHATFLOW_TURN_SECONDS.labels(final_state=turn.final_state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+        LLM_CALLS_PER_TURN.observe(turn.llm_calls)
+
+
+def observe_workflow(state: str, seconds: float) -> None:
+    if settings.METRICS_ENABLED:
+        WORKFLOW_SECONDS.labels(state=state).observe(seconds)
+
+
+def observe_llm_call(
+    tool: str,
+    model: str,
+    seconds: float,
+    response: Any = None,
+    outcome: Optional[str] = None,
+) -> None:
+    """
+    Records a model call. Without an `outcome`, a call without `response` is recorded as failed.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+
+    calls = _llm_calls_in_turn.get()
+    if calls is not None:
+        calls.append(tool)
+
+    outcome = outcome or ("ok" if response is not None else "error")
+    LLM_CALL_SECONDS.labels(tool=tool, model=model, outcome=outcome).observe(seconds)
+
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.labels(tool=tool, model=model, direction="input").observe(usage.get("input_tokens", 0))
+        LLM_TOKENS.labels(tool=tool, model=model, direction="output").observe(usage.get("output_tokens", 0))
+
+
+def observe_llm_request(tool: str, model: str, outcome: str, seconds: float) -> None:
+    if settings.METRICS_ENABLED:
+        LLM_REQUEST_SECONDS.labels(tool=tool, model=model, outcome=outcome).observe(seconds)
+
+
+def observe_llm_queue(model: str, seconds: float, admitted: bool, limit: float) -> None:
+    if settings.METRICS_ENABLED:
+        LLM_QUEUE_SECONDS.labels(model=model, result="admitted" if admitted else "rejected").observe(seconds)
+        LLM_CONCURRENCY_LIMIT.labels(model=model).set(int(limit))
+
+
+def observe_coalesced_call(tool: str) -> None:
+    if settings.METRICS_ENABLED:
+        LLM_COALESCED_CALLS.labels(tool=tool).inc()
+
+
+def observe_circuit(model: str, is_open: bool) -> None:
+    if settings.METRICS_ENABLED:
+        LLM_CIRCUIT_OPEN.labels(model=model).set(1 if is_open else 0)
+
+
+def observe_vector_search(seconds: float) -> None:
+    if settings.METRICS_ENABLED:
+        VECTOR_SEARCH_SECONDS.observe(seconds)
+
+
+def observe_rerank(reranker: str, cache: str, seconds: float) -> None:
+    if settings.METRICS_ENABLED:
+        RERANK_SECONDS.labels(reranker=reranker, cache=cache).observe(seconds)
+
+
+def observe_ingest(source_type: str, chunks: int, seconds: float) -> None:
+    if settings.METRICS_ENABLED and chunks and seconds > 0:
+        INGEST_CHUNKS_PER_SECOND.labels(source_type=source_type).observe(chunks / seconds)
+
+
+def observe_pool_checkout(seconds: float) -> None:
+    if settings.METRICS_ENABLED:
+        DB_POOL_CHECKOUT_SECONDS.observe(seconds)
+
+
+def observe_sheets_export(seconds: float) -> None:
+    if settings.METRICS_ENABLED:
+        SHEETS_EXPORT_LAG_SECONDS.observe(seconds)
+
+
+def observe_session_cache(result: str) -> None:
+    if settings.METRICS_ENABLED:
+        SESSION_CACHE_REQUESTS.labels(result=result).inc()
+
+
+def observe_warmup(component: str, seconds: float, ok: bool) -> None:
+    if settings.METRICS_ENABLED:
+        WARMUP_SECONDS.labels(component=component, outcome="ok" if ok else "failed").set(seconds)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Returns the metrics in the Prometheus text format and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
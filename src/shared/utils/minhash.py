@@ -0,0 +1,135 @@
+import hashlib
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """
+    Returns the hashes of the runs of `size` words of a text, ignoring case and punctuation.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {_hash(" ".join(words))} if words else set()
+    return {_hash(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures, whose share of equal values estimates the
+    Jaccard similarity of the sets they were computed from.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: Iterable[int]) -> np.ndarray:
+        values = np.fromiter(hashes, dtype=np.uint64)
+        if not values.size:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        permuted = ((values[:, None] * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """
+    Finds near-duplicate texts with locality sensitive hashing of MinHash signatures.
+
+    Signatures are split in `bands` bands. Texts sharing a band are
+    candidates, kept as duplicates when their estimated similarity is at
+    least `threshold`. With 16 bands of 8 values, texts 90% similar are
+    candidates with a probability above 99.9%.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, bands: int = 16):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self._rows = num_perm // bands
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        """
+        Adds a text unless it is a near-duplicate of one already added.
+
+        Returns:
+            The key of the text it duplicates, or None if it was added.
+        """
+        signature = self.hasher.signature(shingles(text))
+        bands = [
+            signature[i * self._rows:(i + 1) * self._rows].tobytes() for i in range(len(self._buckets))
+        ]
+        for buckets, band in zip(self._buckets, bands):
+            for candidate in buckets.get(band, ()):
+                if similarity(signature, self._signatures[candidate]) >= self.threshold:
+                    return candidate
+
+        self._signatures[key] = signature
+        for buckets, band in zip(self._buckets, bands):
+            buckets.setdefault(band, []).append(key)
+        return None
+
+
+def split_blocks(text: str) -> List[str]:
+    """Splits markdown into its blocks of text, separated by blank lines."""
+    return [block for block in re.split(r"\n\s*\n", text) if block.strip()]
+
+
+def block_key(block: str) -> Optional[str]:
+    """
+    Returns the key of a block of text for comparisons, or None for headings,
+    which are kept for the structure of every page.
+    """
+    if block.lstrip().startswith("#"):
+        return None
+    return " ".join(block.lower().split())
+
+
+def remove_boilerplate(
+    pages: Dict[str, str], min_pages: int = 3, share: float = 0.5
+) -> tuple[Dict[str, str], List[str]]:
+    """
+    Removes the blocks of text found on at least `share` of the pages and
+    on at least `min_pages` pages, e.g. navigation, headers and footers
+    repeated across a site.
+
+    Returns:
+        The pages without boilerplate, and the boilerplate blocks in the order they were found.
+    """
+    counts = Counter()
+    for text in pages.values():
+        counts.update({key for key in map(block_key, split_blocks(text)) if key})
+    limit = max(min_pages, share * len(pages))
+    boilerplate = {key for key, count in counts.items() if count >= limit}
+    if not boilerplate:
+        return pages, []
+
+    found: Dict[str, str] = {}
+    cleaned = {}
+    for url, text in pages.items():
+        blocks = []
+        for block in split_blocks(text):
+            key = block_key(block)
+            if key in boilerplate:
+                found.setdefault(key, block)
+            else:
+                blocks.append(block)
+        cleaned[url] = "\n\n".join(blocks)
+    return cleaned, list(found.values())
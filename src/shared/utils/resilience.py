@@ -0,0 +1,282 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency.
+
+    The circuit opens after `failure_threshold` consecutive failures. Once
+    `reset_timeout` seconds have passed it lets a single trial call through:
+    a success closes it again, a failure keeps it open for another period.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._next_trial_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Returns whether a call may be made now."""
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now < self._next_trial_at:
+            return False
+        # A trial call that never reports back, e.g. because it was cancelled, allows another one later
+        self._next_trial_at = now + self.reset_timeout
+        return True
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed.")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+            self._next_trial_at = self.opened_at + self.reset_timeout
+
+
+class LatencyWindow:
+    """
+    The latencies of the most recent calls, used to estimate percentiles.
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the `q` quantile of the window, or None until it holds `min_samples` samples."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class OverloadedError(ValueError):
+    """Custom exception for a call rejected because the wait for capacity is too long."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    Limits the concurrent calls to a rate limited dependency.
+
+    The concurrency limit adapts with AIMD: it grows by one for every `limit`
+    successful calls and is halved, at most once per typical call latency,
+    when the dependency signals it is overloaded. An optional token budget
+    per minute is refilled continuously and charged with an estimate before
+    each call, corrected with the actual usage afterwards.
+
+    Waiting calls are served by priority (lower first), then in arrival
+    order. A call whose wait is expected to exceed `queue_timeout`, or that
+    waits that long, is rejected with `OverloadedError`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        tokens_per_minute: int,
+        queue_timeout: float,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.latency = 1.0  # Moving average of call latency in seconds
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._waiters: list = []
+        self._arrivals = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60,
+            )
+        self._refilled_at = now
+
+    def _can_start(self, tokens: int) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        # A call larger than the whole budget only waits for a full budget
+        return not self.tokens_per_minute or self._tokens >= min(tokens, self.tokens_per_minute)
+
+    def _start(self, tokens: int) -> None:
+        self.in_flight += 1
+        if self.tokens_per_minute:
+            self._tokens -= tokens
+
+    def _expected_wait(self, tokens: int, ahead: int) -> float:
+        wait = ahead / max(self.limit, 1) * self.latency
+        if self.tokens_per_minute and self._tokens < tokens:
+            wait += (min(tokens, self.tokens_per_minute) - self._tokens) * 60 / self.tokens_per_minute
+        return wait
+
+    def _wake(self) -> None:
+        self._wakeup = None
+        self._refill()
+        while self._waiters:
+            priority, arrival, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_start(tokens):
+                break
+            heapq.heappop(self._waiters)
+            self._start(tokens)
+            future.set_result(None)
+
+        if (
+            self._waiters
+            and self.tokens_per_minute
+            and self._wakeup is None
+            and self.in_flight < int(self.limit)
+        ):
+            # Only the token budget holds back the first waiter, wake up when it is refilled
+            tokens = min(self._waiters[0][2], self.tokens_per_minute)
+            delay = max((tokens - self._tokens) * 60 / self.tokens_per_minute, 0.01)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    async def acquire(self, tokens: int = 0, priority: int = 0) -> None:
+        """
+        Waits for a slot for a call expected to use `tokens` tokens.
+
+        Raises:
+            OverloadedError: If the slot is not available within `queue_timeout`.
+        """
+        self._refill()
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority and not waiter[3].done())
+        if not ahead and self._can_start(tokens):
+            self._start(tokens)
+            return
+
+        expected_wait = self._expected_wait(tokens, ahead + 1)
+        if expected_wait > self.queue_timeout:
+            raise OverloadedError(
+                f"{self.name} is overloaded, expected wait {expected_wait:.1f}s", expected_wait
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), tokens, future))
+        self._wake()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # The slot was granted as the wait timed out
+                self.release(tokens)
+            raise OverloadedError(
+                f"{self.name} is overloaded, no slot within {self.queue_timeout}s",
+                self._expected_wait(tokens, len(self._waiters)),
+            )
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted as the caller was cancelled
+                self.release(tokens)
+            raise
+
+    def release(
+        self,
+        tokens: int = 0,
+        used_tokens: Optional[int] = None,
+        seconds: Optional[float] = None,
+        overloaded: bool = False,
+    ) -> None:
+        """
+        Frees the slot of a call, with its actual token usage, its latency if
+        it succeeded, or whether the dependency signalled it is overloaded.
+        """
+        self.in_flight -= 1
+        if self.tokens_per_minute and used_tokens is not None:
+            self._tokens -= used_tokens - tokens
+
+        now = time.monotonic()
+        if overloaded:
+            if self.tokens_per_minute:
+                self._tokens = min(self._tokens, 0)
+            if now - self._decreased_at >= self.latency:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._decreased_at = now
+                logger.warning(f"{self.name} is overloaded, concurrency limit lowered to {int(self.limit)}.")
+        elif seconds is not None:
+            self.latency = 0.9 * self.latency + 0.1 * seconds
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        self._wake()
+
+
+class SingleFlight:
+    """
+    Shares one execution between concurrent calls with the same key.
+
+    The shared call runs in its own task, so it is not cancelled with the
+    caller that started it. Successful results are kept for `ttl` seconds
+    for calls arriving just after, in at most `max_keys` entries. Failures
+    are not kept.
+    """
+
+    def __init__(self, ttl: float, max_keys: int):
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._results = TTLCache(maxsize=max_keys, ttl=ttl) if ttl > 0 else None
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Returns the result of `func()`, and whether it was shared with another call.
+        """
+        if self._results is not None and key in self._results:
+            return self._results[key], True
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = asyncio.create_task(func())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), False
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self._results is not None:
+            self._results[key] = task.result()
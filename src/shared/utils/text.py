@@ -0,0 +1,112 @@
+"""
+Normalizes text before it is embedded or searched.
+
+Text is NFKC normalized, then the characters matched by
+`INVALID_UNICODE_CLEANUP_REGEX` are removed, line breaks are unified,
+trailing spaces removed and runs of blank lines collapsed. Spaces within
+lines are kept, as they align the columns of markdown tables and code.
+Queries are collapsed to a single line.
+
+Large texts are normalized in slices ending at line breaks. Slices of ASCII
+only skip the Unicode passes, and in slices with few non-ASCII characters
+only the runs of these characters are normalized and cleaned up.
+"""
+import re
+import unicodedata
+from typing import Iterable, Iterator
+
+import regex
+
+from src.shared.constants import INVALID_UNICODE_CLEANUP_REGEX
+
+# Characters of a text normalized at a time
+_SLICE_CHARS = 64 * 1024
+# Extra UTF-8 bytes per character below which only the runs of non-ASCII characters are normalized
+_SPARSE_NON_ASCII = 0.01
+
+_INVALID = regex.compile(f"{INVALID_UNICODE_CLEANUP_REGEX}+")
+_NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+_LINE_BREAKS = ("\r\n", "\r", "\x0b", "\x0c", "\x85", "\u2028", "\u2029")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_runs(text: str) -> str:
+    """
+    Normalizes and cleans up the runs of non-ASCII characters of a text.
+
+    ASCII characters are never composed with the characters before them, so
+    each run can be normalized on its own with the character before it.
+    """
+    pieces = []
+    end = 0
+    for match in _NON_ASCII.finditer(text):
+        start = max(match.start() - 1, end)
+        pieces.append(text[end:start])
+        pieces.append(_INVALID.sub("", unicodedata.normalize("NFKC", text[start:match.end()])))
+        end = match.end()
+    pieces.append(text[end:])
+    return "".join(pieces)
+
+
+def _normalize_slice(text: str) -> str:
+    if not text.isascii():
+        non_ascii = len(text.encode("utf-8", "surrogatepass")) - len(text)
+        if non_ascii < _SPARSE_NON_ASCII * len(text):
+            text = _normalize_runs(text)
+        else:
+            text = _INVALID.sub("", unicodedata.normalize("NFKC", text))
+    # Plain string searches are much faster than regular expressions over large texts
+    for line_break in _LINE_BREAKS:
+        if line_break in text:
+            text = text.replace(line_break, "\n")
+    if " \n" in text or "\t\n" in text or text.endswith((" ", "\t")):
+        text = "\n".join(line.rstrip(" \t") for line in text.split("\n"))
+    while "\n\n\n" in text:
+        text = text.replace("\n\n\n", "\n\n")
+    return text
+
+
+def _slices(text: str) -> Iterator[str]:
+    """Splits a text in slices of about `_SLICE_CHARS` characters ending after a line break."""
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + _SLICE_CHARS)
+        if end == -1:
+            yield text[start:]
+            return
+        while end < len(text) and text[end] == "\n":
+            end += 1
+        yield text[start:end]
+        start = end
+
+
+def normalize_sections(sections: Iterable[str]) -> Iterator[str]:
+    """
+    Normalizes a text read in sections ending at line breaks, e.g. by
+    `_read_sections` of the embeddings service. Blank lines between
+    sections are collapsed as within them.
+    """
+    # Line breaks at the end of the text normalized so far
+    trailing = 0
+    for section in sections:
+        text = _normalize_slice(section)
+        if trailing:
+            leading = len(text) - len(text.lstrip("\n"))
+            text = text[max(0, leading - max(0, 2 - trailing)):]
+        if not text:
+            continue
+        stripped = text.rstrip("\n")
+        trailing = len(text) - len(stripped) if stripped else trailing + len(text)
+        yield text
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes a text to be embedded, see the module docstring."""
+    if len(text) <= _SLICE_CHARS:
+        return _normalize_slice(text)
+    return "".join(normalize_sections(_slices(text)))
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a search query like the text it is matched with, on a single line."""
+    return _WHITESPACE.sub(" ", normalize_text(query)).strip()
@@ -0,0 +1,106 @@
+import logging
+from typing import Any, Optional, TextIO
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+_tracer_provider: Optional[TracerProvider] = None
+# Written by the "file" exporter, closed by shutdown_tracing
+_trace_file: Optional[TextIO] = None
+
+
+def setup_tracing() -> None:
+    """
+    Configures the global tracer provider when tracing is enabled.
+
+    Spans are exported to an OTLP collector, or appended as JSON lines to a
+    local file when `TRACING_EXPORTER` is "file". When tracing is disabled the
+    OpenTelemetry API falls back to no-op tracers.
+    """
+    global _tracer_provider, _trace_file
+    if not settings.TRACING_ENABLED or _tracer_provider is not None:
+        return
+
+    if settings.TRACING_EXPORTER == "file":
+        _trace_file = open(settings.TRACING_FILE_PATH, "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(
+            out=_trace_file,
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    elif settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    else:
+        logger.error(f"Unsupported tracing exporter: {settings.TRACING_EXPORTER}. Tracing disabled.")
+        return
+
+    _tracer_provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.PROJECT_NAME})
+    )
+    _tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_tracer_provider)
+    logger.info(f"Tracing enabled with the '{settings.TRACING_EXPORTER}' exporter.")
+
+
+def shutdown_tracing() -> None:
+    """Flushes pending spans, shuts down the tracer provider and closes the trace file."""
+    global _trace_file
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Creates a client span for every statement executed by the engine.
+    Listeners are only attached when tracing is enabled.
+    """
+    if not settings.TRACING_ENABLED:
+        return
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_statement_span(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "QUERY"
+        context._otel_span = tracer.start_span(
+            f"db {operation}",
+            kind=SpanKind.CLIENT,
+            attributes={"db.system": "postgresql", "db.statement": statement},
+        )
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _end_statement_span(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_otel_span", None)
+        if span is not None:
+            span.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _fail_statement_span(exception_context):
+        span = getattr(exception_context.execution_context, "_otel_span", None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+
+
+def set_token_usage(span: Span, message: Any) -> None:
+    """Copies the token usage reported on a model response into span attributes."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    span.set_attribute("gen_ai.usage.input_tokens", usage.get("input_tokens", 0))
+    span.set_attribute("gen_ai.usage.output_tokens", usage.get("output_tokens", 0))
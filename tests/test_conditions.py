@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from src.api.chatflow import workflows
+from src.api.chatflow.conditions import ConditionIndex
+from src.shared.enums import InteractionType
+from src.shared.schemas import InteractionMessage
+
+
+def _history(*messages: str) -> list[InteractionMessage]:
+    return [InteractionMessage(role=InteractionType.USER, message=message) for message in messages]
+
+
+@pytest.fixture(scope="module")
+def index() -> ConditionIndex:
+    return ConditionIndex()
+
+
+@pytest.mark.parametrize("messages, condition", [
+    (["Do you treat anxiety?"], "anxiety"),
+    (["Can you help with my IBS and bloating?"], "IBS"),
+    (["I have Hashimoto’s, is that something you treat?"], "Hashimoto’s"),
+    (["Hi", "Do you see patients with PCOS"], "PCOS"),
+])
+def test_match_treated_condition(index, messages, condition):
+    match = index.match(_history(*messages))
+    assert match is not None and match.condition == condition
+
+
+@pytest.mark.parametrize("messages", [
+    # Only the latest message is matched
+    ["I have anxiety", "Do you treat gout?"],
+    # Negations
+    ["I don't have anxiety but do you treat gout?"],
+    ["I have no energy"],
+    # Generic goals are not conditions
+    ["Do you treat sleep apnea?"],
+    ["Can you help with my mood?"],
+    # Words outside of the condition may name something else
+    ["hair loss from thyroid conditions"],
+    ["Do you treat anxiety and gout?"],
+    # Only treated in some cases
+    ["Do you treat type 1 diabetes?"],
+    ["My son has autism"],
+    ["Do you treat skin issues?"],
+    # Acronyms of two letters only match in capitals
+    ["do you treat ms"],
+    # Several categories
+    ["Do you treat anxiety and IBS?"],
+])
+def test_match_defers_to_the_model(index, messages):
+    assert index.match(_history(*messages)) is None
+
+
+@pytest.mark.parametrize("messages", [
+    ["I'm in CA", "Do you treat anxiety?"],
+    ["I live in San Diego", "Do you treat anxiety?"],
+    ["I live in California", "Hi", "Thanks", "Ok", "Do you treat anxiety?"],
+    ["Do you treat anxiety?"],
+])
+def test_doctor_is_chosen_by_the_model(index, monkeypatch, messages):
+    history = _history(*messages)
+    match = index.match(history)
+    assert match is not None
+    interaction_data = {"condition_match": {"condition": match.condition, "category": match.category, "doctor": None}}
+    tool_calls = []
+
+    async def call_single_tool(langchain_messages, model, tool, system_prompt):
+        tool_calls.append((langchain_messages, tool))
+        return {"send_doctor_information": "Dr. Silva, the only doctor licensed in California"}
+
+    async def generate_response_text(history_messages, model, system_prompt, context):
+        return context
+
+    monkeypatch.setattr(workflows, "call_single_tool", call_single_tool)
+    monkeypatch.setattr(workflows, "generate_response_text", generate_response_text)
+    asyncio.run(workflows.recommended_doctor_workflow(history, interaction_data, None, None))
+
+    # The whole conversation is sent to the model
+    assert len(tool_calls) == 1 and len(tool_calls[0][0]) == len(messages)
+    assert "Dr. Silva" in interaction_data["doctor_recommendation_response"]
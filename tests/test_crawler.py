@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.services import crawler
+
+
+@pytest.mark.parametrize("url, public", [
+    ("http://8.8.8.8/", True),
+    ("http://127.0.0.1:8000/admin", False),
+    ("http://[::1]/", False),
+    ("http://10.0.0.1/", False),
+    ("http://192.168.1.1/", False),
+    ("http://169.254.169.254/latest/meta-data/", False),
+    ("http://0.0.0.0/", False),
+    ("file:///etc/passwd", False),
+])
+def test_is_public(url, public):
+    assert asyncio.run(crawler._is_public(url)) is public
+
+
+def test_crawl_site_rejects_private_root_url():
+    assert asyncio.run(crawler.crawl_site("http://127.0.0.1/", 10)) == []
+
+
+def _get(url: str, routes: dict[str, httpx.Response], private_hosts: set[str]):
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        return routes[str(request.url)]
+
+    async def is_public(url: str) -> bool:
+        return httpx.URL(url).host not in private_hosts
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            site_crawler = crawler.SiteCrawler("https://example.com/", 10, client)
+            return await site_crawler._get(url)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(crawler, "_is_public", is_public)
+        monkeypatch.setattr(crawler.settings, "CRAWL_HOST_REQUESTS_PER_SECOND", 1000)
+        response = asyncio.run(main())
+    return response, requested
+
+
+def test_redirects_are_followed_on_the_same_site():
+    response, requested = _get("https://example.com/old", {
+        "https://example.com/old": httpx.Response(301, headers={"location": "/new"}),
+        "https://example.com/new": httpx.Response(302, headers={"location": "https://www.example.com/new"}),
+        "https://www.example.com/new": httpx.Response(200, text="<html></html>"),
+    }, set())
+    assert response is not None and str(response.url) == "https://www.example.com/new"
+    assert len(requested) == 3
+
+
+def test_redirects_to_other_hosts_are_not_requested():
+    response, requested = _get("https://example.com/", {
+        "https://example.com/": httpx.Response(302, headers={"location": "http://169.254.169.254/latest/meta-data/"}),
+    }, set())
+    assert response is None and requested == ["https://example.com/"]
+
+
+def test_private_addresses_are_not_requested():
+    response, requested = _get("https://internal.example.com/", {}, {"internal.example.com"})
+    assert response is None and requested == []
+
+
+def test_redirect_loops_are_cut():
+    response, requested = _get("https://example.com/loop", {
+        "https://example.com/loop": httpx.Response(302, headers={"location": "/loop"}),
+    }, set())
+    assert response is None and len(requested) == crawler._MAX_REDIRECTS + 1
@@ -0,0 +1,40 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.services import embeddings
+from src.services.crawler import CrawledPage
+
+
+class _PageSplitter:
+    def split_text(self, text: str) -> list[str]:
+        return [text]
+
+
+def test_pages_differing_by_query_string_get_distinct_ids(monkeypatch):
+    pages = [
+        CrawledPage(url="https://example.com/team?doctor=silva", title="Dr. Silva", markdown="Dr. Silva focuses on women's health and hormones."),
+        CrawledPage(url="https://example.com/team?doctor=jeffrey", title="Dr. Jeffrey", markdown="Dr. Jeffrey treats digestive and autoimmune conditions."),
+        CrawledPage(url="https://example.com/team/", title="Team", markdown="Meet our naturopathic doctors in Newington, NH."),
+    ]
+    stored = []
+
+    async def crawl_site(root_url, max_pages):
+        return pages
+
+    async def replace_source(practice_id, source, where, write):
+        return await write(1)
+
+    async def ingest_documents(documents, source_type, job, practice_id):
+        stored.extend(documents)
+        return SimpleNamespace(stored=len(stored))
+
+    monkeypatch.setattr(embeddings, "crawl_site", crawl_site)
+    monkeypatch.setattr(embeddings, "replace_source", replace_source)
+    monkeypatch.setattr(embeddings, "ingest_documents", ingest_documents)
+    monkeypatch.setattr(embeddings, "get_chunker", lambda source_type: _PageSplitter())
+
+    assert asyncio.run(embeddings.store_data_from_site("https://example.com", "practice")) == (3, 3)
+    ids = [document.id for document in stored]
+    assert len(set(ids)) == 3
+    assert all(document.metadata["doc_id"] == document.id for document in stored)
+    assert embeddings._page_doc_id("https://example.com/team") != embeddings._page_doc_id("https://example.com/team/")
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from src.api.chatflow import handler
+from src.api.chatflow.graph import (
+    MAX_WORKFLOW_HOPS,
+    GraphValidationError,
+    UndeclaredTransitionError,
+    compile_chatflow_graph,
+    get_chatflow_graph,
+)
+from src.api.chatflow.state import ChatflowState as S
+from src.api.chatflow.workflows import WORKFLOWS
+from src.shared.enums import InteractionType
+from src.shared.schemas import InteractionMessage
+
+
+def _workflow(next_state: S, message: str | None = None):
+    async def workflow(history_messages, interaction_data, model, sheets_service):
+        messages = [InteractionMessage(role=InteractionType.MODEL, message=message)] if message else []
+        return messages, next_state, None, interaction_data
+    return workflow
+
+
+def _spec(*nodes: dict) -> dict:
+    return {"graph": {"id": "test", "nodes": list(nodes)}}
+
+
+START = {"id": "START", "decision": {"state": "START", "user_reply": "CLASSIFYING_INTENT"}}
+CLASSIFY = {
+    "id": "CLASSIFYING_INTENT",
+    "action": "use_tools",
+    "tools": [{"name": "classify_intent", "type": "enum"}, {"name": "pending_user_data", "type": "boolean-flag"}],
+    "decision": {
+        "state": "CLASSIFYING_INTENT",
+        "classify_intent:_is_potential_patient": "BOOK_CALL_OFFER_ACCEPTED",
+        "classify_intent:_is_goodbye": "INTENT_GOODBYE",
+    },
+}
+BOOK_CALL = {
+    "id": "BOOK_CALL_OFFER_ACCEPTED",
+    "action": "use_special_function",
+    "function_name": "send_book_call_link",
+    "message": "$PROMPT_OFFER_NEWSLETTER",
+    "next": "AWAITING_NEW_MESSAGE",
+}
+GOODBYE = {"id": "INTENT_GOODBYE", "action": "send_message", "message": "$PROMPT_INTENT_GOODBYE", "next": "AWAITING_NEW_MESSAGE"}
+AWAITING = {"id": "AWAITING_NEW_MESSAGE", "decision": {"state": "AWAITING_NEW_MESSAGE", "user_reply": "CLASSIFYING_INTENT"}}
+
+WORKFLOWS_BY_STATE = {
+    S.IDLE: _workflow(S.CLASSIFYING_INTENT),
+    S.CLASSIFYING_INTENT: _workflow(S.BOOK_CALL_OFFER_ACCEPTED),
+    S.BOOK_CALL_OFFER_ACCEPTED: _workflow(S.AWAITING_NEW_MESSAGE, "Here is the link"),
+    S.INTENT_GOODBYE: _workflow(S.AWAITING_NEW_MESSAGE, "Goodbye"),
+    S.AWAITING_NEW_MESSAGE: _workflow(S.AWAITING_NEW_MESSAGE),
+}
+
+
+def test_compile_start_is_idle():
+    graph = compile_chatflow_graph(_spec(START, CLASSIFY, BOOK_CALL, GOODBYE, AWAITING), WORKFLOWS_BY_STATE)
+    assert graph.allows(S.IDLE, S.CLASSIFYING_INTENT)
+    assert graph.awaits_user_input(S.IDLE) and graph.awaits_user_input(S.AWAITING_NEW_MESSAGE)
+    assert graph.states_requiring_llm == {S.CLASSIFYING_INTENT, S.BOOK_CALL_OFFER_ACCEPTED}
+
+
+def test_compile_rejects_unknown_state():
+    with pytest.raises(GraphValidationError, match="Unknown chatflow state 'NOT_A_STATE'"):
+        compile_chatflow_graph(
+            _spec(START, CLASSIFY, BOOK_CALL, GOODBYE, AWAITING, {"id": "NOT_A_STATE", "next": "AWAITING_NEW_MESSAGE"}),
+            WORKFLOWS_BY_STATE,
+        )
+
+
+def test_compile_rejects_node_without_workflow():
+    workflows = {state: workflow for state, workflow in WORKFLOWS_BY_STATE.items() if state != S.INTENT_GOODBYE}
+    with pytest.raises(GraphValidationError, match="No workflow registered for node 'INTENT_GOODBYE'"):
+        compile_chatflow_graph(_spec(START, CLASSIFY, BOOK_CALL, GOODBYE, AWAITING), workflows)
+
+
+def test_compile_rejects_workflow_without_node():
+    with pytest.raises(GraphValidationError, match="INTENT_GOODBYE"):
+        compile_chatflow_graph(_spec(START, CLASSIFY, BOOK_CALL, AWAITING), WORKFLOWS_BY_STATE)
+
+
+def test_compile_rejects_dangling_target():
+    workflows = {state: workflow for state, workflow in WORKFLOWS_BY_STATE.items() if state != S.AWAITING_NEW_MESSAGE}
+    with pytest.raises(GraphValidationError, match="transitions to states without a node"):
+        compile_chatflow_graph(_spec(START, CLASSIFY, BOOK_CALL, GOODBYE), workflows)
+
+
+def test_analyze_budgets():
+    graph = compile_chatflow_graph(_spec(START, CLASSIFY, BOOK_CALL, GOODBYE, AWAITING), WORKFLOWS_BY_STATE)
+    budgets = graph.analyze()
+    assert set(budgets) == {S.IDLE, S.CLASSIFYING_INTENT, S.AWAITING_NEW_MESSAGE}
+
+    # One call to classify, two to send the link, then the turn waits for the user
+    budget = budgets[S.IDLE]
+    assert budget.max_llm_calls == 3
+    assert budget.max_depth == 3
+    assert budget.worst_path == (S.IDLE, S.CLASSIFYING_INTENT, S.BOOK_CALL_OFFER_ACCEPTED)
+    assert budgets[S.CLASSIFYING_INTENT].max_depth == 2
+    assert budgets[S.AWAITING_NEW_MESSAGE].max_llm_calls == 3
+
+
+def test_logic_yaml_compiles():
+    graph = get_chatflow_graph()
+    assert set(graph.nodes) == set(WORKFLOWS)
+    for budget in graph.analyze().values():
+        assert budget.max_depth <= MAX_WORKFLOW_HOPS
+
+
+def test_undeclared_transition_is_an_error(monkeypatch):
+    workflows = {**WORKFLOWS_BY_STATE, S.CLASSIFYING_INTENT: _workflow(S.FINAL)}
+    graph = compile_chatflow_graph(_spec(START, CLASSIFY, BOOK_CALL, GOODBYE, AWAITING), workflows)
+    monkeypatch.setattr(handler, "get_chatflow_graph", lambda: graph)
+
+    with pytest.raises(UndeclaredTransitionError, match="CLASSIFYING_INTENT -> FINAL"):
+        asyncio.run(handler.handle_chatflow(
+            session_id="test",
+            history_messages=[InteractionMessage(role=InteractionType.USER, message="hi")],
+            current_state=S.IDLE,
+            interaction_data={},
+            model=None,
+            sheets_service=None,
+        ))
@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+
+from src.shared.utils.resilience import AdaptiveLimiter, OverloadedError, SingleFlight
+
+
+def _limiter(limit: int = 1, tokens_per_minute: int = 0, queue_timeout: float = 1.0) -> AdaptiveLimiter:
+    limiter = AdaptiveLimiter("test", limit, 1, 8, tokens_per_minute, queue_timeout)
+    limiter.latency = 0.001
+    return limiter
+
+
+def test_timeout_racing_a_grant_frees_the_slot():
+    async def main():
+        limiter = _limiter(queue_timeout=0.05)
+        await limiter.acquire()
+        loop = asyncio.get_running_loop()
+        # The release and the timeout become due in the same loop iteration
+        loop.call_at(loop.time() + 0.05, limiter.release)
+        loop.call_later(0.01, time.sleep, 0.1)
+        try:
+            await limiter.acquire()
+            limiter.release()
+        except OverloadedError:
+            pass
+        return limiter.in_flight
+
+    assert asyncio.run(main()) == 0
+
+
+def test_cancel_racing_a_grant_frees_the_slot():
+    async def main():
+        limiter = _limiter()
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()  # Grants the slot to the waiter before it resumes
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter.in_flight
+
+    assert asyncio.run(main()) == 0
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def main():
+        limiter = _limiter()
+        await limiter.acquire()
+        served = []
+
+        async def call(name: str, priority: int):
+            await limiter.acquire(priority=priority)
+            served.append(name)
+            limiter.release()
+
+        tasks = [
+            asyncio.create_task(call("background", 5)),
+            asyncio.create_task(call("first", 0)),
+            asyncio.create_task(call("second", 0)),
+        ]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return served, limiter.in_flight
+
+    assert asyncio.run(main()) == (["first", "second", "background"], 0)
+
+
+def test_overloaded_halves_the_limit_once_per_latency():
+    async def main():
+        limiter = _limiter(limit=8)
+        limiter.latency = 60
+        for _ in range(3):
+            await limiter.acquire()
+        limiter.release(overloaded=True)
+        limiter.release(overloaded=True)
+        assert limiter.limit == 4
+
+        limiter.release(seconds=0.1)
+        assert limiter.limit == pytest.approx(4.25)
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_waiter_is_woken_up_when_the_token_budget_is_refilled():
+    async def main():
+        limiter = _limiter(limit=4, tokens_per_minute=600)
+        await limiter.acquire(tokens=600)
+        started = time.monotonic()
+        # No slot is released, only the budget of 10 tokens per second lets it through
+        await asyncio.wait_for(limiter.acquire(tokens=5), 2)
+        return time.monotonic() - started
+
+    assert 0.3 < asyncio.run(main()) < 1.5
+
+
+def test_call_over_budget_is_rejected_immediately():
+    async def main():
+        limiter = _limiter(limit=4, tokens_per_minute=600, queue_timeout=0.1)
+        await limiter.acquire(tokens=600)
+        with pytest.raises(OverloadedError):
+            await limiter.acquire(tokens=600)
+
+    asyncio.run(main())
+
+
+def test_single_flight_shares_concurrent_calls():
+    async def main():
+        flight = SingleFlight(ttl=60, max_keys=10)
+        calls = 0
+
+        async def func():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(flight.do("key", func), flight.do("key", func))
+        later = await flight.do("key", func)
+        return results, later, calls
+
+    results, later, calls = asyncio.run(main())
+    assert sorted(results, key=lambda result: result[1]) == [("answer", False), ("answer", True)]
+    assert later == ("answer", True)
+    assert calls == 1
+
+
+def test_single_flight_does_not_keep_failures():
+    async def main():
+        flight = SingleFlight(ttl=60, max_keys=10)
+        calls = 0
+
+        async def func():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            if calls == 1:
+                raise RuntimeError("failed")
+            return "answer"
+
+        results = await asyncio.gather(flight.do("key", func), flight.do("key", func), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        return await flight.do("key", func), calls
+
+    assert asyncio.run(main()) == (("answer", False), 2)